@@ -1,10 +1,11 @@
 # 核心应用目录
 # Flask应用初始化（注册蓝图、配置、中间件）
 import os
-from flask import Flask, jsonify, request, g
+from flask import Flask, Response, jsonify, request, g
 from .models import db, migrate
 from .config import dev, proc, test
-from .middleware import BusinessException, AuthMiddleware
+from .middleware import BusinessException, AuthMiddleware, request_metrics, sql_profiler
+from .utils.redis_util import RedisClient, is_token_revoked
 from flask_cors import CORS
 
 
@@ -34,6 +35,9 @@ def create_app():
     # 初始化数据库（延迟绑定）
     db.init_app(app)
     migrate.init_app(app, db)
+    
+    # 初始化Redis（连接失败时自动降级为内存缓存）
+    RedisClient().init_app(app)
 
     # 注册全局异常处理器
     register_error_handlers(app)
@@ -41,15 +45,31 @@ def create_app():
     # 注册所有蓝图
     register_blueprints(app)
     
+    # 注册命令行任务（flask usage aggregate / flask bill overdue）
+    register_commands(app)
+    
+    # 注册请求指标统计（需先于其他请求钩子，token失效等提前返回的请求也计入）
+    request_metrics.init_app(app)
+
+    # 注册SQL分析器（SQL_PROFILER_ENABLED开启时生效，用于开发和灰度环境）
+    sql_profiler.init_app(app)
+
     # 将中间件注入的用户ID同步到 g 上下文
     @app.before_request
     def inject_user_from_env():
+        payload = request.environ.get("jwt_payload")
+        if payload is not None:
+            # 已登出或修改密码后签发前的token拒绝访问
+            if is_token_revoked(request.environ["jwt_token_hash"], payload):
+                return jsonify({
+                    "success": False,
+                    "message": "token已失效，请重新登录",
+                    "code": 401
+                }), 401
+            g.token_claims = payload
         uid = request.environ.get("user_id")
         if uid is not None:
-            try:
-                g.user_id = int(uid)
-            except Exception:
-                g.user_id = uid
+            g.user_id = uid
 
     # 注册健康检查路由
     @app.route("/health", methods=["GET"])
@@ -60,6 +80,11 @@ def create_app():
             "env": env
         }), 200
 
+    # 注册指标采集路由（Prometheus文本格式）
+    @app.route("/metrics", methods=["GET"])
+    def metrics():
+        return Response(request_metrics.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
     return app
 
 
@@ -71,6 +96,14 @@ def register_blueprints(app):
     app.register_blueprint(api_bp)
 
 
+def register_commands(app):
+    """注册命令行任务"""
+    from .cli import usage_cli, bill_cli
+    
+    app.cli.add_command(usage_cli)
+    app.cli.add_command(bill_cli)
+
+
 def register_error_handlers(app):
     """注册全局异常处理器"""
     
@@ -124,6 +124,8 @@ def query_bills():
         end_month = request.args.get("end_month")
         page = request.args.get("page", 1, type=int)
         per_page = request.args.get("per_page", 20, type=int)
+        cursor = request.args.get("cursor")
+        with_total = request.args.get("with_total", "false").lower() == "true"
         
         # 调用服务�?
         result = BillServices.query_bills(
@@ -135,7 +137,9 @@ def query_bills():
             page=page,
             per_page=per_page,
             current_user_id=current_user_id,
-            user_role=user_role
+            user_role=user_role,
+            cursor=cursor,
+            with_total=with_total
         )
         
         return jsonify({
@@ -158,7 +158,9 @@ def query_notifications():
             status=data.get("status"),
             is_unread_only=data.get("is_unread_only"),
             page=data.get("page"),
-            per_page=data.get("per_page")
+            per_page=data.get("per_page"),
+            cursor=data.get("cursor"),
+            with_total=data.get("with_total")
         )
         
         return jsonify({
@@ -1,6 +1,7 @@
 # 查询分析接口（用电统计、趋势）
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, Response, stream_with_context, send_file
 from app.services.analyze_service import AnalyzeServices
+from app.services.export_job import ExportJobs
 from app.middleware import (
     BusinessException, check_permission,ValidateExportData,
     ValidateAnalyzeUser, ValidateAnalyzeRegion, ValidateRanking
@@ -234,11 +235,31 @@ def export_data():
         start_date: 开始日期（可选）
         end_date: 结束日期（可选）
         format: 导出格式（csv/excel，默认csv�?
+        stream: 是否流式下载文件（默认false，为true时直接返回文件而非JSON）
     """
     try:
         current_user_id = g.user_id
         validated_data = request.validate_data
         
+        if validated_data.get("stream"):
+            # 流式下载：边查询边输出，首个数据块立即返回
+            filename, mimetype, chunks = AnalyzeServices.export_data_stream(
+                user_id=current_user_id,
+                export_type=validated_data.get("export_type", "usage"),
+                region_id=validated_data.get("region_id"),
+                start_date=validated_data.get("start_date"),
+                end_date=validated_data.get("end_date"),
+                format_type=validated_data.get("format", "csv")
+            )
+            return Response(
+                stream_with_context(chunks),
+                mimetype=mimetype,
+                headers={
+                    "Content-Disposition": f"attachment; filename={filename}",
+                    "X-Accel-Buffering": "no"
+                }
+            )
+        
         # 调用服务层函数，导出数据
         result = AnalyzeServices.export_data(
             user_id=current_user_id,
@@ -267,3 +288,110 @@ def export_data():
             "message": f"导出失败：{str(e)}",
             "code": 500
         }), 500
+
+
+@query_bp.route("/export/jobs", methods=["POST"])
+@check_permission(require_permit="query_iot")
+@validate_request(ValidateExportData)
+def create_export_job():
+    """
+    提交异步导出任务接口（需要登录）
+    ---
+    请求体:
+        export_type: 导出类型（usage/bill，默认usage）
+        region_id: 片区ID（可选，不指定则使用管理员的第一个管辖片区）
+        start_date: 开始日期（可选）
+        end_date: 结束日期（可选）
+        format: 导出格式（csv/excel，默认csv）
+    """
+    try:
+        current_user_id = g.user_id
+        validated_data = request.validate_data
+        
+        job = ExportJobs.submit(
+            user_id=current_user_id,
+            export_type=validated_data.get("export_type", "usage"),
+            region_id=validated_data.get("region_id"),
+            start_date=validated_data.get("start_date"),
+            end_date=validated_data.get("end_date"),
+            format_type=validated_data.get("format", "csv")
+        )
+        
+        return jsonify({
+            "success": True,
+            "message": "导出任务已存在" if job["reused"] else "导出任务已提交",
+            "data": job
+        }), 202
+        
+    except BusinessException as e:
+        return jsonify({
+            "success": False,
+            "message": e.msg,
+            "code": e.code
+        }), e.code
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"提交导出任务失败：{str(e)}",
+            "code": 500
+        }), 500
+
+@query_bp.route("/export/jobs/<job_id>", methods=["GET"])
+@check_permission(require_permit="query_iot")
+def get_export_job(job_id):
+    """
+    查询导出任务进度接口（需要登录）
+    """
+    try:
+        job = ExportJobs.get_job(g.user_id, job_id)
+        
+        return jsonify({
+            "success": True,
+            "message": "查询成功",
+            "data": job
+        }), 200
+        
+    except BusinessException as e:
+        return jsonify({
+            "success": False,
+            "message": e.msg,
+            "code": e.code
+        }), e.code
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"查询导出任务失败：{str(e)}",
+            "code": 500
+        }), 500
+
+@query_bp.route("/export/jobs/<job_id>/download", methods=["GET"])
+@check_permission(require_permit="query_iot")
+def download_export_job(job_id):
+    """
+    下载导出文件接口（需要登录，支持Range断点续传）
+    """
+    try:
+        path, filename, mimetype = ExportJobs.get_artifact(g.user_id, job_id)
+        
+        # conditional=True时按请求头Range返回206分段内容，并支持If-Range/ETag校验
+        return send_file(
+            path,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=filename,
+            conditional=True,
+            max_age=0
+        )
+        
+    except BusinessException as e:
+        return jsonify({
+            "success": False,
+            "message": e.msg,
+            "code": e.code
+        }), e.code
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"下载导出文件失败：{str(e)}",
+            "code": 500
+        }), 500
@@ -195,6 +195,37 @@ def delete_price_policy(policy_id):
         }), 500
 
 
+@system_bp.route("/cache-stats", methods=["GET"])
+@check_permission(require_super_admin=True)
+def get_cache_stats():
+    """
+    获取缓存命中统计接口（仅超级管理员）
+    ---
+    返回当前进程内电价政策缓存的命中/未命中次数、命中率和条目数
+    """
+    try:
+        result = SystemServices.get_cache_stats()
+        
+        return jsonify({
+            "success": True,
+            "message": "查询成功",
+            "data": result
+        }), 200
+        
+    except BusinessException as e:
+        return jsonify({
+            "success": False,
+            "message": e.msg,
+            "code": e.code
+        }), e.code
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"查询失败：{str(e)}",
+            "code": 500
+        }), 500
+
+
 @system_bp.route("/region/create", methods=["POST"])
 @check_permission(require_super_admin=True)
 @validate_request(ValidateCreateRegion)
@@ -427,10 +458,12 @@ def get_system_logs():
             log_type=validated_data.get("log_type"),
             log_level=validated_data.get("log_level"),
             module=validated_data.get("module"),
-            start_time=start_time,
-            end_time=end_time,
+            start_date=start_time,
+            end_date=end_time,
             page=validated_data.get("page"),
-            per_page=validated_data.get("per_page")
+            per_page=validated_data.get("per_page"),
+            cursor=validated_data.get("cursor"),
+            with_total=validated_data.get("with_total")
         )
         
         return jsonify({
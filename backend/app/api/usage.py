@@ -3,7 +3,7 @@ from flask import Blueprint, request, jsonify, g
 from app.services.usage_service import UsageService
 from app.middleware import (
     BusinessException, check_permission,
-    ValidateIoTData, ValidateQueryUsageData, ValidateAggregateUsage
+    ValidateIoTData, ValidateIoTBatch, ValidateQueryUsageData, ValidateAggregateUsage
 )
 from app.utils.common import validate_request
 from datetime import datetime
@@ -62,6 +62,50 @@ def receive_iot_data():
         }), 500
 
 
+@usage_bp.route("/iot-upload/batch", methods=["POST"])
+@validate_request(ValidateIoTBatch)
+def receive_iot_batch():
+    """
+    IoT集中器批量上传用电数据接口
+    ---
+    请求体:
+    {
+        "meters": [
+            {
+                "meter_id": 1,
+                "readings": [
+                    {"electricity": 1234.5, "collect_time": "2025-12-18 10:00:00", "voltage": 220.5, "current": 5.2},
+                    {"electricity": 1236.1, "collect_time": "2025-12-18 11:00:00"}
+                ]
+            }
+        ]
+    }
+    """
+    try:
+        data = request.validate_data
+        
+        result = UsageService.receive_iot_batch(meter_groups=data.get("meters"))
+        
+        return jsonify({
+            "success": True,
+            "message": "批量数据上传完成",
+            "data": result
+        }), 201
+        
+    except BusinessException as e:
+        return jsonify({
+            "success": False,
+            "message": e.msg,
+            "code": e.code
+        }), e.code
+    except Exception as e:
+        return jsonify({
+            "success": False,
+            "message": f"批量数据上传失败：{str(e)}",
+            "code": 500
+        }), 500
+
+
 @usage_bp.route("/aggregate", methods=["POST"])
 @check_permission(require_permit="edit_iot")
 @validate_request(ValidateAggregateUsage)
@@ -122,6 +166,8 @@ def query_usage_data():
         end_date: 结束日期（可选）
         page: 页码（默�?�?
         per_page: 每页数量（默�?0�?
+        cursor: 分页游标（可选，不指定usage_type时可用，首页传空字符串，后续传上一页的next_cursor）
+        with_total: 游标分页时是否统计总数（默认false）
     """
     try:
         # 构建查询参数
@@ -135,7 +181,9 @@ def query_usage_data():
             "start_date": request.args.get("start_date"),
             "end_date": request.args.get("end_date"),
             "page": int(request.args.get("page", 1)),
-            "per_page": int(request.args.get("per_page", 20))
+            "per_page": int(request.args.get("per_page", 20)),
+            "cursor": request.args.get("cursor"),
+            "with_total": request.args.get("with_total", "false").lower() == "true"
         }
         
         # 使用validator验证
@@ -153,9 +201,11 @@ def query_usage_data():
             meter_id=validated_data.get("meter_id"),
             start_date=start_date,
             end_date=end_date,
-            format_type=validated_data.get("usage_type", "hour"),
+            format_type=(validated_data.get("usage_type") or "hour").lower(),
             page=validated_data.get("page"),
-            per_page=validated_data.get("per_page")
+            per_page=validated_data.get("per_page"),
+            cursor=validated_data.get("cursor"),
+            with_total=validated_data.get("with_total")
         )
         
         return jsonify({
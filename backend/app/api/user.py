@@ -1,11 +1,12 @@
 # 用户模块接口（注册、登录、电表绑定）
-from flask import Blueprint, request, jsonify, g
+from flask import Blueprint, request, jsonify, g, current_app
 from ..services import UserServices
-from ..middleware import (BusinessException,check_permission,generate_user_token,
+from ..middleware import (BusinessException,check_permission,generate_user_token,hash_token,
                         ValidateRegister,ValidateLogin,ValidateUpdateUser,
                         ValidateBindMeter,ValidateUnbindMeter,ValidateChangePassword,
                         ValidateGetUserList,ValidateSendResetCode,ValidateResetPassword)
-from ..utils import validate_request
+from ..utils import validate_request, verify_jwt
+from ..utils.redis_util import revoke_token
 
 # 创建用户蓝图
 user_bp = Blueprint("user", __name__)
@@ -355,12 +356,30 @@ def logout():
     ---
     Headers:
         Authorization: Bearer <token>
+    请求体（可选）：
+    {
+        "refresh_token": "登录时返回的refresh_token，一并撤销"
+    }
     """
     try:
         user_id = g.user_id
         
-        # 可以在这里添加登出逻辑，比如将token加入黑名�?
-        # 目前简化处理，只返回成功消�?
+        # 将当前token加入撤销列表，保留到token过期
+        payload = request.environ.get("jwt_payload") or {}
+        token_hash = request.environ.get("jwt_token_hash")
+        if token_hash:
+            revoke_token(token_hash, payload.get("exp", 0))
+        
+        # 同时撤销本次登录的refresh_token（只撤销属于当前用户的refresh_token）
+        refresh_token = (request.get_json(silent=True) or {}).get("refresh_token")
+        if refresh_token:
+            try:
+                refresh_payload = verify_jwt(refresh_token, current_app.config.get("SECRET_KEY", "default-secret-key"))
+            except BusinessException:
+                refresh_payload = None
+            if refresh_payload and refresh_payload.get("typ") == "refresh" \
+                    and refresh_payload.get("sub") == str(user_id):
+                revoke_token(hash_token(refresh_token), refresh_payload.get("exp", 0))
         
         return jsonify({
             "success": True,
@@ -456,8 +475,10 @@ def get_user_list():
         
         from ..models import User
         
-        # 构建查询
-        query = User.query
+        from sqlalchemy.orm import joinedload
+        
+        # 构建查询（片区、角色随用户一起加载，避免逐行懒加载）
+        query = User.query.options(joinedload(User.region), joinedload(User.role))
         
         # 如果是片区管理员，只能查看自己片区的用户
         if admin_role == "AREA_ADMIN":
@@ -0,0 +1,232 @@
+# 命令行任务（夜间批处理：用电汇总、账单）
+from flask.cli import AppGroup
+from datetime import datetime
+import click
+
+usage_cli = AppGroup("usage", help="用电数据批处理任务")
+bill_cli = AppGroup("bill", help="账单批处理任务")
+
+
+def _ranking_ranges():
+    from .models import UsageType, RankingRange
+    return {
+        UsageType.DAY: [RankingRange.day, RankingRange.week],
+        UsageType.MONTH: [RankingRange.month, RankingRange.year]
+    }
+
+
+def _echo_progress(done, total, chunk_index, error):
+    if error is None:
+        click.echo(f"[{done}/{total}] 分块{chunk_index}完成")
+    else:
+        click.echo(f"[{done}/{total}] 分块{chunk_index}失败：{error}", err=True)
+
+
+def _echo_result(result):
+    click.echo(
+        f"任务{result['job_name']}结束：电表{result['total_meters']}个，"
+        f"分块{result['completed_chunks']}/{result['total_chunks']}完成"
+        f"（本次跳过已完成分块{result['skipped_chunks']}个）"
+    )
+    for key, value in result["totals"].items():
+        click.echo(f"  {key}: {value}")
+    for failed in result["failed_chunks"]:
+        click.echo(
+            f"  失败分块{failed['chunk']}（电表{failed['meter_ids'][0]}-{failed['meter_ids'][1]}）：{failed['error']}",
+            err=True
+        )
+    if result["failed_chunks"]:
+        click.echo("存在失败分块，修复后重新执行同一命令即可从检查点继续", err=True)
+        raise SystemExit(1)
+
+
+def _parse_date(value):
+    if value is None:
+        return None
+    try:
+        return datetime.strptime(value, "%Y-%m-%d")
+    except ValueError:
+        raise click.BadParameter("日期格式应为YYYY-MM-DD")
+
+
+@usage_cli.command("aggregate")
+@click.option("--type", "usage_type", type=click.Choice(["DAY", "MONTH"], case_sensitive=False), default="DAY", show_default=True, help="汇总类型")
+@click.option("--date", "target_date", default=None, help="目标日期（YYYY-MM-DD），默认昨天/上月")
+@click.option("--workers", default=4, show_default=True, type=int, help="工作进程数")
+@click.option("--chunk-size", default=1000, show_default=True, type=int, help="每个分块的电表数量")
+@click.option("--per-meter", is_flag=True, help="逐表汇总（默认使用集合模式）")
+@click.option("--no-resume", is_flag=True, help="忽略检查点，重新执行全部分块")
+def aggregate_usage(usage_type, target_date, workers, chunk_size, per_meter, no_resume):
+    """汇总所有正常电表的用电数据"""
+    from .models import db, Meter, MeterStatus, UsageType
+    from .services.usage_engine import UsageEngine
+    from .utils.job_runner import ChunkedJobRunner
+
+    usage_type = UsageType[usage_type.upper()]
+    # 先确定汇总周期，保证同一周期的检查点在不同日期续跑时保持一致
+    start_time, _ = UsageEngine.period_range(usage_type, _parse_date(target_date))
+
+    meter_ids = [row.id for row in db.session.query(Meter.id).filter_by(status=MeterStatus.NORMAL).all()]
+    runner = ChunkedJobRunner(
+        "usage_aggregate",
+        params={"usage_type": usage_type, "target_date": start_time, "set_based": not per_meter},
+        workers=workers,
+        chunk_size=chunk_size,
+        progress=_echo_progress
+    )
+    click.echo(f"开始汇总{usage_type.name} {start_time.strftime('%Y-%m-%d')}：电表{len(meter_ids)}个")
+    _echo_result(runner.run(meter_ids, resume=not no_resume))
+
+    # 电表汇总全部完成后刷新片区汇总和排名（只有汇总最近一个周期时才刷新排名）
+    _refresh_regions(usage_type, start_time)
+    if target_date is None:
+        _refresh_rankings(_ranking_ranges()[usage_type])
+
+
+def _refresh_regions(usage_type, start_time):
+    from .services.region_rollup import RegionRollup
+
+    result = RegionRollup.refresh(usage_type, start_time)
+    click.echo(f"片区汇总已刷新：{result['usage_type']} {result['usage_time']}，片区{result['region_count']}个")
+
+
+def _refresh_rankings(time_ranges):
+    from .services.ranking_board import RankingBoard
+
+    for time_range in time_ranges:
+        result = RankingBoard.refresh(time_range)
+        click.echo(
+            f"排名已刷新：{result['time_range']} {result['period_start']}~{result['period_end']}，"
+            f"电表{result['meter_count']}个"
+        )
+
+
+@usage_cli.command("refresh-regions")
+@click.option("--type", "usage_type", type=click.Choice(["DAY", "MONTH"], case_sensitive=False), default="DAY", show_default=True, help="汇总类型")
+@click.option("--date", "target_date", default=None, help="目标日期（YYYY-MM-DD），默认昨天/上月")
+@click.option("--start", "start_date", default=None, help="回填开始日期（YYYY-MM-DD），与--date互斥")
+@click.option("--end", "end_date", default=None, help="回填结束日期（YYYY-MM-DD，不含），默认今天")
+def refresh_regions(usage_type, target_date, start_date, end_date):
+    """根据已有的电表汇总刷新片区汇总（不重新汇总电表），--start/--end 按周期逐个回填历史片区汇总"""
+    from .models import UsageType
+    from .services.usage_engine import UsageEngine
+
+    usage_type = UsageType[usage_type.upper()]
+    if start_date is None:
+        if end_date is not None:
+            raise click.BadParameter("--end 需要与 --start 一起使用")
+        start_time, _ = UsageEngine.period_range(usage_type, _parse_date(target_date))
+        _refresh_regions(usage_type, start_time)
+        return
+
+    if target_date is not None:
+        raise click.BadParameter("--date 与 --start/--end 不能同时使用")
+    end_time = _parse_date(end_date) or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    start_time, period_end = UsageEngine.period_range(usage_type, _parse_date(start_date))
+    if start_time >= end_time:
+        raise click.BadParameter("开始日期必须早于结束日期")
+
+    # 只回填已结束的周期
+    count = 0
+    while period_end <= end_time:
+        _refresh_regions(usage_type, start_time)
+        count += 1
+        start_time, period_end = UsageEngine.period_range(usage_type, period_end)
+    click.echo(f"片区汇总回填完成：共{count}个周期")
+
+
+@usage_cli.command("refresh-rankings")
+@click.option("--range", "time_ranges", multiple=True, type=click.Choice(["day", "week", "month", "year"]), help="时间范围（可多次指定），默认全部")
+def refresh_rankings(time_ranges):
+    """根据已有的电表汇总和账单刷新用电排名"""
+    from .models import RankingRange
+
+    _refresh_rankings([RankingRange[name] for name in (time_ranges or ["day", "week", "month", "year"])])
+
+
+@usage_cli.command("backfill-hourly")
+@click.option("--start", "start_date", required=True, help="开始日期（YYYY-MM-DD）")
+@click.option("--end", "end_date", default=None, help="结束日期（YYYY-MM-DD，不含），默认今天")
+@click.option("--workers", default=4, show_default=True, type=int, help="工作进程数")
+@click.option("--chunk-size", default=1000, show_default=True, type=int, help="每个分块的电表数量")
+@click.option("--no-resume", is_flag=True, help="忽略检查点，重新执行全部分块")
+def backfill_hourly(start_date, end_date, workers, chunk_size, no_resume):
+    """从原始读数回填小时用电汇总"""
+    from .models import db, Meter
+    from .utils.job_runner import ChunkedJobRunner
+
+    start_time = _parse_date(start_date)
+    end_time = _parse_date(end_date) or datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    if start_time >= end_time:
+        raise click.BadParameter("开始日期必须早于结束日期")
+
+    meter_ids = [row.id for row in db.session.query(Meter.id).all()]
+    runner = ChunkedJobRunner(
+        "usage_hourly_backfill",
+        params={"start_time": start_time, "end_time": end_time},
+        workers=workers,
+        chunk_size=chunk_size,
+        progress=_echo_progress
+    )
+    click.echo(f"开始回填小时汇总{start_time.strftime('%Y-%m-%d')}~{end_time.strftime('%Y-%m-%d')}：电表{len(meter_ids)}个")
+    _echo_result(runner.run(meter_ids, resume=not no_resume))
+
+
+@bill_cli.command("create")
+@click.option("--month", "bill_month", required=True, help="账单月份（YYYY-MM-DD，取所在月份）")
+@click.option("--region-id", type=int, default=None, help="片区ID（包含子片区），默认全部片区")
+@click.option("--workers", default=4, show_default=True, type=int, help="工作进程数")
+@click.option("--chunk-size", default=1000, show_default=True, type=int, help="每个分块的电表数量")
+@click.option("--no-resume", is_flag=True, help="忽略检查点，重新执行全部分块")
+def create_bills(bill_month, region_id, workers, chunk_size, no_resume):
+    """批量生成月度账单"""
+    from .models import db, Meter
+    from .services import AnalyzeServices
+    from .utils.job_runner import ChunkedJobRunner
+
+    month_start = _parse_date(bill_month).replace(day=1)
+    meter_query = db.session.query(Meter.id).filter(Meter.user_id.isnot(None))
+    if region_id is not None:
+        meter_query = meter_query.filter(Meter.region_id.in_(AnalyzeServices._get_all_sub_regions(region_id)))
+    meter_ids = [row.id for row in meter_query.all()]
+
+    runner = ChunkedJobRunner(
+        "bill_create",
+        params={"bill_month": month_start},
+        workers=workers,
+        chunk_size=chunk_size,
+        progress=_echo_progress
+    )
+    click.echo(f"开始生成{month_start.strftime('%Y-%m')}账单：电表{len(meter_ids)}个")
+    _echo_result(runner.run(meter_ids, resume=not no_resume))
+
+    # 费用排名取账单金额，账单生成后刷新按月的排名
+    from .models import RankingRange
+    _refresh_rankings([RankingRange.month, RankingRange.year])
+
+
+@bill_cli.command("overdue")
+@click.option("--workers", default=4, show_default=True, type=int, help="工作进程数")
+@click.option("--chunk-size", default=1000, show_default=True, type=int, help="每个分块的电表数量")
+@click.option("--per-bill", is_flag=True, help="逐单更新并逐条发送通知（默认使用集合模式）")
+@click.option("--no-resume", is_flag=True, help="忽略检查点，重新执行全部分块")
+def update_overdue(workers, chunk_size, per_bill, no_resume):
+    """更新逾期账单状态并发送逾期通知"""
+    from .models import db, Bill, BillStatus
+    from .utils.job_runner import ChunkedJobRunner
+
+    meter_ids = [
+        row.meter_id for row in db.session.query(Bill.meter_id).filter(
+            Bill.status == BillStatus.unpaid,
+            Bill.due_date < datetime.now()
+        ).distinct().all()
+    ]
+    runner = ChunkedJobRunner(
+        "bill_overdue",
+        params={"set_based": not per_bill},
+        workers=workers,
+        chunk_size=chunk_size,
+        progress=_echo_progress
+    )
+    click.echo(f"开始更新逾期账单：涉及电表{len(meter_ids)}个")
+    _echo_result(runner.run(meter_ids, resume=not no_resume))
@@ -1,14 +1,17 @@
 # 中间件层（全局拦截、安全、日志）
 from .exception import BusinessException
-from .auth import generate_user_token, check_permission, AuthMiddleware
+from .auth import generate_user_token, hash_token, check_permission, AuthMiddleware
+from .principal import Principal, PrincipalCache
 from .logger import create_log,LogLevel,LogType,SystemLog
+from .metrics import request_metrics
+from .sql_profiler import sql_profiler
 from .validator import (
     ValidateRegister, ValidateLogin, ValidateUpdateUser, ValidateBindMeter, ValidateUnbindMeter,
     ValidateChangePassword, ValidateGetUserList, ValidateSendResetCode, ValidateResetPassword,
     ValidateCreateNotification, ValidateQueryNotification, ValidateSendNotification, ValidateUpdateNotificationStatus,
     ValidateMeterInstall, ValidateMeterUpdateStatus, ValidateAddMeterRecord, ValidateMeterRepair,
     ValidateMeterReading, ValidateQueryMeters, ValidateQueryMeterRecords, ValidateQueryMeterRecordsParams,
-    ValidateIoTData, ValidateQueryUsageData,
+    ValidateIoTData, ValidateIoTBatch, ValidateQueryUsageData,
     ValidateCreateBill, ValidatePayBill, ValidateQueryBills,
     ValidateAggregateUsage,
     ValidateAnalyzeUser, ValidateAnalyzeRegion, ValidateRanking,
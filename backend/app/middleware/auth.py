@@ -1,26 +1,39 @@
 # JWT认证、权限拦截
 from ..utils import generate_jwt, verify_jwt
+import threading
+import hashlib
 import time
 from flask import current_app, request, jsonify, g
 from functools import wraps
 from .exception import BusinessException
-from ..models import User,RoleEnum,Permission
+from .principal import PrincipalCache
+from ..models import RoleEnum,UserStatus
 
 
-def generate_user_token(user_id, expire_hours=2):
+def generate_user_token(user_id, expire_hours=2, claims=None, token_type="access"):
     """
     生成用户token
     :param user_id: 用户ID
     :param expire_hours: 过期时间（小时）
+    :param claims: 附加的身份声明（可选，见PrincipalCache.claims）
+    :param token_type: token类型（access：访问接口；refresh：只能用于刷新接口）
     :return: JWT token
     """
     payload = {
         "sub": str(user_id),
+        "typ": token_type,
         "exp": int(time.time()) + expire_hours * 3600,
         "iat": int(time.time())
     }
+    if claims:
+        payload.update(claims)
     return generate_jwt(payload, current_app.config.get("SECRET_KEY", "default-secret-key"))
 
+
+def hash_token(token):
+    """token的SHA-256摘要（用于验证缓存和撤销记录，不保存token原文）"""
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
 def check_permission(target_param="target_user_id", require_admin=False, require_super_admin=False, require_permit=None):
     """
     细粒度权限校验装饰器:
@@ -50,8 +63,8 @@ def check_permission(target_param="target_user_id", require_admin=False, require
             
             current_user_id = g.user_id
             
-            # 2. 获取当前用户信息
-            current_user = User.query.get(current_user_id)
+            # 2. 获取当前用户身份（优先使用token中的身份声明，其次走身份缓存，均不访问数据库）
+            current_user = PrincipalCache.from_claims(g.get("token_claims")) or PrincipalCache.get(current_user_id)
             
             if not current_user:
                 return jsonify({
@@ -60,7 +73,16 @@ def check_permission(target_param="target_user_id", require_admin=False, require
                     "code": 404
                 }), 404
             
-            current_role = current_user.role.name if current_user.role else None
+            # 已销户用户的token立即失效
+            if current_user.status == UserStatus.CANCELED:
+                return jsonify({
+                    "success": False,
+                    "message": "用户已销户",
+                    "code": 403
+                }), 403
+            
+            g.principal = current_user
+            current_role = current_user.role
             
             # 3. 如果强制要求超级管理员
             if require_super_admin:
@@ -112,13 +134,7 @@ def check_permission(target_param="target_user_id", require_admin=False, require
             if current_role == RoleEnum.AREA_ADMIN:
                 # 检查是否有所需权限
                 if require_permit:
-                    has_permission = False
-                    for permission in current_user.role.permissions:
-                        if require_permit in permission.per_code:
-                            has_permission = True
-                            break
-                    
-                    if not has_permission:
+                    if not current_user.has_permission(require_permit):
                         return jsonify({
                             "success": False,
                             "message": "当前片区管理员没有所需权限",
@@ -126,7 +142,7 @@ def check_permission(target_param="target_user_id", require_admin=False, require
                         }), 403
                 
                 # 检查是否操作自己或本片区用户
-                target_user = User.query.get(target_user_id)
+                target_user = PrincipalCache.get(target_user_id)
                 if not target_user:
                     return jsonify({
                         "success": False,
@@ -156,13 +172,7 @@ def check_permission(target_param="target_user_id", require_admin=False, require
                 
                 # 检查是否有所需权限
                 if require_permit:
-                    has_permission = False
-                    for permission in current_user.role.permissions:
-                        if require_permit in permission.per_code:
-                            has_permission = True
-                            break
-                    
-                    if not has_permission:
+                    if not current_user.has_permission(require_permit):
                         return jsonify({
                             "success": False,
                             "message": "当前用户没有所需权限",
@@ -189,17 +199,25 @@ class AuthMiddleware:
     WSGI认证中间件（全局拦截）
     可选使用，如果使用装饰器就不需要这个
     """
+    # 验证缓存的最大条目数
+    VERIFIED_CACHE_SIZE = 10000
+
     def __init__(self, app, secret_key):
         self.app = app
         self.secret_key = secret_key
+        # 最近验证通过的token：{token摘要: 载荷}，命中时跳过签名校验，过期时间仍逐次检查
+        self._verified = {}
+        self._lock = threading.Lock()
         # 无需认证的路径
         self.public_paths = [
             "/api/v1/user/login",
             "/api/v1/user/register",
             "/api/v1/user/send-reset-code",
             "/api/v1/user/reset-password",
+            "/api/v1/user/refresh-token",  # 刷新接口自行校验refresh_token
             "/api/v1/usage/iot-upload",  # IoT 设备上报无需登录
             "/health",
+            "/metrics",  # 指标采集（建议在反向代理层限制访问来源）
             "/static"
         ]
     
@@ -227,16 +245,46 @@ class AuthMiddleware:
             return [b'{"success": false, "message": "Unauthorized", "code": 401}']
         
         token = auth_header.split(" ")[1]
+        token_hash = hash_token(token)
         
         # 验证token
         try:
-            payload = verify_jwt(token, self.secret_key)
-            # 将用户ID添加到environ中
-            environ["user_id"] = payload.get("sub")
+            payload = self._verify(token, token_hash)
+            # 将用户ID添加到environ中（在此转换为int，请求内不再重复转换）
+            environ["user_id"] = int(payload.get("sub"))
+            # 撤销检查需要应用上下文，交给before_request完成
+            environ["jwt_payload"] = payload
+            environ["jwt_token_hash"] = token_hash
         except Exception:
             start_response("401 Unauthorized", [
                 ("Content-Type", "application/json")
             ])
             return [b'{"success": false, "message": "Invalid token", "code": 401}']
         
-        return self.app(environ, start_response)
\ No newline at end of file
+        return self.app(environ, start_response)
+    
+    def _verify(self, token, token_hash):
+        """校验token签名，最近验证过的token直接返回缓存的载荷"""
+        payload = self._verified.get(token_hash)
+        if payload is not None:
+            if payload.get("exp", 0) > time.time():
+                return payload
+            with self._lock:
+                self._verified.pop(token_hash, None)
+            raise BusinessException("token已过期", 401)
+        
+        payload = verify_jwt(token, self.secret_key)
+        # 只接受访问token：refresh_token（以及未标注类型的旧token）不能用于访问接口
+        if payload.get("typ") != "access":
+            raise BusinessException("token类型错误", 401)
+        with self._lock:
+            if len(self._verified) >= self.VERIFIED_CACHE_SIZE:
+                # 先清理已过期的条目，仍然过多时整体清空
+                now = time.time()
+                self._verified = {
+                    key: value for key, value in self._verified.items() if value.get("exp", 0) > now
+                }
+                if len(self._verified) >= self.VERIFIED_CACHE_SIZE:
+                    self._verified = {}
+            self._verified[token_hash] = payload
+        return payload
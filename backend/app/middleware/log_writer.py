@@ -0,0 +1,135 @@
+# 系统日志异步批量写入（内存队列 + 后台线程，使用独立连接批量插入）
+from sqlalchemy import insert
+import threading
+import atexit
+import queue
+import time
+import os
+
+_STOP = object()
+
+
+class LogWriter:
+    """
+    系统日志写入器：
+    1. create_log只把日志放入内存队列，不访问数据库，也不提交调用方会话中的其他改动
+    2. 后台线程攒够LOG_FLUSH_SIZE条或等待LOG_FLUSH_INTERVAL秒后，用独立连接批量插入
+    3. 进程退出时写完队列中剩余的日志；队列满（LOG_QUEUE_SIZE）时丢弃新日志并计数
+    4. LOG_ASYNC为False时改为同步写入（同样使用独立连接）
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pid = None
+        self._queue = None
+        self._thread = None
+        self._app = None
+        self.dropped = 0
+
+    def write(self, record):
+        """
+        写入一条日志（需要应用上下文）
+        :param record: SystemLog列值字典
+        """
+        from flask import current_app
+
+        if not current_app.config.get("LOG_ASYNC", True):
+            self._insert(current_app._get_current_object(), [record])
+            return
+
+        self._ensure_started(current_app._get_current_object())
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def flush(self, timeout=5.0):
+        """
+        等待队列中已有的日志写入完成（批处理子进程退出前调用）
+        :param timeout: 最长等待时间（秒）
+        """
+        if self._queue is None or self._pid != os.getpid():
+            return
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def close(self):
+        """停止后台线程，写完剩余日志"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._queue.put(_STOP)
+        self._thread.join(timeout=10)
+        self._thread = None
+
+    def _ensure_started(self, app):
+        """首次写入时启动后台线程；fork出的子进程中重新创建队列和线程"""
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._app = app
+            self._queue = queue.Queue(maxsize=app.config.get("LOG_QUEUE_SIZE", 10000))
+            self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        flush_size = self._app.config.get("LOG_FLUSH_SIZE", 200)
+        interval = self._app.config.get("LOG_FLUSH_INTERVAL", 1.0)
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                break
+
+            # 攒批：达到条数或超过等待时间即写入
+            batch = [item]
+            deadline = time.monotonic() + interval
+            while len(batch) < flush_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                    stopping = True
+                    break
+                batch.append(item)
+
+            # 停止时把队列中剩余的日志一起写入
+            while stopping:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    self._queue.task_done()
+                else:
+                    batch.append(item)
+
+            self._insert(self._app, batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    @staticmethod
+    def _insert(app, records):
+        """用独立连接批量插入，不影响任何请求的会话"""
+        from app import db
+        from .logger import SystemLog
+
+        try:
+            with app.app_context():
+                with db.engine.begin() as connection:
+                    connection.execute(insert(SystemLog), records)
+        except Exception as e:
+            print(f"日志记录失败: {str(e)}")
+
+
+log_writer = LogWriter()
+atexit.register(log_writer.close)
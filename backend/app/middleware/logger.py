@@ -1,6 +1,7 @@
 # 日志配置（访问日志、错误日志）
 from datetime import datetime
 from app import db
+from .log_writer import log_writer
 import enum
 
 class LogType(enum.Enum):
@@ -59,7 +60,7 @@ def create_log(operator_id, operator_name, log_type, action, module=None,
                request_ip=None, request_params=None, response_status=None, 
                error_message=None, execution_time=None):
     """
-    创建系统日志
+    创建系统日志（异步批量写入，见LogWriter）
     :param operator_id: 操作人ID
     :param operator_name: 操作人姓名
     :param log_type: 日志类型
@@ -73,29 +74,21 @@ def create_log(operator_id, operator_name, log_type, action, module=None,
     :param response_status: 响应状态码
     :param error_message: 错误信息
     :param execution_time: 执行时间
-    :return: 日志对象
     """
-    log = SystemLog(
-        operator_id=operator_id,
-        operator_name=operator_name,
-        log_type=log_type,
-        log_level=log_level,
-        module=module,
-        action=action,
-        request_method=request_method,
-        request_url=request_url,
-        request_ip=request_ip,
-        request_params=request_params,
-        response_status=response_status,
-        error_message=error_message,
-        execution_time=execution_time
-    )
-    
-    try:
-        db.session.add(log)
-        db.session.commit()
-        return log
-    except Exception as e:
-        db.session.rollback()
-        print(f"日志记录失败: {str(e)}")
-        return None
+    # 只放入写入队列，由后台线程批量写入（不提交调用方会话）
+    log_writer.write({
+        "operator_id": operator_id,
+        "operator_name": operator_name,
+        "log_type": log_type,
+        "log_level": log_level,
+        "module": module,
+        "action": action,
+        "request_method": request_method,
+        "request_url": request_url,
+        "request_ip": request_ip,
+        "request_params": request_params,
+        "response_status": response_status,
+        "error_message": error_message,
+        "execution_time": execution_time,
+        "create_time": datetime.now()
+    })
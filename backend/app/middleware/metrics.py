@@ -0,0 +1,190 @@
+# 请求指标统计（接口耗时直方图、每次请求的SQL语句数和数据库耗时、慢请求记录）
+from .logger import create_log, LogType, LogLevel
+from flask import current_app, request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import threading
+import time
+
+# 接口耗时直方图分桶（秒）
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 每次请求SQL语句数直方图分桶
+STATEMENT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+
+class _Histogram:
+    """累积分桶直方图（Prometheus格式）"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+        self.sum += value
+        self.count += 1
+
+
+class RequestMetrics:
+    """
+    请求指标：
+    1. 按(请求方法, 路由规则)统计请求耗时直方图、响应状态码计数
+    2. 通过SQLAlchemy的before/after_cursor_execute事件统计每次请求执行的SQL语句数和数据库耗时
+    3. 耗时超过SLOW_REQUEST_THRESHOLD秒（默认1秒）的请求记录到系统日志（含请求方法、URL、状态码、执行时间）
+    4. 指标保存在进程内，多进程部署时每个进程分别暴露，由采集端汇总
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}
+        self._statements = {}
+        self._db_seconds = {}
+        self._responses = {}
+        self._slow = {}
+        self._sql_listening = False
+
+    def init_app(self, app):
+        """注册请求钩子和SQL事件监听"""
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+        with self._lock:
+            if not self._sql_listening:
+                # 监听Engine类，覆盖应用中的所有引擎
+                event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+                event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+                self._sql_listening = True
+
+    @staticmethod
+    def _before_request():
+        g.metrics_start = time.perf_counter()
+        g.sql_statements = 0
+        g.sql_seconds = 0.0
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get("metrics_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        # 后台线程（日志写入、导出任务）没有请求上下文，不计入请求
+        if has_request_context() and "metrics_start" in g:
+            g.sql_statements += 1
+            g.sql_seconds += elapsed
+
+    def _after_request(self, response):
+        start = g.get("metrics_start")
+        if start is None:
+            return response
+        duration = time.perf_counter() - start
+
+        # 按路由规则而不是实际URL分组，避免路径参数导致指标无限增长
+        endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        key = (request.method, endpoint)
+        status = response.status_code
+
+        with self._lock:
+            histogram = self._durations.get(key)
+            if histogram is None:
+                histogram = self._durations[key] = _Histogram(DURATION_BUCKETS)
+            histogram.observe(duration)
+
+            histogram = self._statements.get(key)
+            if histogram is None:
+                histogram = self._statements[key] = _Histogram(STATEMENT_BUCKETS)
+            histogram.observe(g.sql_statements)
+
+            self._db_seconds[key] = self._db_seconds.get(key, 0.0) + g.sql_seconds
+            self._responses[key + (status,)] = self._responses.get(key + (status,), 0) + 1
+
+        threshold = current_app.config.get("SLOW_REQUEST_THRESHOLD", 1.0)
+        if duration >= threshold:
+            with self._lock:
+                self._slow[key] = self._slow.get(key, 0) + 1
+            current_app.logger.warning(
+                f"慢请求: {request.method} {request.path} {duration:.3f}s, "
+                f"SQL {g.sql_statements}条/{g.sql_seconds:.3f}s"
+            )
+            create_log(
+                operator_id=g.get("user_id"),
+                operator_name=None,
+                log_type=LogType.WARNING,
+                module="metrics",
+                action=f"慢请求 {endpoint}",
+                log_level=LogLevel.WARNING,
+                request_method=request.method,
+                request_url=request.full_path.rstrip("?")[:200],
+                request_ip=request.remote_addr,
+                response_status=status,
+                error_message=f"SQL语句{g.sql_statements}条，数据库耗时{g.sql_seconds:.3f}秒",
+                execution_time=round(duration, 4)
+            )
+        return response
+
+    def render(self):
+        """
+        生成Prometheus文本格式的指标
+        :return: str
+        """
+        with self._lock:
+            durations = {key: (list(h.counts), h.sum, h.count) for key, h in self._durations.items()}
+            statements = {key: (list(h.counts), h.sum, h.count) for key, h in self._statements.items()}
+            db_seconds = dict(self._db_seconds)
+            responses = dict(self._responses)
+            slow = dict(self._slow)
+
+        lines = []
+        self._render_histogram(
+            lines, "http_request_duration_seconds", "请求耗时（秒）", DURATION_BUCKETS, durations
+        )
+        self._render_histogram(
+            lines, "http_request_sql_statements", "每次请求执行的SQL语句数", STATEMENT_BUCKETS, statements
+        )
+
+        lines.append("# HELP http_request_db_seconds_total 请求中数据库执行耗时合计（秒）")
+        lines.append("# TYPE http_request_db_seconds_total counter")
+        for (method, endpoint), value in sorted(db_seconds.items()):
+            lines.append(f"http_request_db_seconds_total{{{_labels(method, endpoint)}}} {value:.6f}")
+
+        lines.append("# HELP http_requests_total 请求数（按状态码）")
+        lines.append("# TYPE http_requests_total counter")
+        for (method, endpoint, status), value in sorted(responses.items()):
+            lines.append(f"http_requests_total{{{_labels(method, endpoint)},status=\"{status}\"}} {value}")
+
+        lines.append("# HELP http_slow_requests_total 慢请求数")
+        lines.append("# TYPE http_slow_requests_total counter")
+        for (method, endpoint), value in sorted(slow.items()):
+            lines.append(f"http_slow_requests_total{{{_labels(method, endpoint)}}} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histogram(lines, name, description, buckets, histograms):
+        lines.append(f"# HELP {name} {description}")
+        lines.append(f"# TYPE {name} histogram")
+        for (method, endpoint), (counts, total, count) in sorted(histograms.items()):
+            labels = _labels(method, endpoint)
+            for bound, value in zip(buckets, counts):
+                lines.append(f"{name}_bucket{{{labels},le=\"{bound}\"}} {value}")
+            lines.append(f"{name}_bucket{{{labels},le=\"+Inf\"}} {count}")
+            lines.append(f"{name}_sum{{{labels}}} {total:.6f}")
+            lines.append(f"{name}_count{{{labels}}} {count}")
+
+
+def _labels(method, endpoint):
+    endpoint = endpoint.replace("\\", "\\\\").replace("\"", "\\\"")
+    return f"method=\"{method}\",endpoint=\"{endpoint}\""
+
+
+request_metrics = RequestMetrics()
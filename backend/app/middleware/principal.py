@@ -0,0 +1,162 @@
+# 登录用户身份缓存（角色、片区、权限编码集合，供权限装饰器直接判断）
+from ..models import User, Role, RoleEnum, UserStatus
+from ..utils.redis_util import get_cache_version, bump_cache_version
+from flask import current_app
+from sqlalchemy.orm import joinedload
+from collections import namedtuple
+import threading
+import time
+
+_CACHE_NAME = "principal"
+
+
+class Principal(namedtuple("Principal", ["user_id", "role", "region_id", "status", "permissions"])):
+    """
+    登录用户身份（不可变，不持有ORM对象，可跨请求复用）
+    role: RoleEnum，未分配角色时为None
+    permissions: 当前角色的权限编码frozenset
+    """
+
+    __slots__ = ()
+
+    def has_permission(self, require_permit):
+        """
+        判断是否拥有权限编码
+        :param require_permit: 所需的权限编码
+        :return: bool
+        """
+        if require_permit in self.permissions:
+            return True
+        # 兼容一条权限记录包含多个权限代码的情况（部分匹配）
+        return any(require_permit in code for code in self.permissions)
+
+
+class PrincipalCache:
+    """
+    用户身份缓存：
+    1. 以用户ID为键缓存Principal，权限校验只做集合判断，不访问数据库
+    2. token中带有签发时的身份声明，版本号未变化时直接由声明和角色权限表构造身份，不查询用户
+    3. 条目超过PRINCIPAL_CACHE_TTL秒后过期
+    4. 角色权限、用户角色、用户状态、片区变更后递增缓存版本号，各进程在下次访问时清空本地缓存
+    """
+
+    _entries = {}
+    _role_permissions = None
+    _version = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _check_version(version):
+        """版本号变化时清空本地缓存（调用方持有锁）"""
+        if PrincipalCache._version != version:
+            PrincipalCache._entries.clear()
+            PrincipalCache._role_permissions = None
+            PrincipalCache._version = version
+
+    @staticmethod
+    def claims(user):
+        """
+        生成写入token的身份声明（角色、片区、状态、签发时的缓存版本号）
+        :param user: User对象
+        :return: dict
+        """
+        return {
+            "role": user.role.name.name if user.role else None,
+            "region": user.region_id,
+            "st": user.status.name if user.status else None,
+            "pv": get_cache_version(_CACHE_NAME)
+        }
+
+    @staticmethod
+    def from_claims(claims):
+        """
+        由token中的身份声明直接构造身份（不查询用户）：
+        签发后角色权限、用户角色、状态、片区均未变更（版本号一致）时声明仍然有效，否则返回None
+        :param claims: token载荷
+        :return: Principal或None
+        """
+        if not claims or "pv" not in claims or not claims.get("role"):
+            return None
+        version = get_cache_version(_CACHE_NAME)
+        if claims["pv"] != version:
+            return None
+        try:
+            role = RoleEnum[claims["role"]]
+            status = UserStatus[claims["st"]] if claims.get("st") else None
+            user_id = int(claims["sub"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        with PrincipalCache._lock:
+            PrincipalCache._check_version(version)
+            role_permissions = PrincipalCache._role_permissions
+        if role_permissions is None:
+            role_permissions = {
+                item.name: frozenset(permission.per_code for permission in item.permissions)
+                for item in Role.query.all()
+            }
+            with PrincipalCache._lock:
+                if PrincipalCache._version == version:
+                    PrincipalCache._role_permissions = role_permissions
+
+        return Principal(
+            user_id=user_id,
+            role=role,
+            region_id=claims.get("region"),
+            status=status,
+            permissions=role_permissions.get(role, frozenset())
+        )
+
+    @staticmethod
+    def get(user_id):
+        """
+        获取用户身份
+        :param user_id: 用户ID
+        :return: Principal，用户不存在时返回None
+        """
+        version = get_cache_version(_CACHE_NAME)
+        now = time.monotonic()
+
+        with PrincipalCache._lock:
+            PrincipalCache._check_version(version)
+            entry = PrincipalCache._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                return entry[1]
+
+        principal = PrincipalCache._load(user_id)
+        if principal is None:
+            return None
+
+        ttl = current_app.config.get("PRINCIPAL_CACHE_TTL", 300)
+        max_entries = current_app.config.get("PRINCIPAL_CACHE_MAX_ENTRIES", 10000)
+        with PrincipalCache._lock:
+            # 加载期间版本已变化时不写入，避免缓存旧身份
+            if PrincipalCache._version == version:
+                if len(PrincipalCache._entries) >= max_entries:
+                    PrincipalCache._entries.clear()
+                PrincipalCache._entries[user_id] = (now + ttl, principal)
+        return principal
+
+    @staticmethod
+    def _load(user_id):
+        """一次查询加载用户、角色及角色权限"""
+        user = User.query.options(joinedload(User.role)).filter(User.id == user_id).first()
+        if user is None:
+            return None
+        role = user.role
+        return Principal(
+            user_id=user.id,
+            role=role.name if role else None,
+            region_id=user.region_id,
+            status=user.status,
+            permissions=frozenset(permission.per_code for permission in role.permissions) if role else frozenset()
+        )
+
+    @staticmethod
+    def invalidate():
+        """角色权限、用户角色、用户状态或片区变更后调用：递增版本号并清空本进程缓存"""
+        bump_cache_version(_CACHE_NAME)
+        with PrincipalCache._lock:
+            PrincipalCache._entries.clear()
+            PrincipalCache._role_permissions = None
+            PrincipalCache._version = None
@@ -0,0 +1,177 @@
+# SQL分析器（开发/灰度环境按需开启：按语句形态分组发现N+1查询，慢语句输出EXPLAIN）
+from .logger import create_log, LogType, LogLevel
+from flask import current_app, request, g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import traceback
+import random
+import time
+import re
+import os
+
+# 应用代码根目录（用于定位发起查询的业务函数）
+_APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_SELF_FILE = os.path.abspath(__file__)
+
+_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|%s|%\(\w+\)s)(?:\s*,\s*(?:\?|%s|%\(\w+\)s))*\s*\)")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_statement(statement):
+    """
+    归一化SQL语句形态（字面量、占位符统一为?，IN列表折叠，空白合并）
+    :param statement: SQL语句
+    :return: 语句形态
+    """
+    shape = _STRING_LITERAL.sub("?", statement)
+    shape = _NUMBER_LITERAL.sub("?", shape)
+    shape = _PLACEHOLDER.sub("?", shape)
+    shape = _PLACEHOLDER_LIST.sub("(?)", shape)
+    return _WHITESPACE.sub(" ", shape).strip()
+
+
+def _find_origin():
+    """从调用栈中找到发起查询的业务代码位置（优先services，其次api等其他应用代码）"""
+    fallback = None
+    for frame in reversed(traceback.extract_stack()):
+        filename = os.path.abspath(frame.filename)
+        if not filename.startswith(_APP_DIR) or filename == _SELF_FILE:
+            continue
+        relative = os.path.relpath(filename, os.path.dirname(_APP_DIR))
+        origin = f"{relative}:{frame.lineno} {frame.name}"
+        if os.sep + "services" + os.sep in filename:
+            return origin
+        if fallback is None:
+            fallback = origin
+    return fallback or "unknown"
+
+
+class SqlProfiler:
+    """
+    SQL分析器（SQL_PROFILER_ENABLED为True时生效，默认关闭）：
+    1. 记录每次请求执行的SQL语句、参数、耗时和发起查询的业务代码位置
+    2. 请求结束后按归一化形态分组，同一形态执行次数达到SQL_PROFILER_REPEAT_THRESHOLD（默认5）时报告疑似N+1查询
+    3. 耗时超过SQL_PROFILER_SLOW_THRESHOLD秒（默认0.1）的SELECT语句执行EXPLAIN并输出执行计划
+    4. SQL_PROFILER_SAMPLE_RATE（默认1.0）控制抽样比例，灰度环境可只分析部分请求
+    5. 结果写入应用日志，并汇总为一条系统日志（模块sql_profiler）
+    """
+
+    def __init__(self):
+        self._listening = False
+
+    def init_app(self, app):
+        """配置开启时注册请求钩子和SQL事件监听"""
+        if not app.config.get("SQL_PROFILER_ENABLED", False):
+            return
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        if not self._listening:
+            event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+            self._listening = True
+
+    @staticmethod
+    def _before_request():
+        if random.random() < current_app.config.get("SQL_PROFILER_SAMPLE_RATE", 1.0):
+            g.sql_profile = []
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and g.get("sql_profile") is not None:
+            conn.info.setdefault("profiler_query_start", []).append(time.perf_counter())
+
+    @staticmethod
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not has_request_context() or g.get("sql_profile") is None:
+            return
+        starts = conn.info.get("profiler_query_start")
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        g.sql_profile.append((statement, parameters, executemany, elapsed, _find_origin()))
+
+    def _after_request(self, response):
+        profile = g.pop("sql_profile", None)
+        if not profile:
+            return response
+
+        config = current_app.config
+        repeat_threshold = config.get("SQL_PROFILER_REPEAT_THRESHOLD", 5)
+        slow_threshold = config.get("SQL_PROFILER_SLOW_THRESHOLD", 0.1)
+        findings = []
+
+        # 1. 按语句形态分组，找出重复执行的语句（疑似N+1）
+        groups = {}
+        for statement, parameters, executemany, elapsed, origin in profile:
+            group = groups.setdefault(normalize_statement(statement), {"count": 0, "elapsed": 0.0, "origins": {}})
+            group["count"] += 1
+            group["elapsed"] += elapsed
+            group["origins"][origin] = group["origins"].get(origin, 0) + 1
+
+        for shape, group in sorted(groups.items(), key=lambda item: -item[1]["count"]):
+            if group["count"] < repeat_threshold:
+                continue
+            origins = ", ".join(
+                f"{origin} x{count}"
+                for origin, count in sorted(group["origins"].items(), key=lambda item: -item[1])
+            )
+            findings.append(
+                f"疑似N+1：同一形态语句执行{group['count']}次，耗时{group['elapsed']:.3f}秒，"
+                f"来源 {origins}\n  {shape[:500]}"
+            )
+
+        # 2. 慢语句输出执行计划
+        for statement, parameters, executemany, elapsed, origin in profile:
+            if elapsed < slow_threshold:
+                continue
+            plan = None
+            if not executemany and statement.lstrip().upper().startswith("SELECT"):
+                plan = self._explain(statement, parameters)
+            findings.append(
+                f"慢语句：耗时{elapsed:.3f}秒，来源 {origin}\n  {normalize_statement(statement)[:500]}"
+                + (f"\n  EXPLAIN:\n{plan}" if plan else "")
+            )
+
+        if findings:
+            report = "\n".join(findings)
+            current_app.logger.warning(
+                f"SQL分析 {request.method} {request.path}（共{len(profile)}条语句）:\n{report}"
+            )
+            create_log(
+                operator_id=g.get("user_id"),
+                operator_name=None,
+                log_type=LogType.WARNING,
+                module="sql_profiler",
+                action=f"SQL分析 {request.url_rule.rule if request.url_rule is not None else request.path}"[:100],
+                log_level=LogLevel.WARNING,
+                request_method=request.method,
+                request_url=request.full_path.rstrip("?")[:200],
+                request_ip=request.remote_addr,
+                response_status=response.status_code,
+                error_message=report
+            )
+        return response
+
+    @staticmethod
+    def _explain(statement, parameters):
+        """用独立连接执行EXPLAIN，返回格式化后的执行计划"""
+        from app import db
+
+        try:
+            with db.engine.connect() as connection:
+                result = connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)
+                columns = list(result.keys())
+                rows = result.fetchall()
+        except Exception as e:
+            return f"    EXPLAIN失败: {str(e)}"
+
+        lines = ["    " + " | ".join(columns)]
+        for row in rows:
+            lines.append("    " + " | ".join("" if value is None else str(value) for value in row))
+        return "\n".join(lines)
+
+
+sql_profiler = SqlProfiler()
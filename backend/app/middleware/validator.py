@@ -116,6 +116,8 @@ class ValidateQueryNotification(BaseServerModel):
     is_unread_only: bool = Field(default=False, description="是否只查询未读通知")
     page: int = Field(default=1, gt=0, description="页码")
     per_page: int = Field(default=20, gt=0, le=100, description="每页数量")
+    cursor: Optional[str] = Field(default=None, max_length=200, description="分页游标（传入时使用游标分页，首页传空字符串）")
+    with_total: bool = Field(default=False, description="游标分页时是否统计总数")
 
 #发送通知的模型类
 class ValidateSendNotification(BaseServerModel):
@@ -200,6 +202,22 @@ class ValidateIoTData(BaseServerModel):
     voltage: Optional[float] = Field(default=None, ge=0, le=500, description="电压")
     current: Optional[float] = Field(default=None, ge=0, le=1000, description="电流")
 
+#IoT批量上传：单条读数
+class ValidateIoTReading(BaseServerModel):
+    electricity: float = Field(..., ge=0, description="用电量")
+    collect_time: datetime = Field(..., description="采集时间")
+    voltage: Optional[float] = Field(default=None, ge=0, le=500, description="电压")
+    current: Optional[float] = Field(default=None, ge=0, le=1000, description="电流")
+
+#IoT批量上传：单个电表的读数组
+class ValidateIoTMeterReadings(BaseServerModel):
+    meter_id: int = Field(..., gt=0, description="电表ID")
+    readings: List[ValidateIoTReading] = Field(..., min_length=1, max_length=500, description="读数列表")
+
+#IoT批量上传（集中器按电表分组上报）
+class ValidateIoTBatch(BaseServerModel):
+    meters: List[ValidateIoTMeterReadings] = Field(..., min_length=1, max_length=2000, description="电表读数分组")
+
 #用电数据查询的模型类
 class ValidateQueryUsageData(BaseServerModel):
     meter_id: int = Field(..., gt=0, description="电表ID")
@@ -208,6 +226,8 @@ class ValidateQueryUsageData(BaseServerModel):
     end_date: Optional[datetime] = Field(default=None, description="结束日期")
     page: int = Field(default=1, gt=0, description="页码")
     per_page: int = Field(default=20, gt=0, le=100, description="每页数量")
+    cursor: Optional[str] = Field(default=None, max_length=200, description="分页游标（传入时使用游标分页，首页传空字符串）")
+    with_total: bool = Field(default=False, description="游标分页时是否统计总数")
     
     @field_validator("end_date")
     def validate_date_range(cls, v, info):
@@ -235,6 +255,8 @@ class ValidateQueryBills(BaseServerModel):
     end_month: Optional[str] = Field(default=None, description="结束月份")
     page: int = Field(default=1, gt=0, description="页码")
     per_page: int = Field(default=20, gt=0, le=100, description="每页数量")
+    cursor: Optional[str] = Field(default=None, max_length=200, description="分页游标（传入时使用游标分页，首页传空字符串）")
+    with_total: bool = Field(default=False, description="游标分页时是否统计总数")
 
 
 # ============ 用电汇总相关验�?============
@@ -323,6 +345,8 @@ class ValidateGetSystemLogs(BaseServerModel):
     end_time: Optional[str] = Field(default=None, description="结束时间")
     page: int = Field(default=1, gt=0, description="页码")
     per_page: int = Field(default=20, gt=0, le=100, description="每页数量")
+    cursor: Optional[str] = Field(default=None, max_length=200, description="分页游标（传入时使用游标分页，首页传空字符串）")
+    with_total: bool = Field(default=False, description="游标分页时是否统计总数")
 
 
 # ============ 通用分页查询验证 ============
@@ -338,6 +362,7 @@ class ValidateExportData(BaseServerModel):
     start_date: Optional[str] = Field(default=None, description="开始日期（YYYY-MM-DD格式）")
     end_date: Optional[str] = Field(default=None, description="结束日期（YYYY-MM-DD格式）")
     format: str = Field("csv", description="导出格式（csv/excel）")
+    stream: bool = Field(default=False, description="是否流式下载文件（不返回JSON）")
 
     @field_validator("export_type")
     def validate_export_type(cls, v):
@@ -11,5 +11,6 @@ from .meter import Meter,MeterRecord,MeterStatus,MeterType,RecordType
 from .bill import Bill,BillDetail,PricePolicy,TimeSharePriceRules,\
     LadderPriceRules,PriceType,TimePeriod,LadderLevel,BillStatus
 from .system import Region,Permission
-from .usage import UsageData,IoTData,IoTstatus,UsageType
+from .usage import UsageData,IoTData,IoTstatus,UsageType,UsageHourly,RegionUsageData,\
+    RankingRange,UsageRanking
 from .notice import Notifications,NoticeType,NoticeStatus,SendChannel
\ No newline at end of file
@@ -88,8 +88,8 @@ class Bill(db.Model):                                                   #账单
     每个账单详情记录了某个同一时段同一阶梯的单价和总价，
     因此一般一个账单对应多个账单详情
     """
-    __table_arg__=(
-        db.UniqueConstraint("user_id","meter_id","bill_month","uq_user_meter_bill"),  # 修正拼写：UniqueConstrict -> UniqueConstraint
+    __table_args__=(
+        db.UniqueConstraint("meter_id","bill_month",name="uq_meter_bill_month"),      # 每个电表每月只有一张账单
         db.Index("user_meter_bill_id","user_id","meter_id","bill_month"),
         db.Index("idx_user_status", "user_id", "status")
     )
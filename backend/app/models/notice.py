@@ -39,4 +39,8 @@ class Notifications(db.Model):
     batch_id=db.Column(db.String(20),unique=True)
 
 
-    user=db.relationship("User",backref="notice")
\ No newline at end of file
+    user=db.relationship("User",backref="notice")
+
+    __table_args__=(
+        db.Index("notice_target_create","target_id","create_time"),
+    )
\ No newline at end of file
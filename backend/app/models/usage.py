@@ -12,6 +12,12 @@ class UsageType(enum.Enum):
     DAY=0
     MONTH=1
 
+class RankingRange(enum.Enum):
+    day=0       #昨天
+    week=1      #最近7天
+    month=2     #上个月
+    year=3      #最近12个月
+
 #实时用电数据表
 class IoTData(db.Model):
     __tablename__="IoTData"
@@ -25,9 +31,8 @@ class IoTData(db.Model):
 
     meter=db.relationship("Meter",backref="iotdatas")
 
-    __table_arg__=(
-        db.UniqueConstraint("meter_id","collect_time","uniquecstr"),
-        db.Index("meter_collect_id","meter_id","collect_time")
+    __table_args__=(
+        db.Index("meter_collect_id","meter_id","collect_time"),
     )
 
     def __repr__(self):
@@ -43,9 +48,71 @@ class UsageData(db.Model):
     valley_electricity=db.Column(db.Float)                      #低谷期用电量
     create_time=db.Column(db.DateTime,default=datetime.now())
 
-    __table_arg__=(
-        db.UniqueConstraint("meter_id","usage_type","usage_time","uq_meter_usage"),
-        db.Index("meter_usage_type_time_id","meter_id","usage_type","usage_time")
+    #同一电表同一类型同一周期只有一条汇总，唯一键同时作为(电表, 类型, 时间)查询索引
+    __table_args__=(
+        db.UniqueConstraint("meter_id","usage_type","usage_time",name="uq_meter_usage"),
+    )
+    def __repr__(self):
+        return f"<UsageData {self.meter_id}-{self.usage_type}-{self.usage_time}>"
+
+#小时用电汇总表（采集时增量维护，可通过命令行回填）
+class UsageHourly(db.Model):
+    __tablename__="UsageHourly"
+    id=db.Column(db.Integer,primary_key=True,autoincrement=True)
+    meter_id=db.Column(db.Integer,db.ForeignKey(Meter.id),nullable=False)
+    hour_bucket=db.Column(db.DateTime,nullable=False)              #整点时间
+    electricity=db.Column(db.Float,nullable=False,default=0)        #该小时内开始的读数区间用电量
+    reading_count=db.Column(db.Integer,nullable=False,default=0)    #该小时内的读数条数
+    min_voltage=db.Column(db.Float)                                 #最低电压
+    max_voltage=db.Column(db.Float)                                 #最高电压
+
+    __table_args__=(
+        db.UniqueConstraint("meter_id","hour_bucket",name="uq_meter_hour"),
+        db.Index("hourly_bucket_meter","hour_bucket","meter_id")
+    )
+
+    def __repr__(self):
+        return f"<UsageHourly {self.meter_id}-{self.hour_bucket}>"
+
+#片区用电汇总表（包含所有下级片区，夜间汇总任务刷新）
+class RegionUsageData(db.Model):
+    __tablename__="RegionUsageData"
+    id=db.Column(db.Integer,primary_key=True,autoincrement=True)
+    region_id=db.Column(db.Integer,db.ForeignKey("REGION.id",ondelete="CASCADE"),nullable=False)
+    usage_type=db.Column(db.Enum(UsageType),nullable=False)         #汇总类型
+    usage_time=db.Column(db.DateTime,nullable=False)                #汇总日期
+    total_electricity=db.Column(db.Float,nullable=False,default=0)  #汇总周期用电量
+    peak_electricity=db.Column(db.Float,nullable=False,default=0)   #高峰期用电量
+    valley_electricity=db.Column(db.Float,nullable=False,default=0) #低谷期用电量
+    meter_count=db.Column(db.Integer,nullable=False,default=0)      #电表数量（刷新时）
+    user_count=db.Column(db.Integer,nullable=False,default=0)       #用户数量（刷新时）
+    arrears_count=db.Column(db.Integer,nullable=False,default=0)    #欠费用户数量（刷新时）
+    update_time=db.Column(db.DateTime,default=datetime.now,onupdate=datetime.now)
+
+    __table_args__=(
+        db.UniqueConstraint("region_id","usage_type","usage_time",name="uq_region_usage"),
+    )
+
+    def __repr__(self):
+        return f"<RegionUsageData {self.region_id}-{self.usage_type}-{self.usage_time}>"
+
+#用电排名表（每个电表在自身片区的每一级上级片区各一行，region_id为空表示全部片区，夜间汇总任务刷新）
+class UsageRanking(db.Model):
+    __tablename__="UsageRanking"
+    id=db.Column(db.Integer,primary_key=True,autoincrement=True)
+    region_id=db.Column(db.Integer,db.ForeignKey("REGION.id",ondelete="CASCADE"))     #排名范围片区，为空表示全部片区
+    time_range=db.Column(db.Enum(RankingRange),nullable=False)
+    period_start=db.Column(db.DateTime,nullable=False)              #统计开始时间
+    period_end=db.Column(db.DateTime,nullable=False)                #统计结束时间（不含）
+    meter_id=db.Column(db.Integer,db.ForeignKey(Meter.id,ondelete="CASCADE"),nullable=False)
+    user_id=db.Column(db.Integer)                                   #电表绑定的用户（刷新时）
+    total_electricity=db.Column(db.Float,nullable=False,default=0)
+    total_cost=db.Column(db.Float,nullable=False,default=0)
+
+    __table_args__=(
+        db.Index("ranking_region_range_electricity","region_id","time_range","total_electricity"),
+        db.Index("ranking_region_range_cost","region_id","time_range","total_cost"),
     )
+
     def __repr__(self):
-        return f"<UsageData {self.meter_id}-{self.usage_type}-{self.usage_time}>"
\ No newline at end of file
+        return f"<UsageRanking {self.region_id}-{self.time_range}-{self.meter_id}>"
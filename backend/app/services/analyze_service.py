@@ -1,32 +1,30 @@
 #分析业务（数据统计、趋势计算）
-from ..models import UsageData, UsageType, Bill, Meter, User, Region, IoTData,BillDetail
+from ..models import UsageData, UsageType, Bill, Meter, User, Region, BillDetail,UsageHourly,RankingRange
 from app import db
 from ..middleware import BusinessException
+from .region_tree import RegionTree
+from .region_rollup import RegionRollup
+from .ranking_board import RankingBoard
+from ..utils.export_util import iter_csv, iter_xlsx, CSV_MIMETYPE, XLSX_MIMETYPE
 from datetime import datetime, timedelta
-from sqlalchemy import func, and_, or_
+from sqlalchemy import func, and_, or_, extract
 from flask import current_app
 import csv
 import io
 
+# 导出时服务端游标每批读取的行数
+EXPORT_BATCH_SIZE = 1000
+
 class AnalyzeServices:
     
     @staticmethod
     def _get_all_sub_regions(region_id):
         """
-        递归获取某个片区及其所有子片区的ID列表
+        获取某个片区及其所有子片区的ID列表（读取片区树缓存，不访问数据库）
         :param region_id: 片区ID
         :return: 包含该片区及所有子片区的ID列表
         """
-        result = [region_id]
-        
-        # 查找直接子片区
-        sub_regions = Region.query.filter_by(parent_id=region_id).all()
-        
-        # 递归查找每个子片区的子片区
-        for sub_region in sub_regions:
-            result.extend(AnalyzeServices._get_all_sub_regions(sub_region.id))
-        
-        return result
+        return list(RegionTree.get().descendants(region_id))
     
     @staticmethod
     def get_user_statistics_summary(user_id):
@@ -82,47 +80,33 @@ class AnalyzeServices:
     def get_region_statistics_summary(region_id):
         """
         获取片区统计摘要（管理员Dashboard用）
-        包含该片区及所有下级片区的汇总数据
+        包含该片区及所有下级片区的汇总数据（读取片区汇总表）
         :param region_id: 片区ID
         :return: 统计摘要数据
         """
-        region = Region.query.get(region_id)
-        if not region:
+        region_tree = RegionTree.get()
+        if not region_tree.exists(region_id):
             raise BusinessException("片区不存在", 404)
         
-        # 获取该片区及所有子片区的ID列表
-        all_region_ids = AnalyzeServices._get_all_sub_regions(region_id)
-        
-        # 获取这些片区的所有电表
-        meters = Meter.query.filter(Meter.region_id.in_(all_region_ids)).all()
-        meter_ids = [m.id for m in meters] if meters else []
-        
-        # 获取这些片区的所有用户（通过电表关联）
-        user_ids = list(set([m.user_id for m in meters if m.user_id]))
-        
         # 当月范围
         current_time = datetime.now()
         month_start = current_time.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        # 1. 片区总用电量（当月）
-        total_usage = db.session.query(func.sum(UsageData.total_electricity)).filter(
-            UsageData.meter_id.in_(meter_ids),
-            UsageData.usage_time >= month_start
-        ).scalar() or 0
+        # 1. 片区总用电量（当月已结束各日的日数据，缺少汇总行的日期实时计算）
+        total_usage = sum(
+            record.total_electricity or 0
+            for record in RegionRollup.usage_by_period(region_id, UsageType.DAY, month_start, current_time)
+        )
         
-        # 2. 欠费用户数
-        from ..models import BillStatus, UserStatus
-        arrear_users = db.session.query(func.count(func.distinct(Bill.user_id))).filter(
-            Bill.meter_id.in_(meter_ids),
-            Bill.status.in_([BillStatus.overdue])
-        ).scalar() or 0
+        # 2. 用户数、电表数、欠费用户数（最近一次刷新的快照，没有汇总行时实时统计）
+        meter_count, user_count, arrears_count = RegionRollup.counts(region_id)
         
         return {
-            "region_name": region.region_name,
+            "region_name": region_tree.name(region_id),
             "total_usage": round(total_usage, 2),
-            "user_count": len(user_ids),
-            "meter_count": len(meters),
-            "arrear_users": arrear_users
+            "user_count": user_count,
+            "meter_count": meter_count,
+            "arrear_users": arrears_count
         }
     
     @staticmethod
@@ -199,7 +183,7 @@ class AnalyzeServices:
                         "peak_electricity": 0,
                         "valley_electricity": 0
                     }
-                year_data[year]["total_electricity"] += record.total_electricity
+                year_data[year]["total_electricity"] += record.total_electricity or 0
                 year_data[year]["peak_electricity"] += record.peak_electricity or 0
                 year_data[year]["valley_electricity"] += record.valley_electricity or 0
             
@@ -367,22 +351,20 @@ class AnalyzeServices:
         :param compare_period: 是否对比同期
         :return: 分析结果
         """
-        region = Region.query.get(region_id)
-        if not region:
+        region_tree = RegionTree.get()
+        if not region_tree.exists(region_id):
             raise BusinessException("片区不存在", 404)
+        region_name = region_tree.name(region_id)
         
-        # 获取该片区及所有子片区的ID列表
-        all_region_ids = AnalyzeServices._get_all_sub_regions(region_id)
-        
-        # 获取这些片区的所有电表
-        meters = Meter.query.filter(Meter.region_id.in_(all_region_ids)).all()
-        if not meters:
+        # 电表数、用户数取片区汇总表最近一次刷新的快照（没有汇总行时实时统计）
+        meter_count, user_count, _ = RegionRollup.counts(region_id)
+        if not meter_count:
             return {
                 "success": True,
                 "analysis_period": analysis_period,
                 "region_info": {
                     "region_id": region_id,
-                    "region_name": region.region_name,
+                    "region_name": region_name,
                     "meter_count": 0,
                     "user_count": 0
                 },
@@ -396,8 +378,6 @@ class AnalyzeServices:
                 }
             }
         
-        meter_ids = [m.id for m in meters]
-        user_ids = list(set([m.user_id for m in meters if m.user_id]))
         current_time = datetime.now()
         
         # 1. 查询历史用电数据并生成趋势
@@ -421,12 +401,8 @@ class AnalyzeServices:
         else:
             raise BusinessException("不支持的分析周期", 400)
         
-        # 查询当前周期数据
-        current_data = UsageData.query.filter(
-            UsageData.meter_id.in_(meter_ids),
-            UsageData.usage_type == usage_type,
-            UsageData.usage_time >= start_date
-        ).order_by(UsageData.usage_time).all()
+        # 查询当前周期数据（缺少汇总行的周期实时计算）
+        current_data = RegionRollup.usage_by_period(region_id, usage_type, start_date, current_time)
         
         # 构建趋势数据
         trend_data = []
@@ -441,7 +417,7 @@ class AnalyzeServices:
                         "peak_electricity": 0,
                         "valley_electricity": 0
                     }
-                year_data[year]["total_electricity"] += record.total_electricity
+                year_data[year]["total_electricity"] += record.total_electricity or 0
                 year_data[year]["peak_electricity"] += record.peak_electricity or 0
                 year_data[year]["valley_electricity"] += record.valley_electricity or 0
             
@@ -468,7 +444,7 @@ class AnalyzeServices:
                         "valley_electricity": 0
                     }
                 
-                period_data[period_str]["total_electricity"] += record.total_electricity
+                period_data[period_str]["total_electricity"] += record.total_electricity or 0
                 period_data[period_str]["peak_electricity"] += record.peak_electricity or 0
                 period_data[period_str]["valley_electricity"] += record.valley_electricity or 0
             
@@ -483,15 +459,10 @@ class AnalyzeServices:
         # 2. 对比同期用电量
         comparison = None
         if compare_period and compare_start:
-            compare_data = UsageData.query.filter(
-                UsageData.meter_id.in_(meter_ids),
-                UsageData.usage_type == usage_type,
-                UsageData.usage_time >= compare_start,
-                UsageData.usage_time < start_date
-            ).all()
+            compare_data = RegionRollup.usage_by_period(region_id, usage_type, compare_start, start_date)
             
-            current_total = sum(d.total_electricity for d in current_data)
-            compare_total = sum(d.total_electricity for d in compare_data)
+            current_total = sum(d.total_electricity or 0 for d in current_data)
+            compare_total = sum(d.total_electricity or 0 for d in compare_data)
             
             if compare_total > 0:
                 change_rate = ((current_total - compare_total) / compare_total) * 100
@@ -514,9 +485,9 @@ class AnalyzeServices:
             "analysis_period": analysis_period,
             "region_info": {
                 "region_id": region_id,
-                "region_name": region.region_name,
-                "meter_count": len(meters),
-                "user_count": len(user_ids)
+                "region_name": region_name,
+                "meter_count": meter_count,
+                "user_count": user_count
             },
             "trend_data": trend_data,
             "comparison": comparison,
@@ -526,7 +497,7 @@ class AnalyzeServices:
                 "avg_electricity": round(sum(d["total_electricity"] for d in trend_data) / len(trend_data), 2) if trend_data else 0,
                 "max_electricity": max((d["total_electricity"] for d in trend_data), default=0),
                 "min_electricity": min((d["total_electricity"] for d in trend_data), default=0),
-                "avg_per_meter": round(sum(d["total_electricity"] for d in trend_data) / len(meters), 2) if trend_data and meters else 0
+                "avg_per_meter": round(sum(d["total_electricity"] for d in trend_data) / meter_count, 2) if trend_data else 0
             }
         }
     
@@ -534,6 +505,8 @@ class AnalyzeServices:
     def region_statistics(region_id=None, start_date=None, end_date=None, usage_level=False):
         """
         区域用电统计（包含下级片区的递归汇总）
+        按电表所属片区一次GROUP BY得到各片区自身的合计，再沿片区树自下而上累加，
+        不再对每个片区分别加载电表和用电数据
         :param region_id: 片区ID（可选，不传则统计所有片区）
         :param start_date: 开始日期
         :param end_date: 结束日期
@@ -546,35 +519,45 @@ class AnalyzeServices:
             start_date = end_date - timedelta(days=30)
         
         # 查询片区
+        region_tree = RegionTree.get()
         if region_id:
-            regions = [Region.query.get(region_id)]
-            if not regions[0]:
+            if not region_tree.exists(region_id):
                 raise BusinessException("片区不存在", 404)
+            region_ids = [region_id]
+            scope_region_ids = AnalyzeServices._get_all_sub_regions(region_id)
         else:
-            regions = Region.query.all()
+            region_ids = sorted(region_tree.parents)
+            scope_region_ids = None
+        
+        # 1. 各片区自身的电表数量和用电量
+        meter_query = db.session.query(Meter.region_id, func.count(Meter.id)).group_by(Meter.region_id)
+        usage_query = db.session.query(
+            Meter.region_id, func.sum(UsageData.total_electricity)
+        ).join(
+            Meter, Meter.id == UsageData.meter_id
+        ).filter(
+            UsageData.usage_time >= start_date,
+            UsageData.usage_time <= end_date
+        ).group_by(Meter.region_id)
+        if scope_region_ids is not None:
+            meter_query = meter_query.filter(Meter.region_id.in_(scope_region_ids))
+            usage_query = usage_query.filter(Meter.region_id.in_(scope_region_ids))
+        
+        # 2. 沿片区树累加到上级片区
+        meter_totals = region_tree.subtree_totals(dict(meter_query.all()))
+        usage_totals = region_tree.subtree_totals({
+            own_region_id: total or 0 for own_region_id, total in usage_query.all()
+        })
         
         statistics = []
         
-        for region in regions:
-            # 获取该片区及所有子片区的ID列表
-            all_region_ids = AnalyzeServices._get_all_sub_regions(region.id)
-            
-            # 获取这些片区的所有电表
-            meters = Meter.query.filter(Meter.region_id.in_(all_region_ids)).all()
-            if not meters:
+        for stat_region_id in region_ids:
+            meter_count = meter_totals.get(stat_region_id, 0)
+            if not meter_count:
                 continue
             
-            meter_ids = [m.id for m in meters]
-            
-            # 查询用电数据
-            usage_data = UsageData.query.filter(
-                UsageData.meter_id.in_(meter_ids),
-                UsageData.usage_time >= start_date,
-                UsageData.usage_time <= end_date
-            ).all()
-            
-            total_electricity = sum(d.total_electricity for d in usage_data)
-            avg_electricity = total_electricity / len(meters) if meters else 0
+            total_electricity = usage_totals.get(stat_region_id, 0)
+            avg_electricity = total_electricity / meter_count
             
             # 确定用电等级（用于热力图）
             if usage_level:
@@ -590,9 +573,9 @@ class AnalyzeServices:
                 level = None
             
             statistics.append({
-                "region_id": region.id,
-                "region_name": region.region_name,
-                "meter_count": len(meters),
+                "region_id": stat_region_id,
+                "region_name": region_tree.name(stat_region_id),
+                "meter_count": meter_count,
                 "total_electricity": round(total_electricity, 2),
                 "avg_electricity": round(avg_electricity, 2),
                 "usage_level": level
@@ -622,40 +605,24 @@ class AnalyzeServices:
     
     @staticmethod
     def _find_peak_hours(region_ids, start_date, end_date):
-        """查找用电高峰时段"""
-        # 获取所有相关电表
-        meters = Meter.query.filter(Meter.region_id.in_(region_ids)).all()
-        if not meters:
-            return []
-        
-        meter_ids = [m.id for m in meters]
-        
-        # 查询IoT数据，按小时统计
-        iot_data = IoTData.query.filter(
-            IoTData.meter_id.in_(meter_ids),
-            IoTData.collect_time >= start_date,
-            IoTData.collect_time <= end_date
-        ).all()
-        
-        # 按小时统计用电量
-        hour_usage = {}
-        for i in range(len(iot_data) - 1):
-            current = iot_data[i]
-            next_data = iot_data[i + 1]
-            hour = current.collect_time.hour
-            usage = next_data.electricity - current.electricity
-            
-            if hour not in hour_usage:
-                hour_usage[hour] = []
-            hour_usage[hour].append(usage)
-        
-        # 计算每个小时的平均用电量
-        hour_avg = {}
-        for hour, usages in hour_usage.items():
-            hour_avg[hour] = sum(usages) / len(usages) if usages else 0
+        """查找用电高峰时段（读取小时汇总表，每个电表每小时一行）"""
+        hour_col = extract("hour", UsageHourly.hour_bucket)
+        hour_stats = db.session.query(
+            hour_col.label("hour"),
+            func.avg(UsageHourly.electricity).label("avg_usage")
+        ).join(
+            Meter, Meter.id == UsageHourly.meter_id
+        ).filter(
+            Meter.region_id.in_(region_ids),
+            UsageHourly.hour_bucket >= start_date.replace(minute=0, second=0, microsecond=0),
+            UsageHourly.hour_bucket <= end_date
+        ).group_by(hour_col).all()
         
         # 找出用电量最高的时段
-        sorted_hours = sorted(hour_avg.items(), key=lambda x: x[1], reverse=True)
+        sorted_hours = sorted(
+            ((int(stat.hour), float(stat.avg_usage or 0)) for stat in hour_stats),
+            key=lambda x: x[1], reverse=True
+        )
         
         return [
             {
@@ -713,34 +680,25 @@ class AnalyzeServices:
         for weekday, usages in weekday_usage.items():
             weekday_avg[weekday] = sum(usages) / len(usages) if usages else 0
         
-        # 2. 查询IoT数据，统计每日的高峰时段
-        iot_data = IoTData.query.filter(
-            IoTData.meter_id.in_(meter_ids),
-            IoTData.collect_time >= start_date
-        ).order_by(IoTData.collect_time).all()
-        
-        # 按日期和小时统计
-        daily_hourly_usage = {}
-        for i in range(len(iot_data) - 1):
-            current = iot_data[i]
-            next_data = iot_data[i + 1]
-            
-            date_key = current.collect_time.date()
-            hour = current.collect_time.hour
-            usage = next_data.electricity - current.electricity
-            
-            if date_key not in daily_hourly_usage:
-                daily_hourly_usage[date_key] = {}
-            if hour not in daily_hourly_usage[date_key]:
-                daily_hourly_usage[date_key][hour] = []
-            daily_hourly_usage[date_key][hour].append(usage)
+        # 2. 读取小时汇总，按日期和小时统计各电表的平均用电量
+        hour_col = extract("hour", UsageHourly.hour_bucket)
+        date_col = func.date(UsageHourly.hour_bucket)
+        hourly_query = db.session.query(
+            date_col.label("date"),
+            hour_col.label("hour"),
+            func.avg(UsageHourly.electricity).label("avg_usage")
+        ).filter(
+            UsageHourly.hour_bucket >= start_date.replace(minute=0, second=0, microsecond=0)
+        )
+        if region_id:
+            hourly_query = hourly_query.join(
+                Meter, Meter.id == UsageHourly.meter_id
+            ).filter(Meter.region_id.in_(all_region_ids))
         
         # 统计每个小时的平均用电量
         hour_avg_usage = {h: [] for h in range(24)}
-        for date, hourly in daily_hourly_usage.items():
-            for hour, usages in hourly.items():
-                avg = sum(usages) / len(usages) if usages else 0
-                hour_avg_usage[hour].append(avg)
+        for stat in hourly_query.group_by(date_col, hour_col).all():
+            hour_avg_usage[int(stat.hour)].append(float(stat.avg_usage or 0))
         
         # 计算每个小时的总体平均
         hour_overall_avg = {}
@@ -791,6 +749,69 @@ class AnalyzeServices:
             }
         }
     
+    @staticmethod
+    def get_ranking(region_id=None, ranking_type="electricity", time_range="month", limit=10):
+        """
+        用电排名（读取夜间刷新的排名表，按索引取前K名）
+        :param region_id: 片区ID（可选，包含所有子片区，不传则为全部片区）
+        :param ranking_type: 排名类型（electricity/cost）
+        :param time_range: 时间范围（day昨天/week最近7天/month上个月/year最近12个月）
+        :param limit: 返回数量
+        :return: 排名结果
+        """
+        try:
+            range_enum = RankingRange[time_range]
+        except KeyError:
+            raise BusinessException(f"不支持的时间范围：{time_range}", 400)
+        
+        if region_id is not None and not RegionTree.get().exists(region_id):
+            raise BusinessException("片区不存在", 404)
+        
+        # 账单按月生成，费用排名只有按月的时间范围有意义
+        if ranking_type == "cost" and range_enum in [RankingRange.day, RankingRange.week]:
+            raise BusinessException("费用排名仅支持month/year时间范围", 400)
+        
+        entries = RankingBoard.top(region_id, range_enum, ranking_type, limit)
+        
+        # 只为前K名补充用户和电表信息
+        user_names = dict(
+            db.session.query(User.id, User.real_name).filter(
+                User.id.in_({entry.user_id for entry in entries if entry.user_id})
+            ).all()
+        ) if entries else {}
+        meter_codes = dict(
+            db.session.query(Meter.id, Meter.meter_code).filter(
+                Meter.id.in_([entry.meter_id for entry in entries])
+            ).all()
+        ) if entries else {}
+        
+        if entries:
+            period_start, period_end = entries[0].period_start, entries[0].period_end
+        else:
+            period_start, period_end, _ = RankingBoard.period_range(range_enum)
+        
+        return {
+            "ranking_type": ranking_type,
+            "time_range": time_range,
+            "region_id": region_id,
+            "period": {
+                "start_date": period_start.strftime("%Y-%m-%d"),
+                "end_date": (period_end - timedelta(days=1)).strftime("%Y-%m-%d")
+            },
+            "rankings": [
+                {
+                    "rank": rank,
+                    "user_id": entry.user_id,
+                    "user_name": user_names.get(entry.user_id),
+                    "meter_id": entry.meter_id,
+                    "meter_code": meter_codes.get(entry.meter_id),
+                    "total_usage": entry.total_electricity,
+                    "total_cost": entry.total_cost
+                }
+                for rank, entry in enumerate(entries, start=1)
+            ]
+        }
+    
     @staticmethod
     def export_data(user_id, export_type="usage", region_id=None, start_date=None, end_date=None, format_type="csv"):
         """
@@ -803,7 +824,80 @@ class AnalyzeServices:
         :param format_type: 格式类型（csv/excel）
         :return: 导出的数据内容
         """
-        # 1. 时间范围设置
+        region_ids, start_date, end_date, headers, rows = AnalyzeServices._prepare_export(
+            user_id, export_type, region_id, start_date, end_date
+        )
+        data = list(rows)
+        
+        # 4. 格式化数据
+        if format_type == "csv":
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(headers)
+            writer.writerows(data)
+            content = output.getvalue()
+            output.close()
+            
+            return {
+                "success": True,
+                "format": "csv",
+                "filename": AnalyzeServices._export_filename(export_type, start_date, end_date, "csv"),
+                "content": content,
+                "record_count": len(data)
+            }
+        else:
+            # Excel格式（返回数据，由前端或其他服务处理）
+            return {
+                "success": True,
+                "format": "excel",
+                "filename": AnalyzeServices._export_filename(export_type, start_date, end_date, "xlsx"),
+                "headers": headers,
+                "data": data,
+                "record_count": len(data)
+            }
+    
+    @staticmethod
+    def export_data_stream(user_id, export_type="usage", region_id=None, start_date=None, end_date=None, format_type="csv"):
+        """
+        流式数据导出（服务端游标逐批读取，边读边输出文件内容，内存占用与导出行数无关）
+        :param user_id: 导出用户ID
+        :param export_type: 导出类型（usage/bill）
+        :param region_id: 片区ID（可选）
+        :param start_date: 开始日期
+        :param end_date: 结束日期
+        :param format_type: 格式类型（csv/excel）
+        :return: (文件名, MIME类型, bytes数据块生成器)
+        """
+        # 权限校验在生成器开始输出之前完成，校验失败仍返回普通错误响应
+        region_ids, start_date, end_date, headers, rows = AnalyzeServices._prepare_export(
+            user_id, export_type, region_id, start_date, end_date
+        )
+        
+        if format_type == "csv":
+            filename = AnalyzeServices._export_filename(export_type, start_date, end_date, "csv")
+            return filename, CSV_MIMETYPE, iter_csv(headers, rows)
+        
+        filename = AnalyzeServices._export_filename(export_type, start_date, end_date, "xlsx")
+        sheet_name = "用电数据" if export_type == "usage" else "账单数据"
+        return filename, XLSX_MIMETYPE, iter_xlsx(headers, rows, sheet_name)
+    
+    @staticmethod
+    def _export_filename(export_type, start_date, end_date, extension):
+        """导出文件名"""
+        return f"{export_type}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.{extension}"
+    
+    @staticmethod
+    def _prepare_export(user_id, export_type, region_id, start_date, end_date):
+        """
+        导出前的时间范围处理和权限校验
+        :return: (片区ID列表, 开始时间, 结束时间, 表头, 数据行生成器)
+        """
+        # 1. 时间范围设置（接口传入的是YYYY-MM-DD字符串）
+        if isinstance(start_date, str):
+            start_date = datetime.strptime(start_date, "%Y-%m-%d")
+        if isinstance(end_date, str):
+            # 结束日期包含当天
+            end_date = datetime.strptime(end_date, "%Y-%m-%d").replace(hour=23, minute=59, second=59)
         if not end_date:
             end_date = datetime.now()
         if not start_date:
@@ -835,44 +929,24 @@ class AnalyzeServices:
         all_region_ids = AnalyzeServices._get_all_sub_regions(region_id)
         
         if export_type == "usage":
-            data = AnalyzeServices._export_usage_data(all_region_ids, start_date, end_date)
+            rows = AnalyzeServices._iter_usage_rows(all_region_ids, start_date, end_date)
             headers = ["电表编号", "用户姓名", "片区", "日期", "总用电量(度)", "高峰用电量(度)", "低谷用电量(度)", "数据类型"]
         elif export_type == "bill":
-            data = AnalyzeServices._export_bill_data(all_region_ids, start_date, end_date)
-            headers = ["账单ID", "电表编号", "用户姓名", "片区", "账单月份", "总用电量(度)", "总金额(元)", "状态", "到期日", "支付时间"]
+            rows = AnalyzeServices._iter_bill_rows(all_region_ids, start_date, end_date)
+            headers = ["账单ID", "电表编号", "用户姓名", "片区", "账单月份", "总用电量(度)", "总金额(元)", "状态", "到期日", "生成时间"]
         else:
             raise BusinessException("不支持的导出类型", 400)
         
-        # 4. 格式化数据
-        if format_type == "csv":
-            output = io.StringIO()
-            writer = csv.writer(output)
-            writer.writerow(headers)
-            writer.writerows(data)
-            content = output.getvalue()
-            output.close()
-            
-            return {
-                "success": True,
-                "format": "csv",
-                "filename": f"{export_type}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.csv",
-                "content": content,
-                "record_count": len(data)
-            }
-        else:
-            # Excel格式（返回数据，由前端或其他服务处理）
-            return {
-                "success": True,
-                "format": "excel",
-                "filename": f"{export_type}_{start_date.strftime('%Y%m%d')}_{end_date.strftime('%Y%m%d')}.xlsx",
-                "headers": headers,
-                "data": data,
-                "record_count": len(data)
-            }
+        return all_region_ids, start_date, end_date, headers, rows
     
     @staticmethod
     def _export_usage_data(region_ids, start_date, end_date):
         """导出用电数据（支持多个片区）"""
+        return list(AnalyzeServices._iter_usage_rows(region_ids, start_date, end_date))
+    
+    @staticmethod
+    def _usage_export_query(region_ids, start_date, end_date):
+        """用电数据导出查询"""
         query = db.session.query(
             Meter.meter_code,
             User.real_name,
@@ -895,12 +969,14 @@ class AnalyzeServices:
         
         if region_ids:
             query = query.filter(Meter.region_id.in_(region_ids))
-        
-        results = query.all()
-        
-        data = []
-        for row in results:
-            data.append([
+        return query
+    
+    @staticmethod
+    def _iter_usage_rows(region_ids, start_date, end_date):
+        """逐行生成用电数据（服务端游标，每批EXPORT_BATCH_SIZE行）"""
+        query = AnalyzeServices._usage_export_query(region_ids, start_date, end_date)
+        for row in query.order_by(UsageData.id).yield_per(EXPORT_BATCH_SIZE):
+            yield [
                 row.meter_code,
                 row.real_name or "未设置",
                 row.region_name,
@@ -909,13 +985,16 @@ class AnalyzeServices:
                 round(row.peak_electricity or 0, 2),
                 round(row.valley_electricity or 0, 2),
                 "日" if row.usage_type == UsageType.DAY else "月"
-            ])
-        
-        return data
+            ]
     
     @staticmethod
     def _export_bill_data(region_ids, start_date, end_date):
         """导出账单数据（支持多个片区）"""
+        return list(AnalyzeServices._iter_bill_rows(region_ids, start_date, end_date))
+    
+    @staticmethod
+    def _bill_export_query(region_ids, start_date, end_date):
+        """账单数据导出查询"""
         query = db.session.query(
             Bill.id,
             Meter.meter_code,
@@ -926,7 +1005,7 @@ class AnalyzeServices:
             Bill.total_amount,
             Bill.status,
             Bill.due_date,
-            Bill.payment_time
+            Bill.create_time
         ).join(
             Meter, Bill.meter_id == Meter.id
         ).join(
@@ -940,12 +1019,14 @@ class AnalyzeServices:
         
         if region_ids:
             query = query.filter(Meter.region_id.in_(region_ids))
-        
-        results = query.all()
-        
-        data = []
-        for row in results:
-            data.append([
+        return query
+    
+    @staticmethod
+    def _iter_bill_rows(region_ids, start_date, end_date):
+        """逐行生成账单数据（服务端游标，每批EXPORT_BATCH_SIZE行）"""
+        query = AnalyzeServices._bill_export_query(region_ids, start_date, end_date)
+        for row in query.order_by(Bill.id).yield_per(EXPORT_BATCH_SIZE):
+            yield [
                 row.id,
                 row.meter_code,
                 row.real_name or "未设置",
@@ -955,8 +1036,6 @@ class AnalyzeServices:
                 round(row.total_amount, 2),
                 row.status.name,
                 row.due_date.strftime("%Y-%m-%d"),
-                row.payment_time.strftime("%Y-%m-%d %H:%M:%S") if row.payment_time else "未支付"
-            ])
-        
-        return data
+                row.create_time.strftime("%Y-%m-%d %H:%M:%S") if row.create_time else ""
+            ]
 
@@ -4,53 +4,30 @@ from app import db
 from flask import session
 from ..middleware import BusinessException,create_log, LogType, LogLevel
 from datetime import datetime, timedelta
-from sqlalchemy import and_, or_
+from sqlalchemy import and_, or_, insert, select, update, func
+from sqlalchemy.orm import aliased
+from .tariff import CompiledTariff
+from .region_tree import RegionTree
+from .pricing_kernel import PricingKernel, READING_DTYPE
+from .policy_resolver import PolicyResolver
+from ..utils.pagination import keyset_paginate
+from itertools import groupby
+import numpy as np
 
 class BillServices:
     @staticmethod
     def _find_region_policy(region_id, month_start, month_end):
         """
-        递归查找片区的电价策略（包括上级片区）
+        查找片区的电价策略（包括上级片区）：一次查询取出祖先链上所有片区的策略，取最近一级有策略的片区
         :param region_id: 片区ID
         :param month_start: 账单月份开始时间
         :param month_end: 账单月份结束时间
         :return: 符合条件的电价策略列表，如果没有则返回None
         """
-        # 查询当前片区的电价策略
-        policies = db.session.query(PricePolicy).filter(
-            PricePolicy.region_id == region_id,
-            PricePolicy.is_active == True,
-            PricePolicy.start_time < month_end,
-            or_(
-                PricePolicy.end_time.is_(None),
-                PricePolicy.end_time > month_start
-            )
-        ).order_by(PricePolicy.start_time).all()
-        
-        if policies:
-            return policies
-        
-        # 如果当前片区没有策略，查找上级片区
-        region = Region.query.get(region_id)
-        if region and region.parent_id:
-            # 递归查找上级片区的策略
-            return BillServices._find_region_policy(region.parent_id, month_start, month_end)
+        chain = RegionTree.get().ancestors(region_id)
         
-        # 没有上级片区且当前片区没有策略
-        return None
-    
-    @staticmethod
-    def _find_region_policy(region_id, month_start, month_end):
-        """
-        递归查找片区的电价策略（包括上级片区）
-        :param region_id: 片区ID
-        :param month_start: 账单月份开始时间
-        :param month_end: 账单月份结束时间
-        :return: 符合条件的电价策略列表，如果没有则返回None
-        """
-        # 查询当前片区的电价策略
         policies = db.session.query(PricePolicy).filter(
-            PricePolicy.region_id == region_id,
+            PricePolicy.region_id.in_(chain),
             PricePolicy.is_active == True,
             PricePolicy.start_time < month_end,
             or_(
@@ -59,20 +36,16 @@ class BillServices:
             )
         ).order_by(PricePolicy.start_time).all()
         
-        if policies:
-            return policies
+        # 当前片区没有策略时使用最近的上级片区的策略
+        for chain_region_id in chain:
+            region_policies = [policy for policy in policies if policy.region_id == chain_region_id]
+            if region_policies:
+                return region_policies
         
-        # 如果当前片区没有策略，查找上级片区
-        region = Region.query.get(region_id)
-        if region and region.parent_id:
-            # 递归查找上级片区的策略
-            return BillServices._find_region_policy(region.parent_id, month_start, month_end)
-        
-        # 没有上级片区且当前片区没有策略
         return None
     
     @staticmethod
-    def query_bills(user_id=None, meter_id=None, status=None, start_month=None, end_month=None, page=1, per_page=20, current_user_id=None, user_role="RESIDENT"):
+    def query_bills(user_id=None, meter_id=None, status=None, start_month=None, end_month=None, page=1, per_page=20, current_user_id=None, user_role="RESIDENT", cursor=None, with_total=False):
         """
         查询账单列表（带分页）
         :param user_id: 用户ID（可选）
@@ -84,10 +57,16 @@ class BillServices:
         :param per_page: 每页数量
         :param current_user_id: 当前用户ID
         :param user_role: 当前用户角色
+        :param cursor: 游标（不为None时使用游标分页，空字符串表示第一页）
+        :param with_total: 游标分页时是否统计总数
         :return: 账单列表和分页信息
         """
-        # 构建查询
-        query = Bill.query
+        # 构建查询（电表编号、用户姓名随账单一起查出，避免逐行查询）
+        query = db.session.query(Bill, Meter.meter_code, User.real_name).outerjoin(
+            Meter, Meter.id == Bill.meter_id
+        ).outerjoin(
+            User, User.id == Bill.user_id
+        )
         
         # 权限过滤：普通用户只能查自己的账单
         if user_role == "RESIDENT":
@@ -123,23 +102,28 @@ class BillServices:
             except ValueError:
                 pass
         
-        # 排序：最新的在前
-        query = query.order_by(Bill.bill_month.desc())
-        
-        # 分页
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        if cursor is not None:
+            # 游标分页：按(账单月份, ID)定位下一页，不执行OFFSET
+            items, page_info = keyset_paginate(
+                query, Bill.bill_month, Bill.id, cursor, per_page, with_total,
+                key=lambda row: (row[0].bill_month, row[0].id)
+            )
+        else:
+            # 排序：最新的在前
+            query = query.order_by(Bill.bill_month.desc())
+            
+            # 分页
+            pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+            items = pagination.items
         
         # 构建返回数据
         bills = []
-        for bill in pagination.items:
-            meter = Meter.query.get(bill.meter_id)
-            user = User.query.get(bill.user_id)
-            
+        for bill, meter_code, real_name in items:
             bills.append({
                 "id": bill.id,
                 "bill_month": bill.bill_month.strftime("%Y-%m"),
-                "meter_code": meter.meter_code if meter else "未知",
-                "user_name": user.real_name if user and user.real_name else "未设置",
+                "meter_code": meter_code or "未知",
+                "user_name": real_name or "未设置",
                 "total_electricity": round(bill.total_electricity, 2),
                 "total_amount": round(bill.total_amount, 2),
                 "status": bill.status.name.upper(),  # 返回大写字符串如UNPAID、PAID
@@ -147,6 +131,9 @@ class BillServices:
                 "create_time": bill.create_time.strftime("%Y-%m-%d %H:%M:%S")
             })
         
+        if cursor is not None:
+            return {"bills": bills, "pagination": page_info}
+        
         return {
             "bills": bills,
             "pagination": {
@@ -160,12 +147,12 @@ class BillServices:
         }
     
     @staticmethod
-    def match_policy(bill_month, user_id):
+    def _resolve_user_policies(bill_month, user_id):
         """
-        匹配账单月份对应的价格政策（支持从上级片区继承）
-        :param bill_month: 账单月份（datetime对象，通常是月初第一天）
+        解析用户所在片区某月份的生效政策（走PolicyResolver缓存）
+        :param bill_month: 账单月份（datetime对象或YYYY-MM-DD字符串）
         :param user_id: 用户ID
-        :return: 与该月有重合的所有有效政策列表
+        :return: (region_id, ResolvedPolicies)
         """
         user = db.session.query(User).get(user_id)
         if user is None:
@@ -175,76 +162,66 @@ class BillServices:
         if not region_id:
             raise BusinessException("用户未分配片区", 400)
         
-        # 计算账单月份的时间范围：从该月1日00:00:00到下月1日00:00:00
         if isinstance(bill_month, str):
             bill_month = datetime.strptime(bill_month, "%Y-%m-%d")
         
-        # 确保bill_month是月初
-        month_start = bill_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-        
-        # 计算下个月的第一天
-        if month_start.month == 12:
-            month_end = month_start.replace(year=month_start.year + 1, month=1)
-        else:
-            month_end = month_start.replace(month=month_start.month + 1)
-        
-        # 递归查找该片区及其上级片区的电价策略
-        policies = BillServices._find_region_policy(region_id, month_start, month_end)
-        
-        if not policies:
-            # 查找用户所在片区的名称链（用于错误提示）
-            region_chain = []
-            current_region_id = region_id
-            while current_region_id:
-                region = Region.query.get(current_region_id)
-                if region:
-                    region_chain.append(region.region_name)
-                    current_region_id = region.parent_id
-                else:
-                    break
-            region_path = " -> ".join(reversed(region_chain))
+        # 查找该片区及其上级片区的电价策略
+        resolved = PolicyResolver.resolve(region_id, bill_month)
+        if not resolved.policies:
+            # 片区名称链（用于错误提示）
+            region_path = " -> ".join(RegionTree.get().path_names(region_id))
             
             raise BusinessException(
-                f"未找到{month_start.strftime('%Y年%m月')}符合条件的价格策略\n"
+                f"未找到{resolved.month_start.strftime('%Y年%m月')}符合条件的价格策略\n"
                 f"片区路径：{region_path}\n"
                 f"请联系管理员配置电价策略。", 
                 404
             )
+        return region_id, resolved
+    
+    @staticmethod
+    def match_policy(bill_month, user_id):
+        """
+        匹配账单月份对应的价格政策（支持从上级片区继承）
+        :param bill_month: 账单月份（datetime对象，通常是月初第一天）
+        :param user_id: 用户ID
+        :return: 与该月有重合的所有有效政策列表
+        """
+        region_id, resolved = BillServices._resolve_user_policies(bill_month, user_id)
+        month_start, month_end = resolved.month_start, resolved.month_end
         
         # 返回政策列表及其有效期信息
+        region_tree = RegionTree.get()
         policy_list = []
-        for policy in policies:
+        for policy in resolved.policies:
             # 计算该政策在这个月的实际有效时间段
-            effective_start = max(policy.start_time, month_start)
-            effective_end = min(policy.end_time if policy.end_time else month_end, month_end)
+            effective_start = max(policy["start_time"], month_start)
+            effective_end = min(policy["end_time"] if policy["end_time"] else month_end, month_end)
             
             # 获取策略所属的片区信息
-            policy_region = Region.query.get(policy.region_id)
-            is_inherited = policy.region_id != region_id  # 是否是从上级片区继承的
+            policy_region_name = region_tree.name(policy["region_id"])
+            is_inherited = policy["region_id"] != region_id  # 是否是从上级片区继承的
             
             policy_list.append({
-                "policy_id": policy.id,
-                "policy_name": policy.policy_name,
-                "price_type": policy.price_type.name,
-                "region_id": policy.region_id,
-                "region_name": policy_region.region_name if policy_region else "未知片区",
+                "policy_id": policy["policy_id"],
+                "policy_name": policy["policy_name"],
+                "price_type": policy["price_type"].name,
+                "region_id": policy["region_id"],
+                "region_name": policy_region_name or "未知片区",
                 "is_inherited": is_inherited,  # 标记是否从上级片区继承
-                "start_time": policy.start_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "end_time": policy.end_time.strftime("%Y-%m-%d %H:%M:%S") if policy.end_time else None,
+                "start_time": policy["start_time"].strftime("%Y-%m-%d %H:%M:%S"),
+                "end_time": policy["end_time"].strftime("%Y-%m-%d %H:%M:%S") if policy["end_time"] else None,
                 "effective_start": effective_start.strftime("%Y-%m-%d %H:%M:%S"),
                 "effective_end": effective_end.strftime("%Y-%m-%d %H:%M:%S"),
                 "effective_days": (effective_end - effective_start).days
             })
         
-        # 获取用户片区信息
-        user_region = Region.query.get(region_id)
-        
         return {
             "bill_month": month_start.strftime("%Y-%m"),
             "month_start": month_start.strftime("%Y-%m-%d"),
             "month_end": month_end.strftime("%Y-%m-%d"),
             "user_region_id": region_id,
-            "user_region_name": user_region.region_name if user_region else "未知片区",
+            "user_region_name": region_tree.name(region_id) or "未知片区",
             "policies": policy_list,
             "policy_count": len(policy_list),
             "has_inherited_policy": any(p["is_inherited"] for p in policy_list)
@@ -258,7 +235,7 @@ class BillServices:
         :param meter_id: 电表ID
         :return: 生成的账单信息
         """
-        from ..models import IoTData, LadderPriceRules, TimeSharePriceRules, PriceType, LadderLevel, TimePeriod, BillStatus
+        from ..models import IoTData, BillStatus
         from flask import current_app
         
         # 1. 验证电表和用户
@@ -288,12 +265,9 @@ class BillServices:
         if existing_bill:
             raise BusinessException(f"{month_start.strftime('%Y年%m月')}的账单已存在", 400)
         
-        # 2. 获取该月的所有价格政策（已按时间排序）
-        policy_result = BillServices.match_policy(month_start, meter.user_id)
-        policies_info = policy_result["policies"]
-        
-        if not policies_info:
-            raise BusinessException("未找到有效的价格政策", 404)
+        # 2. 获取该月的所有价格政策（已按时间排序，预编译结果按(片区, 月份)缓存）
+        _, resolved = BillServices._resolve_user_policies(month_start, meter.user_id)
+        tariffs = resolved.tariffs
         
         # 3. 查询该月的所有IoT数据
         iot_data_list = IoTData.query.filter(
@@ -308,110 +282,16 @@ class BillServices:
         # 4. 计算总用电量
         total_electricity = iot_data_list[-1].electricity - iot_data_list[0].electricity
         
-        # 5. 准备存储账单详情
-        bill_details_data = []
-        total_amount = 0.0
-        
-        # 当月累计用电量（用于阶梯判断）
-        accumulated_electricity = 0.0
-        
-        # 6. 按时间顺序处理每条IoT数据，毕竟不能确保是连续的，因此只能一条一条处理
-        for i in range(len(iot_data_list) - 1):
-            current_iot = iot_data_list[i]
-            next_iot = iot_data_list[i + 1]
-            
-            # 计算这个时段的用电量
-            period_electricity = next_iot.electricity - current_iot.electricity
-            if period_electricity <= 0:
-                continue
-            
-            # 更新累计用电量
-            accumulated_electricity += period_electricity
-            
-            # 确定该时段使用的政策
-            current_time = current_iot.collect_time
-            applicable_policy = None
-            
-            for policy_info in policies_info:
-                policy_start = datetime.strptime(policy_info["effective_start"], "%Y-%m-%d %H:%M:%S")
-                policy_end = datetime.strptime(policy_info["effective_end"], "%Y-%m-%d %H:%M:%S")
-                
-                if policy_start <= current_time < policy_end:
-                    applicable_policy = PricePolicy.query.get(policy_info["policy_id"])
-                    break
-            
-            if not applicable_policy:
-                # 记录日志但不阻塞计费流程
-                continue
-            
-            # 7. 根据政策类型计算单价
-            base_price = applicable_policy.base_unit_price
-            time_ratio = 1.0
-            ladder_ratio = 1.0
-            time_period = None
-            ladder_level = None
-            
-            # 获取时段比率（分时电价）
-            if applicable_policy.price_type in [PriceType.time_share, PriceType.combined]:
-                time_rules = TimeSharePriceRules.query.filter_by(policy_id=applicable_policy.id).all()
-                current_hour = current_time.hour
-                
-                for rule in time_rules:
-                    if rule.start_hour <= current_hour < rule.end_hour:
-                        time_ratio = rule.ratio
-                        time_period = rule.time_period
-                        break
-            
-            # 获取阶梯比率（阶梯电价，基于月累计用电量）
-            if applicable_policy.price_type in [PriceType.ladder, PriceType.combined]:
-                ladder_rules = LadderPriceRules.query.filter_by(
-                    policy_id=applicable_policy.id
-                ).order_by(LadderPriceRules.min_electricity).all()
-                
-                for rule in ladder_rules:
-                    if rule.min_electricity <= accumulated_electricity:
-                        if rule.max_electricity is None or accumulated_electricity < rule.max_electricity:
-                            ladder_ratio = rule.ratio
-                            ladder_level = rule.ladder_level
-                            break
-            
-            # 计算该时段的单价和金额
-            unit_price = base_price * time_ratio * ladder_ratio
-            amount = period_electricity * unit_price
-            
-            # 8. 创建账单详情数据
-            detail_key = (applicable_policy.price_type, time_period, ladder_level, unit_price)
-            
-            # 查找是否已有相同类型的详情（合并同类项）
-            existing_detail = None
-            for detail in bill_details_data:
-                if (detail["policy_id"] == applicable_policy.id and
-                    detail["detail_type"] == applicable_policy.price_type and
-                    detail["time_period"] == time_period and
-                    detail["ladder_level"] == ladder_level and
-                    abs(detail["unit_price"] - unit_price) < 0.0001):
-                    existing_detail = detail
-                    break
-            
-            if existing_detail:
-                # 合并到已有详情
-                existing_detail["electricity"] += period_electricity
-                existing_detail["amount"] += amount
-            else:
-                # 创建新的详情
-                bill_details_data.append({
-                    "policy_id": applicable_policy.id,
-                    "detail_type": applicable_policy.price_type,
-                    "time_period": time_period,
-                    "ladder_level": ladder_level,
-                    "electricity": period_electricity,
-                    "unit_price": unit_price,
-                    "amount": amount
-                })
-            
-            total_amount += amount
+        # 5. 向量化内核计费（逐段累计阶梯用电量，按时段和阶梯合并账单详情）
+        collect_times = np.array([iot.collect_time for iot in iot_data_list], dtype="datetime64[us]")
+        electricity = np.array([iot.electricity for iot in iot_data_list], dtype=np.float64)
+        total_amount, bill_details_data = PricingKernel.price(collect_times, electricity, resolved.tariff_arrays)
+        if current_app.config.get("BILLING_KERNEL_PARITY_CHECK", False):
+            total_amount, bill_details_data = BillServices._check_pricing_parity(
+                meter_id, collect_times, electricity, tariffs, (total_amount, bill_details_data)
+            )
         
-        # 9. 创建账单
+        # 6. 创建账单
         due_date = month_end + timedelta(days=15)  # 账单到期日为次月15日
         
         new_bill = Bill(
@@ -420,7 +300,7 @@ class BillServices:
             bill_month=month_start,
             total_amount=round(total_amount, 2),
             total_electricity=round(total_electricity, 2),
-            policy_id=policies_info[0]["policy_id"],  # 主要政策ID
+            policy_id=tariffs[0].policy_id,  # 主要政策ID
             status=BillStatus.unpaid,
             due_date=due_date
         )
@@ -428,7 +308,7 @@ class BillServices:
         db.session.add(new_bill)
         db.session.flush()  # 获取bill_id
         
-        # 10. 创建账单详情
+        # 7. 创建账单详情
         for detail_data in bill_details_data:
             bill_detail = BillDetail(
                 bill_id=new_bill.id,
@@ -464,7 +344,7 @@ class BillServices:
             )
             raise BusinessException("账单创建失败", 500)
         
-        # 11. 返回账单信息
+        # 8. 返回账单信息
         return {
             "success": True,
             "bill_info": {
@@ -492,6 +372,313 @@ class BillServices:
             ]
         }
     
+    @staticmethod
+    def _check_pricing_parity(meter_id, collect_times, electricity, tariffs, kernel_result):
+        """
+        计费内核一致性校验（BILLING_KERNEL_PARITY_CHECK开启时使用）：
+        用逐段计费的参考实现重新计算，结果不一致时记录日志并以参考实现为准
+        :return: (total_amount, bill_details_data)
+        """
+        reference_result = BillServices._price_readings(
+            list(zip(collect_times.tolist(), electricity.tolist())), tariffs
+        )
+        if reference_result != kernel_result:
+            create_log(
+                operator_id=None,
+                operator_name="系统",
+                log_type=LogType.WARNING,
+                module="账单管理",
+                action=f"计费内核结果与参考实现不一致：电表{meter_id}",
+                error_message=f"kernel={kernel_result[0]}, reference={reference_result[0]}",
+                log_level=LogLevel.WARNING
+            )
+            return reference_result
+        return kernel_result
+    
+    @staticmethod
+    def _price_readings(readings, tariffs):
+        """
+        按读数逐段计费的参考实现（纯内存查表，计费规则与原逐段匹配规则一致），
+        用于校验向量化计费内核PricingKernel的结果
+        :param readings: 按采集时间排序的读数[(collect_time, electricity)]
+        :param tariffs: 账单月份内有效政策的CompiledTariff列表
+        :return: (total_amount, bill_details_data)
+        """
+        details = {}
+        total_amount = 0.0
+        accumulated_electricity = 0.0
+        
+        for i in range(len(readings) - 1):
+            current_time, current_value = readings[i]
+            period_electricity = readings[i + 1][1] - current_value
+            if period_electricity <= 0:
+                continue
+            
+            # 累计用电量在匹配政策之前更新
+            accumulated_electricity += period_electricity
+            
+            tariff = CompiledTariff.select(tariffs, current_time)
+            if tariff is None:
+                # 没有适用政策的时段不计费
+                continue
+            
+            unit_price, time_period, ladder_level = tariff.price(current_time.hour, accumulated_electricity)
+            amount = period_electricity * unit_price
+            
+            # 合并同类项：同一政策、时段、阶梯、单价的详情累加
+            key = (tariff.policy_id, tariff.price_type, time_period, ladder_level, unit_price)
+            detail = details.get(key)
+            if detail:
+                detail["electricity"] += period_electricity
+                detail["amount"] += amount
+            else:
+                details[key] = {
+                    "policy_id": tariff.policy_id,
+                    "detail_type": tariff.price_type,
+                    "time_period": time_period,
+                    "ladder_level": ladder_level,
+                    "electricity": period_electricity,
+                    "unit_price": unit_price,
+                    "amount": amount
+                }
+            
+            total_amount += amount
+        
+        return total_amount, list(details.values())
+    
+    @staticmethod
+    def batch_create_bills(bill_month, region_id=None, meter_ids=None):
+        """
+        批量生成月度账单（片区级计费流水线）：
+        1. 每个用户片区只解析一次电价政策，预编译的查找表按(片区, 月份)缓存，跨分块、跨批次复用
+        2. 按(电表, 采集时间)顺序流式读取读数，每个分块一次调用向量化内核计费
+        3. 账单和账单详情按分块批量插入，每个分块一个事务
+        4. 写入前锁定本块电表并重新检查已有账单，账单按(电表, 月份)唯一键INSERT IGNORE写入，重复执行或多个任务重叠时不会生成重复账单
+        :param bill_month: 账单月份（datetime对象，月初第一天）
+        :param region_id: 片区ID（可选，包含所有子片区；不传则处理全部电表）
+        :param meter_ids: 限定处理的电表ID列表（可选，供分块任务使用）
+        :return: 批量生成结果
+        """
+        from ..models import IoTData, BillStatus
+        from flask import current_app
+        from .analyze_service import AnalyzeServices
+        
+        if isinstance(bill_month, str):
+            bill_month = datetime.strptime(bill_month, "%Y-%m-%d")
+        month_start = bill_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if month_start.month == 12:
+            month_end = month_start.replace(year=month_start.year + 1, month=1)
+        else:
+            month_end = month_start.replace(month=month_start.month + 1)
+        due_date = month_end + timedelta(days=15)  # 账单到期日为次月15日
+        
+        # 1. 待计费电表及其用户片区
+        meter_query = db.session.query(
+            Meter.id, Meter.meter_code, Meter.user_id, User.region_id.label("user_region_id")
+        ).outerjoin(User, User.id == Meter.user_id)
+        if region_id is not None:
+            if not RegionTree.get().exists(region_id):
+                raise BusinessException("片区不存在", 404)
+            meter_query = meter_query.filter(Meter.region_id.in_(AnalyzeServices._get_all_sub_regions(region_id)))
+        if meter_ids is not None:
+            meter_query = meter_query.filter(Meter.id.in_(meter_ids))
+        meters = meter_query.order_by(Meter.id).all()
+        
+        existing_meter_ids = set()
+        if meters:
+            existing_meter_ids = {
+                row.meter_id for row in db.session.query(Bill.meter_id).filter(
+                    Bill.bill_month == month_start,
+                    Bill.meter_id.in_([meter.id for meter in meters])
+                ).all()
+            }
+        
+        failed = []
+        skipped_count = 0
+        billable = []
+        for meter in meters:
+            if meter.id in existing_meter_ids:
+                skipped_count += 1
+            elif not meter.user_id:
+                failed.append({"meter_id": meter.id, "meter_code": meter.meter_code, "error": "电表未绑定用户"})
+            elif not meter.user_region_id:
+                failed.append({"meter_id": meter.id, "meter_code": meter.meter_code, "error": "用户未分配片区"})
+            else:
+                billable.append(meter)
+        
+        # 2. 每个用户片区解析一次政策（按(片区, 月份)缓存，未命中的片区规则一次性加载）
+        cache_before = PolicyResolver.stats()
+        region_resolved = PolicyResolver.resolve_many({meter.user_region_id for meter in billable}, month_start)
+        cache_after = PolicyResolver.stats()
+        region_tariffs = {
+            user_region_id: resolved.tariffs for user_region_id, resolved in region_resolved.items()
+        }
+        region_tariff_arrays = {
+            user_region_id: resolved.tariff_arrays for user_region_id, resolved in region_resolved.items()
+        }
+        parity_check = current_app.config.get("BILLING_KERNEL_PARITY_CHECK", False)
+        
+        # 3. 分块流式读取读数、内存计费、批量写入
+        chunk_size = current_app.config.get("BILL_BATCH_CHUNK_SIZE", 1000)
+        created_bills = []
+        for offset in range(0, len(billable), chunk_size):
+            chunk = {meter.id: meter for meter in billable[offset:offset + chunk_size]}
+            
+            readings_stream = db.session.execute(
+                db.select(IoTData.meter_id, IoTData.collect_time, IoTData.electricity)
+                .where(
+                    IoTData.meter_id.in_(list(chunk)),
+                    IoTData.collect_time >= month_start,
+                    IoTData.collect_time < month_end
+                )
+                .order_by(IoTData.meter_id, IoTData.collect_time)
+                .execution_options(yield_per=5000)
+            )
+            readings = np.fromiter((tuple(row) for row in readings_stream), dtype=READING_DTYPE)
+            
+            # 整个分块一次调用向量化内核计费
+            priced = PricingKernel.price_region(readings, {
+                meter_id: region_tariff_arrays[meter.user_region_id]
+                for meter_id, meter in chunk.items()
+            })
+            
+            bill_rows = []
+            details_by_meter = {}
+            for meter_id, result in priced.items():
+                meter = chunk[meter_id]
+                if result["data_points"] < 2:
+                    failed.append({"meter_id": meter_id, "meter_code": meter.meter_code, "error": "该月用电数据不足，无法生成账单"})
+                    continue
+                tariffs = region_tariffs[meter.user_region_id]
+                if not tariffs:
+                    failed.append({"meter_id": meter_id, "meter_code": meter.meter_code, "error": f"未找到{month_start.strftime('%Y年%m月')}符合条件的价格策略"})
+                    continue
+                
+                total_amount, details = result["total_amount"], result["details"]
+                if parity_check:
+                    meter_readings = readings[readings["meter_id"] == meter_id]
+                    total_amount, details = BillServices._check_pricing_parity(
+                        meter_id, meter_readings["collect_time"], meter_readings["electricity"],
+                        tariffs, (total_amount, details)
+                    )
+                
+                bill_rows.append({
+                    "user_id": meter.user_id,
+                    "meter_id": meter_id,
+                    "bill_month": month_start,
+                    "total_amount": round(total_amount, 2),
+                    "total_electricity": round(result["last_reading"] - result["first_reading"], 2),
+                    "policy_id": tariffs[0].policy_id,  # 主要政策ID
+                    "status": BillStatus.unpaid,
+                    "due_date": due_date,
+                    "create_time": datetime.now()
+                })
+                details_by_meter[meter_id] = details
+            
+            for meter_id, meter in chunk.items():
+                if meter_id not in priced:
+                    failed.append({"meter_id": meter_id, "meter_code": meter.meter_code, "error": "该月用电数据不足，无法生成账单"})
+            
+            if not bill_rows:
+                continue
+            
+            try:
+                # 锁定本块电表，加锁读取最新已提交的账单：与其他批量任务重叠时，后到的任务跳过已生成的账单
+                chunk_meter_ids = [row["meter_id"] for row in bill_rows]
+                db.session.query(Meter.id).filter(Meter.id.in_(chunk_meter_ids)).with_for_update().all()
+                taken_meter_ids = {
+                    row.meter_id for row in db.session.query(Bill.meter_id).filter(
+                        Bill.bill_month == month_start,
+                        Bill.meter_id.in_(chunk_meter_ids)
+                    ).with_for_update().all()
+                }
+                if taken_meter_ids:
+                    skipped_count += len(taken_meter_ids)
+                    bill_rows = [row for row in bill_rows if row["meter_id"] not in taken_meter_ids]
+                    details_by_meter = {
+                        meter_id: details for meter_id, details in details_by_meter.items()
+                        if meter_id not in taken_meter_ids
+                    }
+                    if not bill_rows:
+                        db.session.rollback()
+                        continue
+                
+                # 唯一键兜底：未加锁的写入（如单个生成账单）与本块冲突时整块回滚，不会把详情挂到别的账单上
+                inserted = db.session.execute(insert(Bill).prefix_with("IGNORE").values(bill_rows)).rowcount
+                if inserted != len(bill_rows):
+                    raise BusinessException("部分账单已被其他任务生成", 409)
+                bill_ids = dict(
+                    db.session.query(Bill.meter_id, Bill.id).filter(
+                        Bill.bill_month == month_start,
+                        Bill.meter_id.in_([row["meter_id"] for row in bill_rows])
+                    ).all()
+                )
+                detail_rows = [
+                    {
+                        "bill_id": bill_ids[meter_id],
+                        "detail_type": detail["detail_type"],
+                        "ladder_level": detail["ladder_level"],
+                        "time_period": detail["time_period"],
+                        "electricity": round(detail["electricity"], 2),
+                        "unit_price": round(detail["unit_price"], 4),
+                        "amount": round(detail["amount"], 2)
+                    }
+                    for meter_id, details in details_by_meter.items()
+                    for detail in details
+                ]
+                if detail_rows:
+                    db.session.execute(insert(BillDetail), detail_rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                create_log(
+                    operator_id=None,
+                    operator_name="系统",
+                    log_type=LogType.ERROR,
+                    module="账单管理",
+                    action=f"批量账单写入失败：月份{month_start.strftime('%Y-%m')}，电表{bill_rows[0]['meter_id']}-{bill_rows[-1]['meter_id']}",
+                    error_message=str(e),
+                    log_level=LogLevel.ERROR
+                )
+                failed.extend(
+                    {"meter_id": row["meter_id"], "meter_code": chunk[row["meter_id"]].meter_code, "error": "账单创建失败"}
+                    for row in bill_rows
+                )
+                continue
+            
+            created_bills.extend(
+                {
+                    "bill_id": bill_ids[row["meter_id"]],
+                    "meter_id": row["meter_id"],
+                    "user_id": row["user_id"],
+                    "total_electricity": row["total_electricity"],
+                    "total_amount": row["total_amount"]
+                }
+                for row in bill_rows
+            )
+        
+        create_log(
+            operator_id=None,
+            operator_name="系统",
+            log_type=LogType.CREATE,
+            module="账单管理",
+            action=f"批量账单生成完成：月份{month_start.strftime('%Y-%m')}，成功{len(created_bills)}条，"
+                   f"跳过{skipped_count}条，失败{len(failed)}条",
+            log_level=LogLevel.INFO
+        )
+        
+        return {
+            "bill_month": month_start.strftime("%Y-%m"),
+            "total_count": len(meters),
+            "success_count": len(created_bills),
+            "skipped_count": skipped_count,
+            "failed_count": len(failed),
+            "policy_cache_hits": cache_after["hits"] - cache_before["hits"],
+            "policy_cache_misses": cache_after["misses"] - cache_before["misses"],
+            "bills": created_bills,
+            "failed": failed
+        }
+    
     @staticmethod
     def pay_bill(bill_id, user_id, payment_amount, payment_method="online"):
         """
@@ -737,20 +924,29 @@ class BillServices:
         }
     
     @staticmethod
-    def update_overdue_bills():
+    def update_overdue_bills(meter_ids=None, set_based=False):
         """
         更新逾期账单状态（定时任务调用）
+        :param meter_ids: 限定处理的电表ID列表（可选，供分块任务使用）
+        :param set_based: 是否使用集合模式（一条UPDATE更新全部逾期账单，逾期通知批量写入，适用于夜间定时任务）
         :return: 更新结果统计
         """
-        from ..models import BillStatus
-        from flask import current_app
+        if set_based:
+            return BillServices._update_overdue_bills_set_based(meter_ids)
+        
+        from ..models import BillStatus, RoleEnum
+        from ..models.notice import NoticeType, SendChannel
+        from .notify_sevice import NotifyServices
         
         # 查询所有未付且已过期的账单
         current_time = datetime.now()
-        overdue_bills = Bill.query.filter(
+        bill_query = Bill.query.filter(
             Bill.status == BillStatus.unpaid,
             Bill.due_date < current_time
-        ).all()
+        )
+        if meter_ids is not None:
+            bill_query = bill_query.filter(Bill.meter_id.in_(meter_ids))
+        overdue_bills = bill_query.all()
         
         updated_count = 0
         notification_count = 0
@@ -758,20 +954,17 @@ class BillServices:
         for bill in overdue_bills:
             # 更新状态为逾期
             bill.status = BillStatus.overdue
-            bill.overdue_time = current_time
             updated_count += 1
             
             # 发送欠费提醒
             try:
                 user = User.query.get(bill.user_id)
                 if user:
-                    from services.notify_sevice import NotifyServices
-                    from ..models.notice import NoticeType, SendChannel
-                    
                     overdue_days = (current_time - bill.due_date).days
                     
                     NotifyServices.create_notification(
                         notice_type=NoticeType.OVERDUE,
+                        target_type=RoleEnum.RESIDENT,
                         targets=[user],
                         title=f"账单逾期提醒 - {bill.bill_month.strftime('%Y年%m月')}",
                         content=f"您的{bill.bill_month.strftime('%Y年%m月')}电费账单已逾期{overdue_days}天，"
@@ -823,112 +1016,220 @@ class BillServices:
             "message": f"已更新{updated_count}条逾期账单，发送{notification_count}条通知"
         }
     
+    @staticmethod
+    def _update_overdue_bills_set_based(meter_ids=None):
+        """
+        集合模式更新逾期账单：
+        1. 一次查询锁定所有未付且已过期的账单（SELECT ... FOR UPDATE），取出生成通知所需的列
+        2. 一条UPDATE按相同条件把这些账单改为逾期（MySQL不支持UPDATE ... RETURNING，由同一事务内的锁定查询提供受影响的ID）
+        3. 逾期通知一次批量插入，与状态更新在同一事务中提交
+        4. 只写一条汇总日志
+        :param meter_ids: 限定处理的电表ID列表（可选）
+        :return: 更新结果统计
+        """
+        from ..models import BillStatus, RoleEnum
+        from ..models.notice import NoticeType, SendChannel
+        from .notify_sevice import NotifyServices
+        
+        current_time = datetime.now()
+        filters = [Bill.status == BillStatus.unpaid, Bill.due_date < current_time]
+        if meter_ids is not None:
+            filters.append(Bill.meter_id.in_(meter_ids))
+        
+        try:
+            # 1. 锁定待更新账单，之后到提交前其他事务无法修改这些账单（例如同时支付）
+            rows = db.session.execute(
+                select(Bill.id, Bill.user_id, Bill.bill_month, Bill.total_amount, Bill.due_date)
+                .where(*filters)
+                .with_for_update()
+            ).all()
+            
+            if not rows:
+                db.session.rollback()
+                return {
+                    "success": True,
+                    "mode": "set_based",
+                    "updated_count": 0,
+                    "notification_count": 0,
+                    "message": "没有需要更新的逾期账单"
+                }
+            
+            # 2. 一条UPDATE更新全部逾期账单
+            updated_count = db.session.execute(
+                update(Bill).where(*filters).values(status=BillStatus.overdue),
+                execution_options={"synchronize_session": False}
+            ).rowcount
+            
+            # 3. 批量写入逾期通知
+            notifications = []
+            for row in rows:
+                month_text = row.bill_month.strftime('%Y年%m月')
+                notifications.append({
+                    "notify_type": NoticeType.OVERDUE,
+                    "target_type": RoleEnum.RESIDENT,
+                    "target_id": row.user_id,
+                    "related_id": row.id,
+                    "title": f"账单逾期提醒 - {month_text}",
+                    "content": f"您的{month_text}电费账单已逾期{(current_time - row.due_date).days}天，"
+                               f"应付金额：{row.total_amount}元，请尽快支付，避免影响用电。",
+                    "send_channel": SendChannel.INNER,
+                    "send_time": current_time
+                })
+            notification_count = NotifyServices.bulk_create_notifications(notifications, commit=False)
+            
+            db.session.commit()
+        except BusinessException:
+            raise
+        except Exception as e:
+            db.session.rollback()
+            create_log(
+                operator_id=None,
+                operator_name="系统",
+                log_type=LogType.ERROR,
+                module="账单管理",
+                action=f"集合模式逾期账单更新失败",
+                error_message=str(e),
+                log_level=LogLevel.ERROR
+            )
+            raise BusinessException("逾期账单更新失败", 500)
+        
+        # 4. 汇总日志
+        create_log(
+            operator_id=None,
+            operator_name="系统",
+            log_type=LogType.UPDATE,
+            module="账单管理",
+            action=f"集合模式逾期账单状态更新完成：更新{updated_count}条，发送通知{notification_count}条",
+            log_level=LogLevel.INFO
+        )
+        
+        return {
+            "success": True,
+            "mode": "set_based",
+            "updated_count": updated_count,
+            "notification_count": notification_count,
+            "message": f"已更新{updated_count}条逾期账单，发送{notification_count}条通知"
+        }
+    
     @staticmethod
     def send_arrears_reminder(user_id=None, region_id=None):
         """
-        发送欠费催收提醒
+        发送欠费催收提醒：
+        1. 一次关联查询取出欠费账单，窗口函数同时返回每个用户的欠费笔数和欠费总额
+        2. 按用户顺序读取结果生成通知内容，不再逐用户查询
+        3. 全部通知一次批量插入，在同一事务中提交
         :param user_id: 指定用户ID（可选）
         :param region_id: 指定片区ID（可选）
         :return: 发送结果
         """
-        from ..models import BillStatus
-        from flask import current_app
-        
-        # 构建查询
-        query = Bill.query.filter(Bill.status.in_([BillStatus.unpaid, BillStatus.overdue]))
+        from ..models import BillStatus, RoleEnum
+        from ..models.notice import NoticeType, SendChannel
+        from .notify_sevice import NotifyServices
         
+        filters = [Bill.status.in_([BillStatus.unpaid, BillStatus.overdue])]
         if user_id:
-            query = query.filter_by(user_id=user_id)
+            filters.append(Bill.user_id == user_id)
         elif region_id:
-            # 查询该片区所有用户的欠费账单
-            users_in_region = User.query.filter_by(region_id=region_id).all()
-            user_ids = [u.id for u in users_in_region]
-            query = query.filter(Bill.user_id.in_(user_ids))
-        
-        overdue_bills = query.all()
+            # 该片区所有用户的欠费账单
+            filters.append(User.region_id == region_id)
+        
+        partition = {"partition_by": Bill.user_id}
+        rows = db.session.execute(
+            select(
+                Bill.user_id, Bill.bill_month, Bill.total_amount, Bill.status,
+                func.count().over(**partition).label("bill_count"),
+                func.sum(Bill.total_amount).over(**partition).label("total_arrears")
+            ).join(
+                User, User.id == Bill.user_id
+            ).where(
+                *filters
+            ).order_by(
+                Bill.user_id, Bill.bill_month
+            )
+        ).all()
         
-        if not overdue_bills:
+        if not rows:
             return {
                 "success": True,
                 "message": "没有欠费账单需要催收",
                 "sent_count": 0
             }
         
-        # 按用户分组
-        user_bills = {}
-        for bill in overdue_bills:
-            if bill.user_id not in user_bills:
-                user_bills[bill.user_id] = []
-            user_bills[bill.user_id].append(bill)
-        
-        sent_count = 0
+        # 按用户生成催收通知
         current_time = datetime.now()
-        
-        for user_id, bills in user_bills.items():
-            user = User.query.get(user_id)
-            if not user:
-                continue
-            
-            # 计算总欠费金额
-            total_arrears = sum(bill.total_amount for bill in bills)
-            
-            # 构建账单列表
+        notifications = []
+        for target_id, user_rows in groupby(rows, key=lambda row: row.user_id):
+            user_rows = list(user_rows)
             bill_list = "\n".join([
-                f"- {bill.bill_month.strftime('%Y年%m月')}：{bill.total_amount}元（{bill.status.name}）"
-                for bill in bills
+                f"- {row.bill_month.strftime('%Y年%m月')}：{row.total_amount}元（{row.status.name}）"
+                for row in user_rows
             ])
-            
-            try:
-                from services.notify_sevice import NotifyServices
-                from ..models.notice import NoticeType, SendChannel
-                
-                NotifyServices.create_notification(
-                    notice_type=NoticeType.ARREARS,
-                    targets=[user],
-                    title="电费欠费催收提醒",
-                    content=f"尊敬的用户，您有{len(bills)}笔电费账单未支付，"
-                           f"总计欠费：{total_arrears:.2f}元。\n\n账单明细：\n{bill_list}\n\n"
+            notifications.append({
+                "notify_type": NoticeType.ARREARS,
+                "target_type": RoleEnum.RESIDENT,
+                "target_id": target_id,
+                "title": "电费欠费催收提醒",
+                "content": f"尊敬的用户，您有{user_rows[0].bill_count}笔电费账单未支付，"
+                           f"总计欠费：{user_rows[0].total_arrears:.2f}元。\n\n账单明细：\n{bill_list}\n\n"
                            f"请尽快支付，避免影响正常用电。",
-                    send_channel=SendChannel.INNER,
-                    send_time=current_time,
-                    is_batch=False
-                )
-                sent_count += 1
-            except Exception as e:
-                create_log(
-                    operator_id=None,
-                    operator_name="系统",
-                    log_type=LogType.ERROR,
-                    module="账单管理",
-                    action=f"发送催收通知失败：用户{user_id}",
-                    error_message=str(e),
-                    log_level=LogLevel.ERROR
-                )
+                "send_channel": SendChannel.INNER,
+                "send_time": current_time
+            })
+        
+        sent_count = NotifyServices.bulk_create_notifications(notifications)
+        
+        create_log(
+            operator_id=None,
+            operator_name="系统",
+            log_type=LogType.CREATE,
+            module="账单管理",
+            action=f"欠费催收提醒发送完成：用户{len(notifications)}个，账单{len(rows)}笔",
+            log_level=LogLevel.INFO
+        )
         
         return {
             "success": True,
             "message": f"已发送{sent_count}条欠费催收提醒",
             "sent_count": sent_count,
-            "total_users": len(user_bills),
-            "total_bills": len(overdue_bills)
+            "total_users": len(notifications),
+            "total_bills": len(rows)
         }
     
     @staticmethod
     def check_power_cutoff_warning():
         """
-        检查断电预警（欠费超7天）
+        检查断电预警（欠费超7天）：
+        1. 一次关联查询取出逾期超过7天的账单及其电表、片区、片区管理员
+        2. 按片区归并为预警清单通知片区管理员，同时给每笔账单的用户发送断电警告
+        3. 全部通知一次批量插入，在同一事务中提交
         :return: 预警结果
         """
-        from ..models import BillStatus
-        from flask import current_app
+        from ..models import BillStatus, RoleEnum
+        from ..models.notice import NoticeType, SendChannel
+        from .notify_sevice import NotifyServices
         
         current_time = datetime.now()
         cutoff_threshold = current_time - timedelta(days=7)
         
-        # 查询逾期超过7天的账单
-        critical_bills = Bill.query.filter(
-            Bill.status == BillStatus.overdue,
-            Bill.due_date < cutoff_threshold
+        # 查询逾期超过7天的账单（电表、片区、管理员一并取出）
+        manager = aliased(User)
+        critical_bills = db.session.execute(
+            select(
+                Bill.id, Bill.user_id, Bill.bill_month, Bill.total_amount, Bill.due_date,
+                Meter.meter_code, Region.id.label("region_id"), Region.region_name,
+                manager.id.label("manager_id")
+            ).outerjoin(
+                Meter, Meter.id == Bill.meter_id
+            ).outerjoin(
+                Region, Region.id == Meter.region_id
+            ).outerjoin(
+                manager, manager.id == Region.manager_id
+            ).where(
+                Bill.status == BillStatus.overdue,
+                Bill.due_date < cutoff_threshold
+            ).order_by(
+                Region.id, Bill.id
+            )
         ).all()
         
         if not critical_bills:
@@ -938,98 +1239,62 @@ class BillServices:
                 "warning_count": 0
             }
         
-        # 按片区分组
-        region_bills = {}
-        for bill in critical_bills:
-            meter = Meter.query.get(bill.meter_id)
-            if meter and meter.region_id:
-                if meter.region_id not in region_bills:
-                    region_bills[meter.region_id] = []
-                region_bills[meter.region_id].append({
-                    "bill": bill,
-                    "meter": meter,
-                    "overdue_days": (current_time - bill.due_date).days
-                })
+        notifications = []
         
-        warning_count = 0
+        # 按片区通知片区管理员
+        region_bills = {}
+        for row in critical_bills:
+            if row.region_id is not None:
+                region_bills.setdefault(row.region_id, []).append(row)
         
-        # 通知片区管理员
-        for region_id, bill_info_list in region_bills.items():
-            region = Region.query.get(region_id)
-            if not region or not region.manager_id:
-                continue
-            
-            manager = User.query.get(region.manager_id)
-            if not manager:
+        for bill_rows in region_bills.values():
+            region = bill_rows[0]
+            if region.manager_id is None:
                 continue
             
             # 构建预警列表
             warning_list = "\n".join([
-                f"- 电表{info['meter'].meter_code}：欠费{info['bill'].total_amount}元，"
-                f"逾期{info['overdue_days']}天（账单月份：{info['bill'].bill_month.strftime('%Y-%m')}）"
-                for info in bill_info_list
+                f"- 电表{row.meter_code}：欠费{row.total_amount}元，"
+                f"逾期{(current_time - row.due_date).days}天（账单月份：{row.bill_month.strftime('%Y-%m')}）"
+                for row in bill_rows
             ])
-            
-            try:
-                from services.notify_sevice import NotifyServices
-                from ..models.notice import NoticeType, SendChannel
-                
-                NotifyServices.create_notification(
-                    notice_type=NoticeType.OVERDUE,
-                    targets=[manager],
-                    title=f"断电预警 - {region.region_name}片区",
-                    content=f"以下电表欠费超过7天，需要采取断电措施：\n\n{warning_list}\n\n"
-                           f"共计{len(bill_info_list)}个电表需要处理，请及时跟进。",
-                    send_channel=SendChannel.INNER,
-                    send_time=current_time,
-                    is_batch=False
-                )
-                warning_count += 1
-            except Exception as e:
-                create_log(
-                    operator_id=None,
-                    operator_name="系统",
-                    log_type=LogType.ERROR,
-                    module="账单管理",
-                    action=f"发送断电预警失败：片区{region_id}",
-                    error_message=str(e),
-                    log_level=LogLevel.ERROR
-                )
+            notifications.append({
+                "notify_type": NoticeType.OVERDUE,
+                "target_type": RoleEnum.AREA_ADMIN,
+                "target_id": region.manager_id,
+                "title": f"断电预警 - {region.region_name}片区",
+                "content": f"以下电表欠费超过7天，需要采取断电措施：\n\n{warning_list}\n\n"
+                           f"共计{len(bill_rows)}个电表需要处理，请及时跟进。",
+                "send_channel": SendChannel.INNER,
+                "send_time": current_time
+            })
+        warning_count = len(notifications)
         
         # 同时通知用户（最后警告）
-        for bill in critical_bills:
-            user = User.query.get(bill.user_id)
-            if not user:
-                continue
-            
-            overdue_days = (current_time - bill.due_date).days
-            
-            try:
-                from services.notify_sevice import NotifyServices
-                from ..models.notice import NoticeType, SendChannel
-                
-                NotifyServices.create_notification(
-                    notice_type=NoticeType.OVERDUE,
-                    targets=[user],
-                    title="【紧急】断电警告",
-                    content=f"您的{bill.bill_month.strftime('%Y年%m月')}电费已逾期{overdue_days}天，"
-                           f"欠费金额：{bill.total_amount}元。\n\n"
+        for row in critical_bills:
+            notifications.append({
+                "notify_type": NoticeType.OVERDUE,
+                "target_type": RoleEnum.RESIDENT,
+                "target_id": row.user_id,
+                "related_id": row.id,
+                "title": "【紧急】断电警告",
+                "content": f"您的{row.bill_month.strftime('%Y年%m月')}电费已逾期{(current_time - row.due_date).days}天，"
+                           f"欠费金额：{row.total_amount}元。\n\n"
                            f"警告：如不及时支付，将采取停电措施，请立即缴费！",
-                    send_channel=SendChannel.INNER,
-                    send_time=current_time,
-                    is_batch=False,
-                    related_id=bill.id
-                )
-            except Exception as e:
-                create_log(
-                    operator_id=None,
-                    operator_name="系统",
-                    log_type=LogType.ERROR,
-                    module="账单管理",
-                    action=f"发送断电警告失败：账单{bill.id}",
-                    error_message=str(e),
-                    log_level=LogLevel.ERROR
-                )
+                "send_channel": SendChannel.INNER,
+                "send_time": current_time
+            })
+        
+        NotifyServices.bulk_create_notifications(notifications)
+        
+        create_log(
+            operator_id=None,
+            operator_name="系统",
+            log_type=LogType.CREATE,
+            module="账单管理",
+            action=f"断电预警发送完成：片区{warning_count}个，用户警告{len(critical_bills)}条",
+            log_level=LogLevel.INFO
+        )
         
         return {
             "success": True,
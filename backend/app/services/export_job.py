@@ -0,0 +1,286 @@
+#异步导出任务（后台线程生成压缩文件，支持进度查询和断点续传下载）
+from .analyze_service import AnalyzeServices
+from ..middleware import BusinessException
+from ..utils.export_util import iter_csv, iter_xlsx, XLSX_MIMETYPE
+from ..utils.redis_util import set_cache, get_cache
+from app import db
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from datetime import datetime
+import threading
+import hashlib
+import gzip
+import json
+import time
+import uuid
+import os
+
+# 每写入多少行更新一次任务进度（同时刷新心跳）
+PROGRESS_ROWS = 5000
+
+# 执行中的任务超过该时间（秒）没有心跳视为已中断（进程退出或重启），可通过EXPORT_JOB_STALE_SECONDS配置
+STALE_SECONDS = 300
+
+GZIP_MIMETYPE = "application/gzip"
+
+
+class ExportJobs:
+    """
+    异步导出任务：
+    1. 提交时同步完成权限校验，导出在后台线程池中执行，请求立即返回任务ID
+    2. CSV以gzip压缩写入本地磁盘，XLSX本身为zip压缩格式直接写入；先写临时文件，完成后原子替换
+    3. 任务状态保存在缓存中（Redis不可用时降级为进程内缓存），多进程部署时任意进程都可查询
+    4. 同一用户的相同导出请求在文件有效期内复用同一个任务和文件
+    5. 执行中的任务定期写入心跳，心跳超时的任务（执行进程已退出）视为失败，相同请求重新提交；
+       排队中的任务没有心跳，不做超时判断
+    6. 后台线程开始执行和更新进度时重新读取任务，已被标记失败或已由新任务接替的任务不再执行
+    """
+
+    _executor = None
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _get_executor():
+        """获取后台线程池（首次使用时创建）"""
+        with ExportJobs._lock:
+            if ExportJobs._executor is None:
+                ExportJobs._executor = ThreadPoolExecutor(
+                    max_workers=current_app.config.get("EXPORT_JOB_WORKERS", 2),
+                    thread_name_prefix="export-job"
+                )
+            return ExportJobs._executor
+
+    @staticmethod
+    def _ttl():
+        """导出文件有效期（秒）"""
+        return current_app.config.get("EXPORT_ARTIFACT_TTL", 3600)
+
+    @staticmethod
+    def _export_dir():
+        """导出文件目录，默认为实例目录下的exports"""
+        path = current_app.config.get("EXPORT_DIR") or os.path.join(current_app.instance_path, "exports")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def _save(job):
+        set_cache(f"export_job:{job['job_id']}", json.dumps(job, ensure_ascii=False), ExportJobs._ttl())
+
+    @staticmethod
+    def _load(job_id):
+        value = get_cache(f"export_job:{job_id}")
+        return json.loads(value) if value else None
+
+    @staticmethod
+    def _is_stale(job):
+        """执行中的任务心跳超时（执行进程已退出）"""
+        if job["status"] != "running":
+            return False
+        stale_seconds = current_app.config.get("EXPORT_JOB_STALE_SECONDS", STALE_SECONDS)
+        return time.time() - job.get("heartbeat", 0) > stale_seconds
+
+    @staticmethod
+    def _mark_stale(job):
+        """把心跳超时的任务标记为失败并保存"""
+        job["status"] = "failed"
+        job["error"] = "导出任务已中断，请重新导出"
+        job["finish_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        ExportJobs._save(job)
+        return job
+
+    @staticmethod
+    def _is_abandoned(job):
+        """任务已被标记失败（心跳超时），或相同请求已提交了新任务"""
+        stored = ExportJobs._load(job["job_id"])
+        if stored is not None and stored["status"] == "failed":
+            return True
+        if not job.get("fingerprint"):
+            return False
+        current_job_id = get_cache(f"export_job_key:{job['fingerprint']}")
+        return current_job_id is not None and current_job_id != job["job_id"]
+
+    @staticmethod
+    def _is_fresh(job):
+        """任务仍在执行（心跳未超时），或文件已生成且未过期"""
+        if job["status"] in ("pending", "running"):
+            return not ExportJobs._is_stale(job)
+        if job["status"] != "done":
+            return False
+        path = os.path.join(ExportJobs._export_dir(), job["file_name"])
+        return os.path.exists(path) and os.path.getmtime(path) + ExportJobs._ttl() > time.time()
+
+    @staticmethod
+    def submit(user_id, export_type="usage", region_id=None, start_date=None, end_date=None, format_type="csv"):
+        """
+        提交导出任务
+        :param user_id: 导出用户ID
+        :param export_type: 导出类型（usage/bill）
+        :param region_id: 片区ID（可选）
+        :param start_date: 开始日期
+        :param end_date: 结束日期
+        :param format_type: 格式类型（csv/excel）
+        :return: 任务状态
+        """
+        # 1. 权限校验和时间范围处理（与同步导出一致）
+        region_ids, start_time, end_time, headers, _ = AnalyzeServices._prepare_export(
+            user_id, export_type, region_id, start_date, end_date
+        )
+
+        # 2. 相同请求复用未过期的任务
+        fingerprint = hashlib.sha1(json.dumps(
+            [user_id, export_type, region_ids[0] if region_ids else None, start_date, end_date, format_type],
+            default=str
+        ).encode("utf-8")).hexdigest()
+        job_id = get_cache(f"export_job_key:{fingerprint}")
+        if job_id:
+            job = ExportJobs._load(job_id)
+            if job and ExportJobs._is_fresh(job):
+                job["reused"] = True
+                return job
+
+        ExportJobs._cleanup()
+
+        # 3. 创建任务并提交到后台线程池
+        job_id = uuid.uuid4().hex
+        extension = "csv.gz" if format_type == "csv" else "xlsx"
+        job = {
+            "job_id": job_id,
+            "user_id": user_id,
+            "status": "pending",
+            "export_type": export_type,
+            "format": format_type,
+            "filename": AnalyzeServices._export_filename(export_type, start_time, end_time, extension),
+            "file_name": f"{job_id}.{extension}",
+            "processed": 0,
+            "total": None,
+            "progress": 0.0,
+            "file_size": None,
+            "error": None,
+            "create_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "finish_time": None,
+            "heartbeat": time.time(),
+            "fingerprint": fingerprint
+        }
+        ExportJobs._save(job)
+        set_cache(f"export_job_key:{fingerprint}", job_id, ExportJobs._ttl())
+
+        app = current_app._get_current_object()
+        ExportJobs._get_executor().submit(
+            ExportJobs._run, app, dict(job), region_ids, start_time, end_time, headers
+        )
+        job["reused"] = False
+        return job
+
+    @staticmethod
+    def _run(app, job, region_ids, start_time, end_time, headers):
+        """在后台线程中生成导出文件"""
+        with app.app_context():
+            # 排队期间已被标记失败或已由新任务接替的任务不再执行
+            if ExportJobs._is_abandoned(job):
+                return
+            export_dir = ExportJobs._export_dir()
+            path = os.path.join(export_dir, job["file_name"])
+            temp_path = path + ".part"
+            try:
+                if job["export_type"] == "usage":
+                    query = AnalyzeServices._usage_export_query(region_ids, start_time, end_time)
+                    rows = AnalyzeServices._iter_usage_rows(region_ids, start_time, end_time)
+                else:
+                    query = AnalyzeServices._bill_export_query(region_ids, start_time, end_time)
+                    rows = AnalyzeServices._iter_bill_rows(region_ids, start_time, end_time)
+
+                job["status"] = "running"
+                job["total"] = query.order_by(None).count()
+                job["heartbeat"] = time.time()
+                ExportJobs._save(job)
+
+                rows = ExportJobs._track_progress(job, rows)
+                if job["format"] == "csv":
+                    with gzip.open(temp_path, "wb") as output:
+                        for chunk in iter_csv(headers, rows):
+                            output.write(chunk)
+                else:
+                    sheet_name = "用电数据" if job["export_type"] == "usage" else "账单数据"
+                    with open(temp_path, "wb") as output:
+                        for chunk in iter_xlsx(headers, rows, sheet_name):
+                            output.write(chunk)
+                os.replace(temp_path, path)
+
+                job["status"] = "done"
+                job["progress"] = 100.0
+                job["file_size"] = os.path.getsize(path)
+            except Exception as e:
+                current_app.logger.error(f"导出任务{job['job_id']}失败: {str(e)}")
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                job["status"] = "failed"
+                job["error"] = str(e)
+            finally:
+                db.session.remove()
+            # 执行期间已被标记失败或已由新任务接替时不覆盖任务状态
+            if job["status"] == "done" and ExportJobs._is_abandoned(job):
+                return
+            job["finish_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            ExportJobs._save(job)
+
+    @staticmethod
+    def _track_progress(job, rows):
+        """逐行转发数据，每PROGRESS_ROWS行更新一次任务进度和心跳（任务已被标记失败或已由新任务接替时中止）"""
+        for row in rows:
+            yield row
+            job["processed"] += 1
+            if job["processed"] % PROGRESS_ROWS == 0:
+                if ExportJobs._is_abandoned(job):
+                    raise BusinessException("导出任务已中断，请重新导出", 409)
+                if job["total"]:
+                    job["progress"] = round(min(job["processed"] / job["total"], 1) * 100, 2)
+                job["heartbeat"] = time.time()
+                ExportJobs._save(job)
+
+    @staticmethod
+    def _cleanup():
+        """删除过期的导出文件"""
+        export_dir = ExportJobs._export_dir()
+        expire_before = time.time() - ExportJobs._ttl()
+        for name in os.listdir(export_dir):
+            path = os.path.join(export_dir, name)
+            try:
+                if os.path.isfile(path) and os.path.getmtime(path) < expire_before:
+                    os.remove(path)
+            except OSError:
+                continue
+
+    @staticmethod
+    def get_job(user_id, job_id):
+        """
+        查询导出任务状态
+        :param user_id: 当前用户ID
+        :param job_id: 任务ID
+        :return: 任务状态
+        """
+        job = ExportJobs._load(job_id)
+        if not job or job["user_id"] != user_id:
+            raise BusinessException("导出任务不存在或已过期", 404)
+        if ExportJobs._is_stale(job):
+            return ExportJobs._mark_stale(job)
+        return job
+
+    @staticmethod
+    def get_artifact(user_id, job_id):
+        """
+        获取已完成任务的导出文件
+        :param user_id: 当前用户ID
+        :param job_id: 任务ID
+        :return: (文件路径, 下载文件名, MIME类型)
+        """
+        job = ExportJobs.get_job(user_id, job_id)
+        if job["status"] == "failed":
+            raise BusinessException(f"导出任务失败：{job['error']}", 500)
+        if job["status"] != "done":
+            raise BusinessException("导出任务尚未完成", 409)
+
+        path = os.path.join(ExportJobs._export_dir(), job["file_name"])
+        if not os.path.exists(path):
+            raise BusinessException("导出文件已过期，请重新导出", 410)
+        mimetype = GZIP_MIMETYPE if job["format"] == "csv" else XLSX_MIMETYPE
+        return path, job["filename"], mimetype
@@ -3,9 +3,12 @@ from ..models import Meter,MeterType,MeterStatus,MeterRecord,RecordType,Region,B
 from flask import current_app,session
 from datetime import datetime
 import random
+import math
 from ..middleware import BusinessException,create_log, LogType, LogLevel
 from app import db
+from sqlalchemy import func
 from .notify_sevice import NotifyServices
+from ..utils.redis_util import get_meter_reading_state, get_meter_reading_states, save_meter_reading_state
 
 class MeterServices:
     #安装电表（初始化）
@@ -239,14 +242,159 @@ class MeterServices:
             }
         }
     
+    @staticmethod
+    def _check_reading(history, new_reading, reading_time):
+        """
+        读数合理性校验（纯内存计算，不访问数据库）
+        :param history: 最近的读数列表[(collect_time, electricity)]，按采集时间倒序，最多10条
+        :param new_reading: 新读数
+        :param reading_time: 读数时间
+        :return: (is_valid, warnings)
+        """
+        warnings = []
+        is_valid = True
+        
+        if not history:
+            return is_valid, warnings
+        
+        last_time, last_value = history[0]
+        
+        # 1. 校验读数不能早于上次读数时间
+        if reading_time <= last_time:
+            warnings.append("读数时间不能早于上次读数时间")
+            is_valid = False
+        
+        # 2. 校验读数不能小于上次读数（电表读数只增不减）
+        if new_reading < last_value:
+            warnings.append(f"新读数({new_reading})不能小于上次读数({last_value})")
+            is_valid = False
+        
+        # 3. 校验读数增长是否异常（突增50%以上触发预警）
+        time_diff = (reading_time - last_time).total_seconds() / 3600  # 小时
+        if time_diff > 0 and len(history) >= 2:
+            hourly_increase = (new_reading - last_value) / time_diff
+            
+            # 历史10小时平均小时用电量
+            total_historical = 0
+            total_hours = 0
+            for i in range(len(history) - 1):
+                diff = history[i][1] - history[i + 1][1]
+                hours = (history[i][0] - history[i + 1][0]).total_seconds() / 3600
+                if hours > 0:
+                    total_historical += diff
+                    total_hours += hours
+            
+            if total_hours > 0:
+                avg_hourly = total_historical / total_hours
+                if avg_hourly > 0 and hourly_increase > avg_hourly * 1.5:
+                    warnings.append(f"读数增长异常：平均每小时{hourly_increase:.2f}度，超过历史10小时平均值({avg_hourly:.2f}度)的50%")
+                    # 异常增长不一定是错误，只是预警
+        
+        return is_valid, warnings
+    
+    @staticmethod
+    def same_reading(cached, stored):
+        """
+        判断缓存中的最近读数与数据库读回的最近读数是否为同一条：
+        collect_time为DATETIME只保存到秒，electricity为单精度FLOAT，读回值与写入值存在精度误差
+        :param cached: 缓存中的读数(collect_time, electricity)，没有时为None
+        :param stored: 数据库读回的读数(collect_time, electricity)，没有时为None
+        :return: bool
+        """
+        if cached is None or stored is None:
+            return cached is None and stored is None
+        return (
+            abs((cached[0] - stored[0]).total_seconds()) < 1
+            and math.isclose(cached[1], stored[1], rel_tol=1e-5, abs_tol=1e-3)
+        )
+    
+    @staticmethod
+    def prefetch_last_readings(meter_ids):
+        """
+        批量获取多个电表的最近读数：优先读取缓存，未命中的电表一次查询补齐并回写缓存
+        :param meter_ids: 电表ID列表
+        :return: {meter_id: [(collect_time, electricity)]}，按采集时间倒序，最多10条
+        """
+        from ..models.usage import IoTData
+        
+        if not meter_ids:
+            return {}
+        
+        histories = get_meter_reading_states(meter_ids)
+        missing_ids = [meter_id for meter_id in meter_ids if meter_id not in histories]
+        if not missing_ids:
+            return histories
+        
+        ranked = db.session.query(
+            IoTData.meter_id,
+            IoTData.collect_time,
+            IoTData.electricity,
+            func.row_number().over(
+                partition_by=IoTData.meter_id,
+                order_by=IoTData.collect_time.desc()
+            ).label("rn")
+        ).filter(
+            IoTData.meter_id.in_(missing_ids)
+        ).subquery()
+        
+        rows = db.session.query(
+            ranked.c.meter_id, ranked.c.collect_time, ranked.c.electricity
+        ).filter(
+            ranked.c.rn <= 10
+        ).order_by(ranked.c.meter_id, ranked.c.collect_time.desc()).all()
+        
+        for meter_id in missing_ids:
+            histories[meter_id] = []
+        for row in rows:
+            histories[row.meter_id].append((row.collect_time, row.electricity))
+        for meter_id in missing_ids:
+            save_meter_reading_state(meter_id, histories[meter_id])
+        
+        return histories
+    
+    @staticmethod
+    def get_reading_history(meter_id):
+        """
+        获取电表最近10条读数（滚动状态缓存，未命中时查库并回写）
+        :param meter_id: 电表ID
+        :return: [(collect_time, electricity)]，按采集时间倒序
+        """
+        from ..models.usage import IoTData
+        
+        history = get_meter_reading_state(meter_id)
+        if history is None:
+            history = [
+                (record.collect_time, record.electricity)
+                for record in IoTData.query.filter_by(meter_id=meter_id)
+                    .order_by(IoTData.collect_time.desc()).limit(10).all()
+            ]
+            save_meter_reading_state(meter_id, history)
+        return history
+    
+    @staticmethod
+    def record_accepted_readings(meter_id, readings):
+        """
+        读数写入成功后更新滚动状态缓存
+        :param meter_id: 电表ID
+        :param readings: 新写入的读数[(collect_time, electricity)]，按采集时间升序
+        """
+        history = get_meter_reading_state(meter_id)
+        if history is None:
+            # 缓存中没有状态时不做拼接，下次校验时从数据库重建
+            return
+        for reading in readings:
+            history.insert(0, reading)
+        save_meter_reading_state(meter_id, history[:10])
+    
     #电表数据校验
     @staticmethod
-    def validate_meter_reading(meter_id, new_reading, reading_time=None):
+    def validate_meter_reading(meter_id, new_reading, reading_time=None, history=None):
         """
         校验电表读数的合理性
         :param meter_id: 电表ID
         :param new_reading: 新读数
         :param reading_time: 读数时间，默认当前时间
+        :param history: 调用方已获取的最近读数（可选，不传则读取滚动状态缓存）
         :return: 校验结果
         """
         from ..models.usage import IoTData, UsageData
@@ -258,49 +406,12 @@ class MeterServices:
         if reading_time is None:
             reading_time = datetime.now()
         
-        # 获取最近一次读数
-        last_reading = IoTData.query.filter_by(meter_id=meter_id)\
-            .order_by(IoTData.collect_time.desc()).first()
+        # 获取最近10条读数（第一条即最近一次读数），优先使用滚动状态缓存
+        if history is None:
+            history = MeterServices.get_reading_history(meter_id)
         
-        warnings = []
-        is_valid = True
-        
-        if last_reading:
-            # 1. 校验读数不能早于上次读数时间
-            if reading_time <= last_reading.collect_time:
-                warnings.append("读数时间不能早于上次读数时间")
-                is_valid = False
-            
-            # 2. 校验读数不能小于上次读数（电表读数只增不减）
-            if new_reading < last_reading.electricity:
-                warnings.append(f"新读数({new_reading})不能小于上次读数({last_reading.electricity})")
-                is_valid = False
-            
-            # 3. 校验读数增长是否异常（突增50%以上触发预警）
-            time_diff = (reading_time - last_reading.collect_time).total_seconds() / 3600  # 小时
-            if time_diff > 0:
-                reading_diff = new_reading - last_reading.electricity
-                hourly_increase = reading_diff / time_diff
-                
-                # 获取历史10小时平均小时用电量
-                historical_data = IoTData.query.filter_by(meter_id=meter_id)\
-                    .order_by(IoTData.collect_time.desc()).limit(10).all()
-                
-                if len(historical_data) >= 2:
-                    total_historical = 0
-                    total_hours = 0
-                    for i in range(len(historical_data) - 1):
-                        diff = historical_data[i].electricity - historical_data[i + 1].electricity
-                        hours = (historical_data[i].collect_time - historical_data[i + 1].collect_time).total_seconds() / 3600
-                        if hours > 0:
-                            total_historical += diff
-                            total_hours += hours
-                    
-                    if total_hours > 0:
-                        avg_hourly = total_historical / total_hours
-                        if avg_hourly > 0 and hourly_increase > avg_hourly * 1.5:
-                            warnings.append(f"读数增长异常：平均每小时{hourly_increase:.2f}度，超过历史10小时平均值({avg_hourly:.2f}度)的50%")
-                            # 异常增长不一定是错误，只是预警
+        is_valid, warnings = MeterServices._check_reading(history, new_reading, reading_time)
+        last_reading = history[0] if history else None
         
         return {
             "success": True,
@@ -310,8 +421,8 @@ class MeterServices:
                 "meter_id": meter_id,
                 "new_reading": new_reading,
                 "reading_time": reading_time.strftime("%Y-%m-%d %H:%M:%S"),
-                "last_reading": last_reading.electricity if last_reading else None,
-                "last_reading_time": last_reading.collect_time.strftime("%Y-%m-%d %H:%M:%S") if last_reading else None
+                "last_reading": last_reading[1] if last_reading else None,
+                "last_reading_time": last_reading[0].strftime("%Y-%m-%d %H:%M:%S") if last_reading else None
             }
         }
     
@@ -351,11 +462,6 @@ class MeterServices:
         
         meters_list = []
         for meter in pagination.items:
-            # 获取用户信息
-            user = User.query.get(meter.user_id) if meter.user_id else None
-            # 获取片区信息
-            region = Region.query.get(meter.region_id) if meter.region_id else None
-            
             meters_list.append({
                 "meter_id": meter.id,
                 "meter_code": meter.meter_code,
@@ -390,15 +496,17 @@ class MeterServices:
         :param per_page: 每页数量
         :return: 空闲电表列表
         """
-        # 构建查询：user_id为空的电表
-        query = Meter.query.filter(Meter.user_id.is_(None))
+        # 构建查询：user_id为空的电表（片区名称随电表一起查出）
+        query = db.session.query(Meter, Region.region_name).outerjoin(
+            Region, Region.id == Meter.region_id
+        ).filter(Meter.user_id.is_(None))
         
         # 按片区筛选
         if region_id:
-            query = query.filter_by(region_id=region_id)
+            query = query.filter(Meter.region_id == region_id)
         
         # 只查询正常状态的电表
-        query = query.filter_by(status=MeterStatus.NORMAL)
+        query = query.filter(Meter.status == MeterStatus.NORMAL)
         
         # 分页
         pagination = query.order_by(Meter.install_time.desc()).paginate(
@@ -408,15 +516,14 @@ class MeterServices:
         )
         
         meters_list = []
-        for meter in pagination.items:
-            region = Region.query.get(meter.region_id)
+        for meter, region_name in pagination.items:
             meters_list.append({
                 "meter_id": meter.id,
                 "meter_code": meter.meter_code,
                 "meter_type": meter.meter_type.value,
                 "install_address": meter.install_address,
                 "install_time": meter.install_time.strftime("%Y-%m-%d %H:%M:%S") if meter.install_time else None,
-                "region_name": region.region_name if region else "未知片区",
+                "region_name": region_name or "未知片区",
                 "region_id": meter.region_id,
                 "status": meter.status.value
             })
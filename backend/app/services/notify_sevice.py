@@ -3,8 +3,10 @@ from app import db
 from ..models import NoticeStatus,Notifications,NoticeType,User,Meter,PricePolicy,Bill,RoleEnum,SendChannel
 from ..middleware import BusinessException,create_log, LogType, LogLevel
 from ..utils import send_mail
+from ..utils.pagination import keyset_paginate
 from flask_mail import Mail
 from datetime import datetime
+from sqlalchemy import insert
 import uuid
 
 class NotifyServices:
@@ -99,6 +101,52 @@ class NotifyServices:
             }
         }
     
+    @staticmethod
+    def bulk_create_notifications(rows:list,commit:bool=True)->int:
+        """
+        批量创建单发通知（一次批量插入，供定时任务等批处理场景使用）
+        :param rows: 通知列表，每项包含notify_type、target_type、target_id、related_id、title、content、send_channel、send_time
+        :param commit: 是否立即提交；为False时由调用方在同一事务中提交
+        :return: 创建的通知数量
+        """
+        if not rows:
+            return 0
+        
+        now = datetime.now()
+        values = [{
+            "notify_type": row["notify_type"],
+            "target_type": row["target_type"],
+            "target_id": row["target_id"],
+            "related_id": row.get("related_id"),
+            "title": row["title"],
+            "content": row["content"],
+            "status": NoticeStatus.PENDING,
+            "send_channel": row.get("send_channel", SendChannel.INNER),
+            "send_time": row.get("send_time", now),
+            "create_time": now,
+            "is_batch": False,
+            "batch_id": None
+        } for row in rows]
+        
+        try:
+            db.session.execute(insert(Notifications), values)
+            if commit:
+                db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            create_log(
+                operator_id=None,
+                operator_name="系统",
+                log_type=LogType.ERROR,
+                module="通知管理",
+                action=f"批量通知创建失败：{len(values)}条",
+                error_message=str(e),
+                log_level=LogLevel.ERROR
+            )
+            raise BusinessException("批量通知创建失败",500)
+        
+        return len(values)
+    
     @staticmethod
     def send_notification(mail:Mail=None,notification_id=None,batch_id=None):
         """发送通知：支持单发(notification_id)和群发(batch_id)，同时支持邮件和站内消息"""
@@ -224,7 +272,7 @@ class NotifyServices:
         }
 
     @staticmethod
-    def query_notification(user_id=None, notify_type=None, status=None, is_unread_only=False, page=1, per_page=20):
+    def query_notification(user_id=None, notify_type=None, status=None, is_unread_only=False, page=1, per_page=20, cursor=None, with_total=False):
         """
         查询通知
         :param user_id: 用户ID，查询该用户的站内信通知，如果是管理员的话随便查，如果是用户本人的话就锁定自己（user_id一开始就设定为查询用户）了，
@@ -234,6 +282,8 @@ class NotifyServices:
         :param is_unread_only: 是否只查询未读通知
         :param page: 页码
         :param per_page: 每页数量
+        :param cursor: 游标（不为None时使用游标分页，空字符串表示第一页）
+        :param with_total: 游标分页时是否统计总数
         :return: 通知列表和分页信息
         """
         query = Notifications.query.filter_by(send_channel=SendChannel.INNER)       
@@ -257,14 +307,21 @@ class NotifyServices:
                 Notifications.read_time.is_(None)
             )
         
-        # 按创建时间倒序排列
-        query = query.order_by(Notifications.create_time.desc())
-        
-        # 分页查询
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        if cursor is not None:
+            # 游标分页：按(创建时间, ID)定位下一页，不执行OFFSET
+            items, page_info = keyset_paginate(
+                query, Notifications.create_time, Notifications.id, cursor, per_page, with_total
+            )
+        else:
+            # 按创建时间倒序排列
+            query = query.order_by(Notifications.create_time.desc())
+            
+            # 分页查询
+            pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+            items = pagination.items
         
         notifications_list = []
-        for notification in pagination.items:
+        for notification in items:
             notifications_list.append({
                 "id": notification.id,
                 "notify_type": notification.notify_type.name,
@@ -282,6 +339,9 @@ class NotifyServices:
                 "batch_id": notification.batch_id
             })
         
+        if cursor is not None:
+            return {"success": True, "notifications": notifications_list, "pagination": page_info}
+        
         return {
             "success": True,
             "notifications": notifications_list,
@@ -0,0 +1,179 @@
+#生效电价政策解析缓存（按(片区, 月份)缓存预编译后的政策）
+from .tariff import CompiledTariff
+from .pricing_kernel import PricingKernel
+from ..utils.redis_util import get_cache_version, bump_cache_version
+from flask import current_app
+import threading
+import time
+
+_CACHE_NAME = "price_policy"
+_REGION_CACHE_NAME = "region_tree"
+
+
+class ResolvedPolicies:
+    """某片区某月份的生效政策（纯数据，不持有ORM对象，可跨请求、跨会话复用）"""
+
+    __slots__ = ("region_id", "month_start", "month_end", "policies", "tariffs", "tariff_arrays")
+
+    def __init__(self, region_id, month_start, month_end, policies, tariffs):
+        """
+        :param region_id: 用户片区ID
+        :param month_start: 月份开始时间
+        :param month_end: 月份结束时间
+        :param policies: 政策基本信息元组（按开始时间排序）
+        :param tariffs: CompiledTariff列表（与policies顺序一致）
+        """
+        self.region_id = region_id
+        self.month_start = month_start
+        self.month_end = month_end
+        self.policies = policies
+        self.tariffs = tariffs
+        self.tariff_arrays = PricingKernel.prepare(tariffs)
+
+
+class PolicyResolver:
+    """
+    生效电价政策解析缓存：
+    1. 以(片区ID, 月初时间)为键缓存政策继承查找和规则预编译的结果，空结果同样缓存
+    2. 条目超过POLICY_CACHE_TTL秒后过期
+    3. 电价政策或片区变更后递增缓存版本号，各进程在下次访问时清空本地缓存
+    4. 记录命中/未命中次数，用于确认批量计费是否命中缓存
+    """
+
+    _entries = {}
+    _versions = None
+    _lock = threading.Lock()
+    _stats = {"hits": 0, "misses": 0, "evictions": 0, "invalidations": 0}
+
+    @staticmethod
+    def month_range(bill_month):
+        """
+        计算月份的时间范围
+        :param bill_month: 月份内任意时间
+        :return: (month_start, month_end)，左闭右开
+        """
+        month_start = bill_month.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if month_start.month == 12:
+            month_end = month_start.replace(year=month_start.year + 1, month=1)
+        else:
+            month_end = month_start.replace(month=month_start.month + 1)
+        return month_start, month_end
+
+    @staticmethod
+    def resolve(region_id, bill_month):
+        """
+        解析片区某月份的生效政策
+        :param region_id: 用户片区ID
+        :param bill_month: 账单月份（月份内任意时间）
+        :return: ResolvedPolicies，没有政策时policies为空
+        """
+        return PolicyResolver.resolve_many([region_id], bill_month)[region_id]
+
+    @staticmethod
+    def resolve_many(region_ids, bill_month):
+        """
+        批量解析多个片区某月份的生效政策，未命中的片区规则一次性加载
+        :param region_ids: 用户片区ID列表
+        :param bill_month: 账单月份（月份内任意时间）
+        :return: {region_id: ResolvedPolicies}
+        """
+        month_start, month_end = PolicyResolver.month_range(bill_month)
+        versions = (get_cache_version(_CACHE_NAME), get_cache_version(_REGION_CACHE_NAME))
+        ttl = current_app.config.get("POLICY_CACHE_TTL", 300)
+        now = time.monotonic()
+
+        resolved = {}
+        missing = []
+        with PolicyResolver._lock:
+            if PolicyResolver._versions != versions:
+                PolicyResolver._entries.clear()
+                PolicyResolver._versions = versions
+            for region_id in dict.fromkeys(region_ids):
+                entry = PolicyResolver._entries.get((region_id, month_start))
+                if entry is not None and entry[0] > now:
+                    resolved[region_id] = entry[1]
+                    PolicyResolver._stats["hits"] += 1
+                else:
+                    missing.append(region_id)
+                    PolicyResolver._stats["misses"] += 1
+
+        if not missing:
+            return resolved
+
+        loaded = PolicyResolver._load(missing, month_start, month_end)
+        resolved.update(loaded)
+
+        with PolicyResolver._lock:
+            # 加载期间版本已变化时不写入，避免缓存旧政策
+            if PolicyResolver._versions == versions:
+                max_entries = current_app.config.get("POLICY_CACHE_MAX_ENTRIES", 4096)
+                for region_id, item in loaded.items():
+                    PolicyResolver._evict(max_entries, now)
+                    PolicyResolver._entries[(region_id, month_start)] = (now + ttl, item)
+        return resolved
+
+    @staticmethod
+    def _load(region_ids, month_start, month_end):
+        """查找政策（含上级片区继承）并预编译"""
+        from .bill_service import BillServices
+
+        region_policies = {
+            region_id: BillServices._find_region_policy(region_id, month_start, month_end) or []
+            for region_id in region_ids
+        }
+        rules_cache = CompiledTariff.load_rules(
+            policy.id for policies in region_policies.values() for policy in policies
+        )
+
+        loaded = {}
+        for region_id, policies in region_policies.items():
+            infos = tuple(
+                {
+                    "policy_id": policy.id,
+                    "policy_name": policy.policy_name,
+                    "price_type": policy.price_type,
+                    "region_id": policy.region_id,
+                    "start_time": policy.start_time,
+                    "end_time": policy.end_time
+                }
+                for policy in policies
+            )
+            tariffs = CompiledTariff.compile_policies(policies, month_start, month_end, rules_cache)
+            loaded[region_id] = ResolvedPolicies(region_id, month_start, month_end, infos, tariffs)
+        return loaded
+
+    @staticmethod
+    def _evict(max_entries, now):
+        """缓存条目达到上限时先清理过期条目，仍不足则淘汰最早写入的条目（调用方持有锁）"""
+        entries = PolicyResolver._entries
+        if len(entries) < max_entries:
+            return
+        expired = [key for key, (expire_at, _) in entries.items() if expire_at <= now]
+        for key in expired:
+            del entries[key]
+        while entries and len(entries) >= max_entries:
+            del entries[next(iter(entries))]
+            PolicyResolver._stats["evictions"] += 1
+        PolicyResolver._stats["evictions"] += len(expired)
+
+    @staticmethod
+    def invalidate():
+        """电价政策变更后调用：递增版本号并清空本进程缓存"""
+        bump_cache_version(_CACHE_NAME)
+        with PolicyResolver._lock:
+            PolicyResolver._entries.clear()
+            PolicyResolver._versions = None
+            PolicyResolver._stats["invalidations"] += 1
+
+    @staticmethod
+    def stats():
+        """
+        获取本进程的缓存统计
+        :return: 命中/未命中次数、命中率、当前条目数
+        """
+        with PolicyResolver._lock:
+            stats = dict(PolicyResolver._stats)
+            stats["size"] = len(PolicyResolver._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = round(stats["hits"] / lookups, 4) if lookups else 0.0
+        return stats
@@ -0,0 +1,157 @@
+#向量化计费内核（阶梯 + 分时电价，NumPy实现）
+from ..models import TimePeriod, LadderLevel
+import numpy as np
+
+# 时段、阶梯的整数编码，0表示无
+_PERIODS = [None] + list(TimePeriod)
+_LEVELS = [None] + list(LadderLevel)
+_PERIOD_CODES = {period: code for code, period in enumerate(_PERIODS)}
+_LEVEL_CODES = {level: code for code, level in enumerate(_LEVELS)}
+
+READING_DTYPE = np.dtype([
+    ("meter_id", np.int64),
+    ("collect_time", "datetime64[us]"),
+    ("electricity", np.float64)
+])
+
+
+class _TariffArrays:
+    """CompiledTariff的数组形式，供向量化查表使用"""
+
+    __slots__ = (
+        "tariff", "start", "end", "base_price",
+        "hour_ratio", "hour_period", "ladder_breakpoints", "ladder_ratio", "ladder_level"
+    )
+
+    def __init__(self, tariff):
+        self.tariff = tariff
+        self.start = np.datetime64(tariff.effective_start, "us")
+        self.end = np.datetime64(tariff.effective_end, "us")
+        self.base_price = tariff.base_price
+        self.hour_ratio = np.array([ratio for ratio, _ in tariff.hour_table], dtype=np.float64)
+        self.hour_period = np.array([_PERIOD_CODES[period] for _, period in tariff.hour_table], dtype=np.intp)
+        # searchsorted(side="right")返回值为0表示低于最低断点（无阶梯），i表示落在第i个断点区间
+        self.ladder_breakpoints = np.array(tariff.ladder_breakpoints, dtype=np.float64)
+        self.ladder_ratio = np.array([1.0] + [ratio for ratio, _ in tariff.ladder_values], dtype=np.float64)
+        self.ladder_level = np.array([0] + [_LEVEL_CODES[level] for _, level in tariff.ladder_values], dtype=np.intp)
+
+
+class PricingKernel:
+    """
+    向量化计费：与BillServices._price_readings逐段计费的结果完全一致
+    1. 相邻读数差值，仅保留用电量大于0的时段
+    2. cumsum计算月累计用电量（顺序累加，与逐段累加的浮点结果相同）
+    3. 按政策有效区间划分时段，小时查分时表，累计用电量用searchsorted查阶梯断点
+    4. 按(政策, 时段, 阶梯, 单价)分组求和，分组顺序为首次出现的顺序，组内按时间顺序累加
+    """
+
+    @staticmethod
+    def prepare(tariffs):
+        """将CompiledTariff列表转换为数组形式（同一批政策只需转换一次）"""
+        return [_TariffArrays(tariff) for tariff in tariffs]
+
+    @staticmethod
+    def price(collect_times, electricity, tariff_arrays):
+        """
+        计算单个电表的账单金额和账单详情
+        :param collect_times: 采集时间数组（datetime64[us]，升序）
+        :param electricity: 读数数组（float64）
+        :param tariff_arrays: prepare返回的政策数组列表（按政策开始时间排序）
+        :return: (total_amount, bill_details_data)，格式与_price_readings相同
+        """
+        deltas = np.diff(electricity)
+        positive = deltas > 0
+        period_electricity = deltas[positive]
+        if period_electricity.size == 0:
+            return 0.0, []
+
+        start_times = collect_times[:-1][positive]
+        accumulated = np.cumsum(period_electricity)
+        hours = ((start_times - start_times.astype("datetime64[D]")) // np.timedelta64(1, "h")).astype(np.intp)
+
+        # 每个时段取第一个有效区间包含其开始时间的政策
+        tariff_index = np.full(period_electricity.size, -1, dtype=np.intp)
+        for k, arrays in enumerate(tariff_arrays):
+            hit = (tariff_index < 0) & (start_times >= arrays.start) & (start_times < arrays.end)
+            tariff_index[hit] = k
+
+        unit_price = np.zeros(period_electricity.size, dtype=np.float64)
+        period_code = np.zeros(period_electricity.size, dtype=np.intp)
+        level_code = np.zeros(period_electricity.size, dtype=np.intp)
+        for k, arrays in enumerate(tariff_arrays):
+            rows = np.flatnonzero(tariff_index == k)
+            if rows.size == 0:
+                continue
+            row_hours = hours[rows]
+            slots = np.searchsorted(arrays.ladder_breakpoints, accumulated[rows], side="right")
+            unit_price[rows] = arrays.base_price * arrays.hour_ratio[row_hours] * arrays.ladder_ratio[slots]
+            period_code[rows] = arrays.hour_period[row_hours]
+            level_code[rows] = arrays.ladder_level[slots]
+
+        priced = tariff_index >= 0
+        if not priced.any():
+            return 0.0, []
+
+        electricity_priced = period_electricity[priced]
+        unit_priced = unit_price[priced]
+        amounts = electricity_priced * unit_priced
+
+        keys = np.column_stack([
+            tariff_index[priced].astype(np.float64),
+            period_code[priced].astype(np.float64),
+            level_code[priced].astype(np.float64),
+            unit_priced
+        ])
+        _, first_index, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        electricity_sums = np.bincount(inverse, weights=electricity_priced)
+        amount_sums = np.bincount(inverse, weights=amounts)
+
+        details = []
+        for group in np.argsort(first_index, kind="stable"):
+            row = first_index[group]
+            tariff = tariff_arrays[int(keys[row, 0])].tariff
+            details.append({
+                "policy_id": tariff.policy_id,
+                "detail_type": tariff.price_type,
+                "time_period": _PERIODS[int(keys[row, 1])],
+                "ladder_level": _LEVELS[int(keys[row, 2])],
+                "electricity": float(electricity_sums[group]),
+                "unit_price": float(unit_priced[row]),
+                "amount": float(amount_sums[group])
+            })
+
+        # 总金额按时间顺序累加
+        total_amount = float(np.cumsum(amounts)[-1])
+        return total_amount, details
+
+    @staticmethod
+    def price_region(readings, tariff_arrays_by_meter):
+        """
+        一次调用计算一批电表的账单
+        :param readings: 结构化数组（READING_DTYPE），按(meter_id, collect_time)排序
+        :param tariff_arrays_by_meter: {meter_id: prepare返回的政策数组列表}
+        :return: {meter_id: {"total_amount", "details", "first_reading", "last_reading", "data_points"}}
+        """
+        if readings.size == 0:
+            return {}
+
+        meter = readings["meter_id"]
+        boundaries = np.flatnonzero(meter[1:] != meter[:-1]) + 1
+        starts = np.r_[0, boundaries]
+        ends = np.r_[boundaries, meter.size]
+
+        results = {}
+        for start, end in zip(starts, ends):
+            meter_id = int(meter[start])
+            collect_times = readings["collect_time"][start:end]
+            electricity = readings["electricity"][start:end]
+            total_amount, details = PricingKernel.price(collect_times, electricity, tariff_arrays_by_meter.get(meter_id, []))
+            results[meter_id] = {
+                "total_amount": total_amount,
+                "details": details,
+                "first_reading": float(electricity[0]),
+                "last_reading": float(electricity[-1]),
+                "data_points": int(end - start)
+            }
+        return results
@@ -0,0 +1,133 @@
+#用电排名榜（按片区预先写入排名表，查询时走索引取前K名）
+from ..models import UsageData, UsageType, UsageRanking, RankingRange, Meter, Bill
+from .region_tree import RegionTree
+from .usage_engine import UsageEngine
+from app import db
+from datetime import timedelta
+from sqlalchemy import func, insert
+
+# 批量写入排名表时每批的行数
+INSERT_BATCH_SIZE = 5000
+
+
+class RankingBoard:
+    """
+    用电排名榜：
+    1. 各时间范围的用电量取已汇总的电表级UsageData（日数据或月数据），费用取该范围内账单月份的账单金额
+    2. 每个电表在自身片区及每一级上级片区、以及全部片区（region_id为空）下各写入一行
+    3. 查询某片区的前K名只需按(片区, 时间范围, 用电量/费用)索引倒序取K行，与片区大小无关
+    """
+
+    @staticmethod
+    def period_range(time_range, target_date=None):
+        """
+        计算排名时间范围
+        :param time_range: RankingRange
+        :param target_date: 参考日期（可选），默认以今天为准
+        :return: (start_time, end_time, usage_type)，左闭右开
+        """
+        if time_range == RankingRange.day:
+            start_time, end_time = UsageEngine.period_range(UsageType.DAY, target_date)
+            return start_time, end_time, UsageType.DAY
+        if time_range == RankingRange.week:
+            # 截至昨天的最近7天
+            _, end_time = UsageEngine.period_range(UsageType.DAY, target_date)
+            return end_time - timedelta(days=7), end_time, UsageType.DAY
+
+        start_time, end_time = UsageEngine.period_range(UsageType.MONTH, target_date)
+        if time_range == RankingRange.month:
+            return start_time, end_time, UsageType.MONTH
+        # 截至上个月的最近12个月
+        return end_time.replace(year=end_time.year - 1), end_time, UsageType.MONTH
+
+    @staticmethod
+    def refresh(time_range, target_date=None):
+        """
+        重建某时间范围的排名（同一事务内先删除旧排名再批量写入，刷新期间查询仍读取旧排名）
+        :param time_range: RankingRange
+        :param target_date: 参考日期（可选）
+        :return: 刷新统计
+        """
+        start_time, end_time, usage_type = RankingBoard.period_range(time_range, target_date)
+        tree = RegionTree.get()
+
+        electricity_by_meter = dict(
+            db.session.query(UsageData.meter_id, func.sum(UsageData.total_electricity)).filter(
+                UsageData.usage_type == usage_type,
+                UsageData.usage_time >= start_time,
+                UsageData.usage_time < end_time
+            ).group_by(UsageData.meter_id).all()
+        )
+        cost_by_meter = {}
+        if usage_type == UsageType.MONTH:
+            cost_by_meter = dict(
+                db.session.query(Bill.meter_id, func.sum(Bill.total_amount)).filter(
+                    Bill.bill_month >= start_time,
+                    Bill.bill_month < end_time
+                ).group_by(Bill.meter_id).all()
+            )
+
+        meter_ids = set(electricity_by_meter) | set(cost_by_meter)
+        meter_count = 0
+        row_count = 0
+        try:
+            db.session.query(UsageRanking).filter(
+                UsageRanking.time_range == time_range
+            ).delete(synchronize_session=False)
+
+            batch = []
+            ordered_ids = sorted(meter_ids)
+            for offset in range(0, len(ordered_ids), INSERT_BATCH_SIZE):
+                meters = db.session.query(Meter.id, Meter.region_id, Meter.user_id).filter(
+                    Meter.id.in_(ordered_ids[offset:offset + INSERT_BATCH_SIZE])
+                ).all()
+                for meter_id, region_id, user_id in meters:
+                    meter_count += 1
+                    scopes = [None] + (tree.ancestors(region_id) if tree.exists(region_id) else [])
+                    for scope_region_id in scopes:
+                        batch.append({
+                            "region_id": scope_region_id,
+                            "time_range": time_range,
+                            "period_start": start_time,
+                            "period_end": end_time,
+                            "meter_id": meter_id,
+                            "user_id": user_id,
+                            "total_electricity": round(electricity_by_meter.get(meter_id) or 0, 2),
+                            "total_cost": round(cost_by_meter.get(meter_id) or 0, 2)
+                        })
+                if len(batch) >= INSERT_BATCH_SIZE:
+                    db.session.execute(insert(UsageRanking), batch)
+                    row_count += len(batch)
+                    batch = []
+            if batch:
+                db.session.execute(insert(UsageRanking), batch)
+                row_count += len(batch)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {
+            "time_range": time_range.name,
+            "period_start": start_time.strftime("%Y-%m-%d"),
+            "period_end": end_time.strftime("%Y-%m-%d"),
+            "meter_count": meter_count,
+            "row_count": row_count
+        }
+
+    @staticmethod
+    def top(region_id, time_range, ranking_type, limit):
+        """
+        查询排名前K名
+        :param region_id: 片区ID，为None表示全部片区
+        :param time_range: RankingRange
+        :param ranking_type: electricity/cost
+        :param limit: 返回数量
+        :return: UsageRanking列表（已排序）
+        """
+        score = UsageRanking.total_cost if ranking_type == "cost" else UsageRanking.total_electricity
+        region_filter = UsageRanking.region_id.is_(None) if region_id is None else UsageRanking.region_id == region_id
+        return UsageRanking.query.filter(
+            region_filter,
+            UsageRanking.time_range == time_range
+        ).order_by(score.desc(), UsageRanking.id.desc()).limit(limit).all()
@@ -0,0 +1,203 @@
+#片区用电汇总刷新（按片区树自下而上累加，供管理员看板读取）
+from ..models import UsageData, RegionUsageData, Meter, Bill, BillStatus
+from .region_tree import RegionTree
+from .usage_engine import UsageEngine
+from app import db
+from datetime import datetime
+from sqlalchemy import func, insert
+
+
+class RegionRollup:
+    """
+    片区日/月用电汇总：
+    1. 一次GROUP BY按电表所属片区汇总电表级UsageData
+    2. 沿片区树把每个片区的数据累加到自身及所有上级片区，每个片区一行，数值包含全部下级片区
+    3. 电表数、用户数、欠费用户数为刷新时的快照，用户按ID去重（同一用户在多个子片区只计一次）
+    4. 读取时缺少汇总行的周期（上线前的历史数据、汇总任务尚未执行）按电表级UsageData实时计算，不当作没有用电
+    """
+
+    @staticmethod
+    def refresh(usage_type, target_date=None):
+        """
+        刷新指定周期所有片区的汇总（先删除该周期已有汇总再批量写入）
+        :param usage_type: 汇总类型（DAY/MONTH）
+        :param target_date: 目标日期，默认昨天/上月
+        :return: 刷新统计
+        """
+        start_time, end_time = UsageEngine.period_range(usage_type, target_date)
+        tree = RegionTree.get()
+
+        # 1. 各片区自身电表的用电量
+        usage_by_region = {
+            row.region_id: (row.total or 0, row.peak or 0, row.valley or 0)
+            for row in db.session.query(
+                Meter.region_id,
+                func.sum(UsageData.total_electricity).label("total"),
+                func.sum(UsageData.peak_electricity).label("peak"),
+                func.sum(UsageData.valley_electricity).label("valley")
+            ).join(
+                Meter, Meter.id == UsageData.meter_id
+            ).filter(
+                UsageData.usage_type == usage_type,
+                UsageData.usage_time >= start_time,
+                UsageData.usage_time < end_time
+            ).group_by(Meter.region_id).all()
+        }
+
+        # 2. 各片区自身的电表数、用户、欠费用户
+        meter_count_by_region = dict(
+            db.session.query(Meter.region_id, func.count(Meter.id)).group_by(Meter.region_id).all()
+        )
+        users_by_region = {}
+        for region_id, user_id in db.session.query(Meter.region_id, Meter.user_id).filter(
+            Meter.user_id.isnot(None)
+        ).distinct().all():
+            users_by_region.setdefault(region_id, set()).add(user_id)
+        arrears_by_region = {}
+        for region_id, user_id in db.session.query(Meter.region_id, Bill.user_id).join(
+            Meter, Meter.id == Bill.meter_id
+        ).filter(Bill.status == BillStatus.overdue).distinct().all():
+            arrears_by_region.setdefault(region_id, set()).add(user_id)
+
+        # 3. 沿片区树累加到所有上级片区
+        rollup = {
+            region_id: {"total": 0.0, "peak": 0.0, "valley": 0.0, "meters": 0, "users": set(), "arrears": set()}
+            for region_id in tree.parents
+        }
+        for region_id in set(usage_by_region) | set(meter_count_by_region) | set(users_by_region) | set(arrears_by_region):
+            if region_id not in rollup:
+                continue
+            total, peak, valley = usage_by_region.get(region_id, (0, 0, 0))
+            for ancestor_id in tree.ancestors(region_id):
+                item = rollup[ancestor_id]
+                item["total"] += total
+                item["peak"] += peak
+                item["valley"] += valley
+                item["meters"] += meter_count_by_region.get(region_id, 0)
+                item["users"] |= users_by_region.get(region_id, set())
+                item["arrears"] |= arrears_by_region.get(region_id, set())
+
+        now = datetime.now()
+        rows = [
+            {
+                "region_id": region_id,
+                "usage_type": usage_type,
+                "usage_time": start_time,
+                "total_electricity": round(item["total"], 2),
+                "peak_electricity": round(item["peak"], 2),
+                "valley_electricity": round(item["valley"], 2),
+                "meter_count": item["meters"],
+                "user_count": len(item["users"]),
+                "arrears_count": len(item["arrears"]),
+                "update_time": now
+            }
+            for region_id, item in rollup.items()
+        ]
+
+        try:
+            db.session.query(RegionUsageData).filter(
+                RegionUsageData.usage_type == usage_type,
+                RegionUsageData.usage_time == start_time
+            ).delete(synchronize_session=False)
+            if rows:
+                db.session.execute(insert(RegionUsageData), rows)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        return {
+            "usage_type": usage_type.name,
+            "usage_time": start_time.strftime("%Y-%m-%d"),
+            "region_count": len(rows)
+        }
+
+    @staticmethod
+    def usage_by_period(region_id, usage_type, start_time, end_time=None):
+        """
+        获取片区（含所有下级片区）各周期的用电量：
+        优先读取片区汇总表，已结束但没有汇总行的周期从电表级UsageData实时汇总
+        :param region_id: 片区ID
+        :param usage_type: 汇总类型（DAY/MONTH）
+        :param start_time: 开始时间（含）
+        :param end_time: 结束时间（不含），默认当前时间
+        :return: 按周期升序的记录列表（usage_time、total_electricity、peak_electricity、valley_electricity）
+        """
+        end_time = end_time or datetime.now()
+        records = db.session.query(
+            RegionUsageData.usage_time,
+            RegionUsageData.total_electricity,
+            RegionUsageData.peak_electricity,
+            RegionUsageData.valley_electricity
+        ).filter(
+            RegionUsageData.region_id == region_id,
+            RegionUsageData.usage_type == usage_type,
+            RegionUsageData.usage_time >= start_time,
+            RegionUsageData.usage_time < end_time
+        ).all()
+
+        # 范围内已结束的周期（未结束的周期还没有汇总）
+        covered = {record.usage_time for record in records}
+        missing = []
+        period_start, period_end = UsageEngine.period_range(usage_type, start_time)
+        if period_start < start_time:
+            period_start, period_end = UsageEngine.period_range(usage_type, period_end)
+        while period_end <= end_time:
+            if period_start not in covered:
+                missing.append(period_start)
+            period_start, period_end = UsageEngine.period_range(usage_type, period_end)
+
+        if missing:
+            records += db.session.query(
+                UsageData.usage_time,
+                func.sum(UsageData.total_electricity).label("total_electricity"),
+                func.sum(UsageData.peak_electricity).label("peak_electricity"),
+                func.sum(UsageData.valley_electricity).label("valley_electricity")
+            ).join(
+                Meter, Meter.id == UsageData.meter_id
+            ).filter(
+                Meter.region_id.in_(RegionTree.get().descendants(region_id)),
+                UsageData.usage_type == usage_type,
+                UsageData.usage_time.in_(missing)
+            ).group_by(UsageData.usage_time).all()
+
+        return sorted(records, key=lambda record: record.usage_time)
+
+    @staticmethod
+    def counts(region_id):
+        """
+        获取片区（含所有下级片区）的电表数、用户数、欠费用户数：
+        优先使用最近一次刷新的快照，片区还没有汇总行时实时统计
+        :param region_id: 片区ID
+        :return: (meter_count, user_count, arrears_count)
+        """
+        latest = RegionRollup.latest(region_id)
+        if latest is not None:
+            return latest.meter_count, latest.user_count, latest.arrears_count
+
+        region_ids = RegionTree.get().descendants(region_id)
+        meter_count = db.session.query(func.count(Meter.id)).filter(
+            Meter.region_id.in_(region_ids)
+        ).scalar() or 0
+        user_count = db.session.query(func.count(func.distinct(Meter.user_id))).filter(
+            Meter.region_id.in_(region_ids),
+            Meter.user_id.isnot(None)
+        ).scalar() or 0
+        arrears_count = db.session.query(func.count(func.distinct(Bill.user_id))).join(
+            Meter, Meter.id == Bill.meter_id
+        ).filter(
+            Meter.region_id.in_(region_ids),
+            Bill.status == BillStatus.overdue
+        ).scalar() or 0
+        return meter_count, user_count, arrears_count
+
+    @staticmethod
+    def latest(region_id):
+        """
+        获取片区最近一次刷新的汇总行（用于读取电表数、用户数、欠费用户数快照）
+        :param region_id: 片区ID
+        :return: RegionUsageData，没有时返回None
+        """
+        return RegionUsageData.query.filter(
+            RegionUsageData.region_id == region_id
+        ).order_by(RegionUsageData.update_time.desc(), RegionUsageData.id.desc()).first()
@@ -0,0 +1,130 @@
+#片区层级缓存（整表加载一次，内存中维护祖先/子孙闭包）
+from ..models import Region
+from ..utils.redis_util import get_cache_version, bump_cache_version
+from app import db
+import threading
+
+_CACHE_NAME = "region_tree"
+
+
+class RegionTree:
+    """
+    片区树快照：
+    1. 一次查询加载REGION整表
+    2. 祖先链、子孙列表按需计算后缓存在快照内
+    3. 片区增删改后递增缓存版本号，各进程在下次访问时重新加载
+    """
+
+    _snapshot = None
+    _version = None
+    _lock = threading.Lock()
+
+    def __init__(self, rows):
+        """
+        :param rows: [(id, parent_id, region_name, region_code, manager_id)]
+        """
+        self.parents = {}
+        self.names = {}
+        self.codes = {}
+        self.managers = {}
+        self.children = {}
+        for region_id, parent_id, region_name, region_code, manager_id in rows:
+            self.parents[region_id] = parent_id
+            self.names[region_id] = region_name
+            self.codes[region_id] = region_code
+            self.managers[region_id] = manager_id
+        for region_id in sorted(self.parents):
+            parent_id = self.parents[region_id]
+            if parent_id in self.parents:
+                self.children.setdefault(parent_id, []).append(region_id)
+        self._ancestors = {}
+        self._descendants = {}
+
+    @staticmethod
+    def get():
+        """获取当前片区树快照（版本号变化时重新加载）"""
+        version = get_cache_version(_CACHE_NAME)
+        snapshot = RegionTree._snapshot
+        if snapshot is not None and RegionTree._version == version:
+            return snapshot
+
+        with RegionTree._lock:
+            if RegionTree._snapshot is None or RegionTree._version != version:
+                rows = db.session.query(
+                    Region.id, Region.parent_id, Region.region_name, Region.region_code, Region.manager_id
+                ).all()
+                RegionTree._snapshot = RegionTree(rows)
+                RegionTree._version = version
+            return RegionTree._snapshot
+
+    @staticmethod
+    def invalidate():
+        """片区变更后调用：递增版本号并清空本进程快照"""
+        bump_cache_version(_CACHE_NAME)
+        RegionTree._snapshot = None
+        RegionTree._version = None
+
+    def exists(self, region_id):
+        return region_id in self.parents
+
+    def name(self, region_id):
+        return self.names.get(region_id)
+
+    def ancestors(self, region_id):
+        """
+        获取片区及其所有上级片区ID（从自身到根）
+        :param region_id: 片区ID
+        :return: ID列表，第一个为自身
+        """
+        chain = self._ancestors.get(region_id)
+        if chain is None:
+            chain = [region_id]
+            visited = {region_id}
+            parent_id = self.parents.get(region_id)
+            while parent_id and parent_id not in visited:
+                chain.append(parent_id)
+                visited.add(parent_id)
+                parent_id = self.parents.get(parent_id)
+            self._ancestors[region_id] = chain
+        return chain
+
+    def descendants(self, region_id):
+        """
+        获取片区及其所有子片区ID（先序遍历，与原递归查询顺序一致）
+        :param region_id: 片区ID
+        :return: ID列表，第一个为自身
+        """
+        result = self._descendants.get(region_id)
+        if result is None:
+            result = []
+            visited = set()
+            stack = [region_id]
+            while stack:
+                current_id = stack.pop()
+                if current_id in visited:
+                    continue
+                visited.add(current_id)
+                result.append(current_id)
+                stack.extend(reversed(self.children.get(current_id, [])))
+            self._descendants[region_id] = result
+        return result
+
+    def path_names(self, region_id):
+        """获取从根片区到该片区的名称链"""
+        return [self.names[ancestor_id] for ancestor_id in reversed(self.ancestors(region_id)) if ancestor_id in self.names]
+
+    def subtree_totals(self, values):
+        """
+        自下而上累加：每个片区的值加上所有下级片区的值
+        :param values: 各片区自身的值{region_id: 数值}
+        :return: {region_id: 包含所有下级片区的合计}，覆盖所有片区
+        """
+        totals = {region_id: values.get(region_id, 0) for region_id in self.parents}
+        roots = [region_id for region_id in sorted(self.parents) if self.parents[region_id] not in self.parents]
+        order = [region_id for root_id in roots for region_id in self.descendants(root_id)]
+        # 先序遍历的逆序保证子片区先于上级片区完成累加
+        for region_id in reversed(order):
+            parent_id = self.parents[region_id]
+            if parent_id in totals:
+                totals[parent_id] += totals[region_id]
+        return totals
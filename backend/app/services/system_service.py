@@ -2,11 +2,14 @@
 from app.models import (PricePolicy, Region, User, Permission, Role, Bill,
             PriceType, LadderPriceRules, TimeSharePriceRules, BillStatus,RoleEnum,
             NoticeType, SendChannel)
-from ..middleware import BusinessException,SystemLog, LogType, LogLevel, create_log
+from ..middleware import BusinessException,SystemLog, LogType, LogLevel, create_log, PrincipalCache
 from app import db
 from flask import current_app
 from datetime import datetime, timedelta
 from sqlalchemy import or_
+from .region_tree import RegionTree
+from .policy_resolver import PolicyResolver
+from ..utils.pagination import keyset_paginate
 
 class SystemServices:
     
@@ -111,6 +114,7 @@ class SystemServices:
         except Exception as e:
             db.session.rollback()
             raise BusinessException("电价策略创建失败", 500)
+        PolicyResolver.invalidate()
         
         return {
             "success": True,
@@ -181,6 +185,7 @@ class SystemServices:
             print(f"[DEBUG] 更新失败: {str(e)}")
             db.session.rollback()
             raise BusinessException(f"电价策略更新失败: {str(e)}", 500)
+        PolicyResolver.invalidate()
         
         return {
             "success": True,
@@ -288,6 +293,7 @@ class SystemServices:
         except Exception as e:
             db.session.rollback()
             raise BusinessException(f"删除价格策略失败：{str(e)}", 500)
+        PolicyResolver.invalidate()
         
         return {
             "success": True,
@@ -317,6 +323,7 @@ class SystemServices:
         except Exception as e:
             db.session.rollback()
             raise BusinessException("电价策略停用失败", 500)
+        PolicyResolver.invalidate()
         
         # 同步更新未生成账单的计费规则（标记需要重新计算）
         # 这里可以触发一个后台任务或标记
@@ -449,6 +456,8 @@ class SystemServices:
             db.session.rollback()
             raise BusinessException("片区创建失败", 500)
         
+        RegionTree.invalidate()
+        
         return {
             "success": True,
             "message": "片区创建成功",
@@ -504,6 +513,9 @@ class SystemServices:
             db.session.rollback()
             raise BusinessException("片区更新失败", 500)
         
+        RegionTree.invalidate()
+        PrincipalCache.invalidate()
+        
         return {
             "success": True,
             "message": "片区更新成功",
@@ -512,26 +524,8 @@ class SystemServices:
     
     @staticmethod
     def _check_region_circular_reference(region_id, new_parent_id):
-        """检查片区是否会形成循环引用"""
-        current_id = new_parent_id
-        visited = set()
-        
-        while current_id:
-            if current_id == region_id:
-                return True  # 发现循环
-            
-            if current_id in visited:
-                return True  # 发现循环
-            
-            visited.add(current_id)
-            
-            parent_region = Region.query.get(current_id)
-            if not parent_region:
-                break
-            
-            current_id = parent_region.parent_id
-        
-        return False
+        """检查片区是否会形成循环引用（新上级的祖先链中包含自身即为循环）"""
+        return region_id in RegionTree.get().ancestors(new_parent_id)
     
     @staticmethod
     def get_region_list(page=1, per_page=20):
@@ -600,6 +594,9 @@ class SystemServices:
             db.session.rollback()
             raise BusinessException(f"删除片区失败：{str(e)}", 500)
         
+        RegionTree.invalidate()
+        PrincipalCache.invalidate()
+        
         return {
             "success": True,
             "message": "片区删除成功"
@@ -688,6 +685,8 @@ class SystemServices:
             db.session.rollback()
             raise BusinessException("角色权限更新失败", 500)
         
+        PrincipalCache.invalidate()
+        
         return {
             "success": True,
             "message": f"角色权限{mode}成功",
@@ -698,22 +697,90 @@ class SystemServices:
             ]
         }
     
+    @staticmethod
+    def update_user_role(admin_id, user_id, new_role):
+        """
+        修改用户角色（仅超级管理员）
+        :param admin_id: 操作的超级管理员ID
+        :param user_id: 被修改的用户ID
+        :param new_role: 新角色（RESIDENT/AREA_ADMIN/SUPER_ADMIN，大小写均可）
+        :return: 修改结果
+        """
+        try:
+            role_enum = RoleEnum[new_role.upper()]
+        except KeyError:
+            raise BusinessException("角色只能是RESIDENT、AREA_ADMIN或SUPER_ADMIN", 400)
+        
+        if admin_id == user_id:
+            raise BusinessException("不能修改自己的角色", 400)
+        
+        user = User.query.get(user_id)
+        if not user:
+            raise BusinessException("用户不存在", 404)
+        
+        role = Role.query.filter_by(name=role_enum).first()
+        if not role:
+            raise BusinessException("角色不存在", 404)
+        
+        old_role = user.role.name.name if user.role else None
+        if user.role_id == role.id:
+            raise BusinessException(f"用户已是{role_enum.name}角色", 400)
+        
+        user.role_id = role.id
+        user.update_time = datetime.now()
+        
+        try:
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            create_log(
+                operator_id=admin_id,
+                operator_name="超级管理员",
+                log_type=LogType.ERROR,
+                module="权限管理",
+                action=f"修改用户{user_id}角色失败",
+                error_message=str(e),
+                log_level=LogLevel.ERROR
+            )
+            raise BusinessException("用户角色更新失败", 500)
+        
+        PrincipalCache.invalidate()
+        
+        create_log(
+            operator_id=admin_id,
+            operator_name="超级管理员",
+            log_type=LogType.UPDATE,
+            module="权限管理",
+            action=f"修改用户{user_id}角色：{old_role} -> {role_enum.name}",
+            log_level=LogLevel.INFO
+        )
+        
+        return {
+            "user_id": user_id,
+            "old_role": old_role,
+            "new_role": role_enum.name,
+            "update_time": user.update_time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    
     # ==================== 系统日志查询 ====================
     
     @staticmethod
-    def query_system_logs(operator_id=None, log_type=None, log_level=None, 
+    def query_system_logs(operator_id=None, log_type=None, log_level=None, module=None,
                          start_date=None, end_date=None, keyword=None,
-                         page=1, per_page=50):
+                         page=1, per_page=50, cursor=None, with_total=False):
         """
         查询系统日志
         :param operator_id: 操作人ID
         :param log_type: 日志类型
         :param log_level: 日志级别
+        :param module: 模块名称
         :param start_date: 开始日期
         :param end_date: 结束日期
         :param keyword: 关键词搜索（操作描述）
         :param page: 页码
         :param per_page: 每页数量
+        :param cursor: 游标（不为None时使用游标分页，空字符串表示第一页）
+        :param with_total: 游标分页时是否统计总数
         :return: 日志列表
         """
         query = SystemLog.query
@@ -730,6 +797,10 @@ class SystemServices:
         if log_level:
             query = query.filter_by(log_level=log_level)
         
+        # 按模块筛选
+        if module:
+            query = query.filter_by(module=module)
+        
         # 按时间范围筛选
         if start_date:
             query = query.filter(SystemLog.create_time >= start_date)
@@ -746,14 +817,21 @@ class SystemServices:
                 )
             )
         
-        # 按时间倒序排列
-        query = query.order_by(SystemLog.create_time.desc())
-        
-        # 分页
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        if cursor is not None:
+            # 游标分页：沿create_time索引定位下一页，不执行OFFSET
+            items, page_info = keyset_paginate(
+                query, SystemLog.create_time, SystemLog.id, cursor, per_page, with_total
+            )
+        else:
+            # 按时间倒序排列
+            query = query.order_by(SystemLog.create_time.desc())
+            
+            # 分页
+            pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+            items = pagination.items
         
         logs = []
-        for log in pagination.items:
+        for log in items:
             logs.append({
                 "id": log.id,
                 "operator_id": log.operator_id,
@@ -771,6 +849,9 @@ class SystemServices:
                 "create_time": log.create_time.strftime("%Y-%m-%d %H:%M:%S")
             })
         
+        if cursor is not None:
+            return {"success": True, "logs": logs, "pagination": page_info}
+        
         return {
             "success": True,
             "logs": logs,
@@ -846,3 +927,16 @@ class SystemServices:
                 "has_prev": pagination.has_prev
             }
         }
+    
+    # ==================== 缓存监控 ====================
+    
+    @staticmethod
+    def get_cache_stats():
+        """
+        获取进程内缓存的命中统计（统计值为当前进程的累计值）
+        :return: 各缓存的统计信息
+        """
+        return {
+            "success": True,
+            "policy_cache": PolicyResolver.stats()
+        }
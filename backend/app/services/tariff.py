@@ -0,0 +1,148 @@
+#电价规则预编译（计费时纯内存查表，不再逐段查询规则）
+from ..models import LadderPriceRules, TimeSharePriceRules, PriceType
+from bisect import bisect_right
+
+
+class CompiledTariff:
+    """
+    单个电价政策的预编译结果：
+    1. 24小时查找表：小时 -> (时段比率, 时段)
+    2. 阶梯断点：所有阶梯上下限排序去重后的断点，每个断点区间对应的(阶梯比率, 阶梯等级)，用二分查找定位
+    3. 政策在账单月份内的有效时间区间
+    查表结果与create_bill原有的逐条规则匹配完全一致：时段取第一个满足 start_hour <= 小时 < end_hour 的规则，
+    阶梯取按下限排序后第一个满足 下限 <= 累计用电量 且 (无上限 或 累计用电量 < 上限) 的规则
+    """
+
+    __slots__ = (
+        "policy_id", "price_type", "base_price",
+        "effective_start", "effective_end",
+        "hour_table", "ladder_breakpoints", "ladder_values"
+    )
+
+    def __init__(self, policy, time_rules, ladder_rules, effective_start, effective_end):
+        """
+        :param policy: PricePolicy对象
+        :param time_rules: 该政策的分时规则列表（按id排序）
+        :param ladder_rules: 该政策的阶梯规则列表（按下限排序）
+        :param effective_start: 政策在账单月份内的有效开始时间
+        :param effective_end: 政策在账单月份内的有效结束时间
+        """
+        self.policy_id = policy.id
+        self.price_type = policy.price_type
+        self.base_price = policy.base_unit_price
+        self.effective_start = effective_start
+        self.effective_end = effective_end
+
+        if policy.price_type in [PriceType.time_share, PriceType.combined]:
+            self.hour_table = tuple(CompiledTariff._match_time_rule(time_rules, hour) for hour in range(24))
+        else:
+            self.hour_table = ((1.0, None),) * 24
+
+        if policy.price_type in [PriceType.ladder, PriceType.combined]:
+            # 规则结果只会在某个上下限处发生变化，且在[断点i, 断点i+1)区间内保持不变，
+            # 因此在每个断点处按原规则求值即可得到整个区间的结果
+            boundaries = set()
+            for rule in ladder_rules:
+                boundaries.add(rule.min_electricity)
+                if rule.max_electricity is not None:
+                    boundaries.add(rule.max_electricity)
+            self.ladder_breakpoints = sorted(boundaries)
+            self.ladder_values = [CompiledTariff._match_ladder_rule(ladder_rules, point) for point in self.ladder_breakpoints]
+        else:
+            self.ladder_breakpoints = []
+            self.ladder_values = []
+
+    @staticmethod
+    def _match_time_rule(time_rules, hour):
+        for rule in time_rules:
+            if rule.start_hour <= hour < rule.end_hour:
+                return rule.ratio, rule.time_period
+        return 1.0, None
+
+    @staticmethod
+    def _match_ladder_rule(ladder_rules, accumulated_electricity):
+        for rule in ladder_rules:
+            if rule.min_electricity <= accumulated_electricity:
+                if rule.max_electricity is None or accumulated_electricity < rule.max_electricity:
+                    return rule.ratio, rule.ladder_level
+        return 1.0, None
+
+    def covers(self, collect_time):
+        """判断时间点是否在政策有效区间内"""
+        return self.effective_start <= collect_time < self.effective_end
+
+    def ladder_slot(self, accumulated_electricity):
+        """根据月累计用电量查找(阶梯比率, 阶梯等级)"""
+        index = bisect_right(self.ladder_breakpoints, accumulated_electricity) - 1
+        if index < 0:
+            return 1.0, None
+        return self.ladder_values[index]
+
+    def price(self, hour, accumulated_electricity):
+        """
+        计算单价
+        :param hour: 时段起始小时
+        :param accumulated_electricity: 当月累计用电量（含本时段）
+        :return: (unit_price, time_period, ladder_level)
+        """
+        time_ratio, time_period = self.hour_table[hour]
+        ladder_ratio, ladder_level = self.ladder_slot(accumulated_electricity)
+        return self.base_price * time_ratio * ladder_ratio, time_period, ladder_level
+
+    @staticmethod
+    def select(tariffs, collect_time):
+        """
+        查找时间点适用的政策（取第一个有效区间包含该时间点的政策）
+        :param tariffs: CompiledTariff列表
+        :param collect_time: 时间点
+        :return: CompiledTariff，没有适用政策时返回None
+        """
+        for tariff in tariffs:
+            if tariff.covers(collect_time):
+                return tariff
+        return None
+
+    @staticmethod
+    def compile_policies(policies, month_start, month_end, rules_cache=None):
+        """
+        将账单月份内有效的政策编译为查找表（按政策开始时间排序）
+        :param policies: PricePolicy列表（已按开始时间排序）
+        :param month_start: 账单月份开始时间
+        :param month_end: 账单月份结束时间
+        :param rules_cache: 预加载的规则{policy_id: (time_rules, ladder_rules)}，不传则两次查询加载
+        :return: CompiledTariff列表
+        """
+        if rules_cache is None:
+            rules_cache = CompiledTariff.load_rules([policy.id for policy in policies])
+
+        tariffs = []
+        for policy in policies:
+            # 与create_bill一致，有效区间精确到秒
+            effective_start = max(policy.start_time, month_start).replace(microsecond=0)
+            effective_end = min(policy.end_time if policy.end_time else month_end, month_end).replace(microsecond=0)
+            time_rules, ladder_rules = rules_cache.get(policy.id, ([], []))
+            tariffs.append(CompiledTariff(policy, time_rules, ladder_rules, effective_start, effective_end))
+        return tariffs
+
+    @staticmethod
+    def load_rules(policy_ids):
+        """
+        两次查询加载多个政策的分时、阶梯规则
+        :param policy_ids: 政策ID列表
+        :return: {policy_id: (time_rules, ladder_rules)}
+        """
+        policy_ids = set(policy_ids)
+        rules_cache = {policy_id: ([], []) for policy_id in policy_ids}
+        if not policy_ids:
+            return rules_cache
+
+        for rule in TimeSharePriceRules.query.filter(
+            TimeSharePriceRules.policy_id.in_(policy_ids)
+        ).order_by(TimeSharePriceRules.id).all():
+            rules_cache[rule.policy_id][0].append(rule)
+        for rule in LadderPriceRules.query.filter(
+            LadderPriceRules.policy_id.in_(policy_ids)
+        ).order_by(LadderPriceRules.min_electricity, LadderPriceRules.id).all():
+            rules_cache[rule.policy_id][1].append(rule)
+        return rules_cache
+
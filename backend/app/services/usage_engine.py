@@ -0,0 +1,221 @@
+#用电数据汇总计算引擎（流式读取 + NumPy向量化计算）
+from ..models import IoTData, UsageType, TimePeriod, Meter
+from app import db
+from datetime import datetime, timedelta
+import numpy as np
+
+# 无分时电价规则时的默认高峰时段：8:00-22:00，其余为低谷
+DEFAULT_PEAK_HOURS = range(8, 22)
+
+# 流式读取时每批拉取的行数
+STREAM_BATCH_SIZE = 5000
+
+_READING_DTYPE = np.dtype([
+    ("meter_id", np.int64),
+    ("hour", np.int8),
+    ("electricity", np.float64)
+])
+
+
+class UsageEngine:
+    @staticmethod
+    def period_range(usage_type, target_date=None):
+        """
+        计算汇总时间范围
+        :param usage_type: 汇总类型（DAY/MONTH）
+        :param target_date: 目标日期，默认昨天/上月
+        :return: (start_time, end_time)，左闭右开
+        """
+        if target_date is None:
+            if usage_type == UsageType.DAY:
+                target_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
+            else:  # MONTH
+                today = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+                target_date = today - timedelta(days=1)
+                target_date = target_date.replace(day=1)
+
+        if usage_type == UsageType.DAY:
+            start_time = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
+            end_time = start_time + timedelta(days=1)
+        else:  # MONTH
+            start_time = target_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            # 下个月第一天
+            if start_time.month == 12:
+                end_time = start_time.replace(year=start_time.year + 1, month=1)
+            else:
+                end_time = start_time.replace(month=start_time.month + 1)
+
+        return start_time, end_time
+
+    @staticmethod
+    def periods_before(usage_type, start_time, count):
+        """
+        计算往前第count个汇总周期的开始时间（用于限定历史汇总的查询范围）
+        :param usage_type: 汇总类型（DAY/MONTH）
+        :param start_time: 当前汇总周期开始时间
+        :param count: 往前的周期数
+        :return: datetime
+        """
+        if usage_type == UsageType.DAY:
+            return start_time - timedelta(days=count)
+        month_index = start_time.year * 12 + start_time.month - 1 - count
+        return start_time.replace(year=month_index // 12, month=month_index % 12 + 1, day=1)
+
+    @staticmethod
+    def peak_valley_masks(region_id, start_time, end_time):
+        """
+        根据片区生效的分时电价规则生成24小时高峰/低谷掩码
+        时段匹配规则与账单计费一致：取第一个满足 start_hour <= 小时 < end_hour 的规则，
+        平段既不计入高峰也不计入低谷；片区及上级片区均无分时规则时使用默认的8:00-22:00高峰
+        :param region_id: 片区ID
+        :param start_time: 汇总开始时间
+        :param end_time: 汇总结束时间
+        :return: (peak_mask, valley_mask)，长度为24的布尔数组
+        """
+        from .bill_service import BillServices
+
+        rules = []
+        if region_id is not None:
+            policies = BillServices._find_region_policy(region_id, start_time, end_time) or []
+            for policy in policies:
+                if policy.time_share_rule:
+                    rules = policy.time_share_rule
+                    break
+
+        peak_mask = np.zeros(24, dtype=bool)
+        valley_mask = np.zeros(24, dtype=bool)
+        if not rules:
+            peak_mask[list(DEFAULT_PEAK_HOURS)] = True
+            valley_mask = ~peak_mask
+            return peak_mask, valley_mask
+
+        for hour in range(24):
+            for rule in rules:
+                if rule.start_hour <= hour < rule.end_hour:
+                    if rule.time_period == TimePeriod.peak:
+                        peak_mask[hour] = True
+                    elif rule.time_period == TimePeriod.valley:
+                        valley_mask[hour] = True
+                    break
+
+        return peak_mask, valley_mask
+
+    @staticmethod
+    def load_readings(meter_ids, start_time, end_time):
+        """
+        流式读取电表读数列到结构化数组（不构造ORM对象）
+        :param meter_ids: 电表ID列表
+        :param start_time: 开始时间
+        :param end_time: 结束时间
+        :return: 按(meter_id, collect_time)排序的结构化数组，字段为meter_id/hour/electricity
+        """
+        if not meter_ids:
+            return np.empty(0, dtype=_READING_DTYPE)
+
+        result = db.session.execute(
+            db.select(IoTData.meter_id, IoTData.collect_time, IoTData.electricity)
+            .where(
+                IoTData.meter_id.in_(meter_ids),
+                IoTData.collect_time >= start_time,
+                IoTData.collect_time < end_time
+            )
+            .order_by(IoTData.meter_id, IoTData.collect_time)
+            .execution_options(yield_per=STREAM_BATCH_SIZE)
+        )
+        return np.fromiter(
+            ((meter_id, collect_time.hour, electricity) for meter_id, collect_time, electricity in result),
+            dtype=_READING_DTYPE
+        )
+
+    @staticmethod
+    def compute(readings, mask_index_by_meter, peak_table, valley_table):
+        """
+        向量化计算各电表的总用电量、高峰和低谷用电量
+        总用电量 = 最后读数 - 第一次读数；相邻读数差值按前一个读数所在小时归入高峰或低谷
+        :param readings: load_readings返回的结构化数组
+        :param mask_index_by_meter: {meter_id: 掩码行号}
+        :param peak_table: 高峰掩码表，形状(k, 24)
+        :param valley_table: 低谷掩码表，形状(k, 24)
+        :return: {meter_id: {"total_electricity", "peak_electricity", "valley_electricity", "data_points"}}
+        """
+        if readings.size == 0:
+            return {}
+
+        meter = readings["meter_id"]
+        hour = readings["hour"].astype(np.intp)
+        value = readings["electricity"]
+
+        meter_ids, first_index, group = np.unique(meter, return_index=True, return_inverse=True)
+        last_index = np.r_[first_index[1:] - 1, meter.size - 1]
+        totals = value[last_index] - value[first_index]
+        counts = np.diff(np.r_[first_index, meter.size])
+
+        # 相邻读数差值，跨电表边界的差值被屏蔽
+        same_meter = meter[1:] == meter[:-1]
+        deltas = np.diff(value)[same_meter]
+        seg_group = group[:-1][same_meter]
+        seg_hour = hour[:-1][same_meter]
+
+        mask_rows = np.array([mask_index_by_meter.get(int(m), 0) for m in meter_ids], dtype=np.intp)
+        seg_rows = mask_rows[seg_group]
+        is_peak = peak_table[seg_rows, seg_hour]
+        is_valley = valley_table[seg_rows, seg_hour]
+
+        peaks = np.bincount(seg_group, weights=np.where(is_peak, deltas, 0.0), minlength=meter_ids.size)
+        valleys = np.bincount(seg_group, weights=np.where(is_valley, deltas, 0.0), minlength=meter_ids.size)
+
+        return {
+            int(meter_ids[i]): {
+                "total_electricity": float(totals[i]),
+                "peak_electricity": float(peaks[i]),
+                "valley_electricity": float(valleys[i]),
+                "data_points": int(counts[i])
+            }
+            for i in range(meter_ids.size)
+        }
+
+    @staticmethod
+    def build_mask_tables(meter_regions, start_time, end_time):
+        """
+        为一批电表构建高峰/低谷掩码表，同一片区只解析一次电价规则
+        :param meter_regions: {meter_id: region_id}
+        :param start_time: 汇总开始时间
+        :param end_time: 汇总结束时间
+        :return: (mask_index_by_meter, peak_table, valley_table)
+        """
+        region_rows = {}
+        peak_rows = []
+        valley_rows = []
+        mask_index_by_meter = {}
+        for meter_id, region_id in meter_regions.items():
+            if region_id not in region_rows:
+                peak_mask, valley_mask = UsageEngine.peak_valley_masks(region_id, start_time, end_time)
+                region_rows[region_id] = len(peak_rows)
+                peak_rows.append(peak_mask)
+                valley_rows.append(valley_mask)
+            mask_index_by_meter[meter_id] = region_rows[region_id]
+
+        if not peak_rows:
+            peak_mask, valley_mask = UsageEngine.peak_valley_masks(None, start_time, end_time)
+            peak_rows.append(peak_mask)
+            valley_rows.append(valley_mask)
+
+        return mask_index_by_meter, np.vstack(peak_rows), np.vstack(valley_rows)
+
+    @staticmethod
+    def aggregate(meter_ids, start_time, end_time):
+        """
+        汇总一批电表在时间范围内的用电量
+        :param meter_ids: 电表ID列表
+        :param start_time: 开始时间
+        :param end_time: 结束时间
+        :return: {meter_id: 汇总结果}，无读数的电表不在结果中
+        """
+        meter_regions = dict(
+            db.session.query(Meter.id, Meter.region_id).filter(Meter.id.in_(meter_ids)).all()
+        ) if meter_ids else {}
+        mask_index_by_meter, peak_table, valley_table = UsageEngine.build_mask_tables(
+            meter_regions, start_time, end_time
+        )
+        readings = UsageEngine.load_readings(list(meter_regions), start_time, end_time)
+        return UsageEngine.compute(readings, mask_index_by_meter, peak_table, valley_table)
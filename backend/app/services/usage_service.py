@@ -1,16 +1,23 @@
 #用电数据采集业务
-from ..models import IoTData,UsageData,IoTstatus,UsageType,Meter,User,NoticeType, SendChannel,MeterStatus
+from ..models import IoTData,UsageData,IoTstatus,UsageType,Meter,User,NoticeType, SendChannel,MeterStatus,RoleEnum
 from ..services import MeterServices,NotifyServices
 from ..middleware import BusinessException,create_log, LogType, LogLevel
+from ..utils.redis_util import save_meter_reading_state, delete_meter_reading_state
+from ..utils.pagination import keyset_paginate
+from .usage_engine import UsageEngine
+from .hourly_rollup import HourlyRollup
 from app import db
 from flask import current_app
 from datetime import datetime, timedelta
-from sqlalchemy import func
+from sqlalchemy import func, select, case, extract
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+import numpy as np
 
 class UsageService:
     @staticmethod
     def receive_iot_data(meter_id,electricity,collect_time,voltage=None,current=None):
-        validate_result=MeterServices.validate_meter_reading(meter_id,electricity,collect_time)     #该函数中已检验电表是否存在
+        history=MeterServices.get_reading_history(meter_id)
+        validate_result=MeterServices.validate_meter_reading(meter_id,electricity,collect_time,history)     #该函数中已检验电表是否存在
         status=IoTstatus.NORMAL
         if not validate_result["is_valid"]:
             raise BusinessException("无法写入的异常数据",400)
@@ -27,7 +34,21 @@ class UsageService:
         )
 
         try:
+            # 锁定电表后取最近一次已提交读数复核时间和读数（读数缓存可能已过期），并作为小时增量的起点
+            previous, stale = UsageService._locked_previous(meter_id, history)
+            is_valid, _ = MeterServices._check_reading([previous] if previous else [], electricity, collect_time)
+            if not is_valid:
+                raise BusinessException("无法写入的异常数据",400)
             db.session.add(new_iot_data)
+            # 同一事务内累加小时汇总
+            HourlyRollup.apply(HourlyRollup.build_rows(
+                meter_id, previous, [(collect_time, electricity, voltage)]
+            ))
+            db.session.commit()
+        except BusinessException:
+            db.session.rollback()
+            delete_meter_reading_state(meter_id)
+            raise
         except Exception as e:
             db.session.rollback()
             create_log(
@@ -41,6 +62,11 @@ class UsageService:
             )
             raise BusinessException("IoT数据录入失败",500)
         
+        if stale:
+            delete_meter_reading_state(meter_id)     #缓存与数据库不一致，下次从数据库重建
+        else:
+            MeterServices.record_accepted_readings(meter_id, [(collect_time, electricity)])
+        
         return {
             "success":True,
             "warning":validate_result["warnings"],
@@ -54,6 +80,165 @@ class UsageService:
             }
         }
     
+    @staticmethod
+    def _locked_previous(meter_id, history):
+        """
+        写入事务内锁定电表并取最近一次已提交读数
+        :param meter_id: 电表ID
+        :param history: 校验时使用的缓存最近读数
+        :return: (previous, stale)，缓存与数据库一致时previous取缓存中的原值（不受FLOAT精度影响），否则取数据库读回的值
+        """
+        cached = history[0] if history else None
+        stored = HourlyRollup.lock_last_readings([meter_id]).get(meter_id)
+        if MeterServices.same_reading(cached, stored):
+            return cached, False
+        return stored, True
+    
+    @staticmethod
+    def receive_iot_batch(meter_groups):
+        """
+        批量接收IoT数据：集中器按电表分组上报，统一预取电表和最近读数，在内存中逐条校验后一次性写入
+        :param meter_groups: 电表读数分组[{"meter_id": 1, "readings": [{"electricity", "collect_time", "voltage", "current"}]}]
+        :return: 每条读数的接收结果
+        """
+        total_readings = sum(len(group["readings"]) for group in meter_groups)
+        max_readings = current_app.config.get("IOT_BATCH_MAX_READINGS", 20000)
+        if total_readings > max_readings:
+            raise BusinessException(f"单次上传读数不能超过{max_readings}条", 400)
+        
+        # 一次查询确认电表存在，一次查询预取各电表最近读数
+        meter_ids = list({group["meter_id"] for group in meter_groups})
+        existing_ids = {row.id for row in db.session.query(Meter.id).filter(Meter.id.in_(meter_ids)).all()}
+        histories = MeterServices.prefetch_last_readings(list(existing_ids))
+        
+        # 校验使用的缓存最近读数，写入时与数据库中的最近读数比对
+        cached_last = {meter_id: (history[0] if history else None) for meter_id, history in histories.items()}
+        
+        rows = []
+        row_results = []
+        results = []
+        touched_ids = set()
+        for group in meter_groups:
+            meter_id = group["meter_id"]
+            if meter_id not in existing_ids:
+                for index, reading in enumerate(group["readings"]):
+                    results.append({
+                        "meter_id": meter_id,
+                        "index": index,
+                        "accepted": False,
+                        "status": None,
+                        "warnings": ["电表不存在"]
+                    })
+                continue
+            
+            # 同一电表内按采集时间顺序校验，已接收的读数作为后续读数的历史
+            history = histories.setdefault(meter_id, [])
+            ordered = sorted(enumerate(group["readings"]), key=lambda item: item[1]["collect_time"])
+            for index, reading in ordered:
+                is_valid, warnings = MeterServices._check_reading(
+                    history, reading["electricity"], reading["collect_time"]
+                )
+                if not is_valid:
+                    results.append({
+                        "meter_id": meter_id,
+                        "index": index,
+                        "accepted": False,
+                        "status": None,
+                        "warnings": warnings
+                    })
+                    continue
+                
+                status = IoTstatus.ABNORMAL if warnings else IoTstatus.NORMAL
+                rows.append({
+                    "meter_id": meter_id,
+                    "electricity": reading["electricity"],
+                    "collect_time": reading["collect_time"],
+                    "voltage": reading.get("voltage"),
+                    "current": reading.get("current"),
+                    "status": status
+                })
+                history.insert(0, (reading["collect_time"], reading["electricity"]))
+                del history[10:]
+                touched_ids.add(meter_id)
+                results.append({
+                    "meter_id": meter_id,
+                    "index": index,
+                    "accepted": True,
+                    "status": status.name,
+                    "warnings": warnings
+                })
+                row_results.append(results[-1])
+        
+        stale_ids = set()
+        if rows:
+            try:
+                # 锁定电表后取各电表最近一次已提交读数，作为复核和小时增量的起点
+                # （缓存与数据库一致时取缓存中的原值，不受FLOAT精度影响）
+                stored_readings = HourlyRollup.lock_last_readings(touched_ids)
+                last_readings = {}
+                for meter_id in touched_ids:
+                    cached, stored = cached_last.get(meter_id), stored_readings.get(meter_id)
+                    if MeterServices.same_reading(cached, stored):
+                        last_readings[meter_id] = cached
+                    else:
+                        stale_ids.add(meter_id)
+                        last_readings[meter_id] = stored
+                
+                # 按数据库中的最近读数复核（缓存过期时时间或读数回退的数据拒绝写入），
+                # 同一电表的读数已按采集时间升序排列，已接收的读数作为后续读数的起点
+                accepted_rows = []
+                hourly_rows = {}
+                for row, result in zip(rows, row_results):
+                    meter_id = row["meter_id"]
+                    last = last_readings.get(meter_id)
+                    is_valid, warnings = MeterServices._check_reading(
+                        [last] if last else [], row["electricity"], row["collect_time"]
+                    )
+                    if not is_valid:
+                        result.update(accepted=False, status=None, warnings=warnings)
+                        stale_ids.add(meter_id)
+                        continue
+                    accepted_rows.append(row)
+                    HourlyRollup.build_rows(
+                        meter_id, last,
+                        [(row["collect_time"], row["electricity"], row["voltage"])],
+                        hourly_rows
+                    )
+                    last_readings[meter_id] = (row["collect_time"], row["electricity"])
+                rows = accepted_rows
+                
+                if rows:
+                    db.session.execute(IoTData.__table__.insert(), rows)
+                    HourlyRollup.apply(hourly_rows)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                create_log(
+                    operator_id=None,
+                    operator_name="IoT设备",
+                    log_type=LogType.ERROR,
+                    module="用电数据",
+                    action=f"IoT批量数据录入失败：{len(rows)}条",
+                    error_message=str(e),
+                    log_level=LogLevel.ERROR
+                )
+                raise BusinessException("IoT批量数据录入失败", 500)
+            
+            # 写入成功后回写各电表的滚动状态（缓存与数据库不一致的电表删除状态，下次从数据库重建）
+            for meter_id in touched_ids:
+                if meter_id in stale_ids:
+                    delete_meter_reading_state(meter_id)
+                else:
+                    save_meter_reading_state(meter_id, histories[meter_id])
+        
+        return {
+            "success": True,
+            "total": total_readings,
+            "accepted_count": len(rows),
+            "rejected_count": total_readings - len(rows),
+            "results": results
+        }
+    
     @staticmethod
     def aggregate_usage_data(meter_id, usage_type, target_date=None):
         """
@@ -69,85 +254,35 @@ class UsageService:
             raise BusinessException("电表不存在", 404)
         
         # 确定汇总时间范围
-        if target_date is None:
-            if usage_type == UsageType.DAY:
-                target_date = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=1)
-            else:  # MONTH
-                today = datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-                target_date = today - timedelta(days=1)
-                target_date = target_date.replace(day=1)
-        
-        # 设置时间范围
-        if usage_type == UsageType.DAY:
-            start_time = target_date.replace(hour=0, minute=0, second=0, microsecond=0)
-            end_time = start_time + timedelta(days=1)
-        else:  # MONTH
-            start_time = target_date.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
-            # 下个月第一天
-            if start_time.month == 12:
-                end_time = start_time.replace(year=start_time.year + 1, month=1)
-            else:
-                end_time = start_time.replace(month=start_time.month + 1)
+        start_time, end_time = UsageEngine.period_range(usage_type, target_date)
         
-        # 查询该时间段内的IoT数据
-        iot_records = IoTData.query.filter(
-            IoTData.meter_id == meter_id,
-            IoTData.collect_time >= start_time,
-            IoTData.collect_time < end_time
-        ).order_by(IoTData.collect_time).all()
+        # 流式读取该时间段内的读数并向量化计算
+        # 总用电量使用差值法：最后一次读数 - 第一次读数
+        # 高峰/低谷时段取自片区生效的分时电价规则，无规则时默认8:00-22:00为高峰
+        mask_index_by_meter, peak_table, valley_table = UsageEngine.build_mask_tables(
+            {meter.id: meter.region_id}, start_time, end_time
+        )
+        readings = UsageEngine.load_readings([meter.id], start_time, end_time)
+        summary = UsageEngine.compute(readings, mask_index_by_meter, peak_table, valley_table).get(meter.id)
         
-        if not iot_records:
+        if summary is None:
             raise BusinessException(f"未找到{start_time.strftime('%Y-%m-%d')}的用电数据", 404)
         
-        # 计算总用电量（使用差值法：最后一次读数 - 第一次读数）
-        total_electricity = iot_records[-1].electricity - iot_records[0].electricity
-        
-        # 区分高峰/低谷时段用电量
-        # 高峰时段：8:00-22:00（可配置）
-        # 低谷时段：22:00-次日8:00
-        peak_electricity = 0.0
-        valley_electricity = 0.0
-        
-        for i in range(len(iot_records) - 1):
-            current_record = iot_records[i]
-            next_record = iot_records[i + 1]
-            
-            # 计算这个时间段的用电量
-            period_usage = next_record.electricity - current_record.electricity
-            
-            # 判断是否在高峰时段（8:00-22:00）
-            current_hour = current_record.collect_time.hour
-            if 8 <= current_hour < 22:
-                peak_electricity += period_usage
-            else:
-                valley_electricity += period_usage
-        
-        # 检查是否已存在该汇总数据
-        existing_usage = UsageData.query.filter_by(
-            meter_id=meter_id,
-            usage_type=usage_type,
-            usage_time=start_time
-        ).first()
-        
-        if existing_usage:
-            # 更新已有数据
-            existing_usage.total_electricity = total_electricity
-            existing_usage.peak_electricity = peak_electricity
-            existing_usage.valley_electricity = valley_electricity
-            usage_data = existing_usage
-        else:
-            # 创建新汇总数据
-            usage_data = UsageData(
-                meter_id=meter_id,
-                usage_type=usage_type,
-                usage_time=start_time,
-                total_electricity=total_electricity,
-                peak_electricity=peak_electricity,
-                valley_electricity=valley_electricity
-            )
-            db.session.add(usage_data)
+        total_electricity = summary["total_electricity"]
+        peak_electricity = summary["peak_electricity"]
+        valley_electricity = summary["valley_electricity"]
         
+        # 已存在该汇总数据时更新，不存在时写入（依赖唯一键，重复执行不会产生重复汇总）
         try:
+            UsageService._upsert_usage_rows([{
+                "meter_id": meter_id,
+                "usage_type": usage_type,
+                "usage_time": start_time,
+                "total_electricity": total_electricity,
+                "peak_electricity": peak_electricity,
+                "valley_electricity": valley_electricity,
+                "create_time": datetime.now()
+            }])
             db.session.commit()
         except Exception as e:
             db.session.rollback()
@@ -174,7 +309,7 @@ class UsageService:
                 "total_electricity": round(total_electricity, 2),
                 "peak_electricity": round(peak_electricity, 2),
                 "valley_electricity": round(valley_electricity, 2),
-                "data_points": len(iot_records)
+                "data_points": summary["data_points"]
             },
             "anomaly_detection": anomaly_detection
         }
@@ -196,14 +331,31 @@ class UsageService:
             UsageData.usage_time < current_time
         ).order_by(UsageData.usage_time.desc()).limit(12).all()  # 最近12条记录
         
-        if len(historical_data) < 3:
+        result = UsageService._evaluate_usage_anomaly(
+            current_usage, [data.total_electricity for data in historical_data]
+        )
+        
+        # 触发通知（可选）
+        if result["has_anomaly"]:
+            UsageService._notify_usage_anomaly(meter_id, usage_type, result)
+        
+        return result
+    
+    @staticmethod
+    def _evaluate_usage_anomaly(current_usage, historical_values):
+        """
+        异常判定（纯计算，不访问数据库）
+        :param current_usage: 当前用电量
+        :param historical_values: 最近12条历史汇总用电量
+        :return: 异常检测结果
+        """
+        if len(historical_values) < 3:
             return {
                 "has_anomaly": False,
                 "message": "历史数据不足，无法进行异常检测（至少需要3条历史记录）"
             }
         
         # 计算历史平均值和标准差
-        historical_values = [data.total_electricity for data in historical_data]
         avg_usage = sum(historical_values) / len(historical_values)
         
         # 计算标准差
@@ -227,15 +379,12 @@ class UsageService:
             "historical_average": round(avg_usage, 2),
             "standard_deviation": round(std_dev, 2),
             "growth_rate": round(growth_rate, 2),
-            "historical_records_count": len(historical_data)
+            "historical_records_count": len(historical_values)
         }
         
         if is_anomaly:
             result["message"] = f"检测到异常用电！当前用电量({current_usage:.2f}度)超过历史平均值({avg_usage:.2f}度)的{growth_rate:.1f}%"
             result["severity"] = "high" if growth_rate > 100 else "medium"
-            
-            # 触发通知（可选）
-            UsageService._notify_usage_anomaly(meter_id, usage_type, result)
         else:
             result["message"] = f"用电量正常，当前用电量为历史平均值的{(current_usage/avg_usage*100):.1f}%"
             result["severity"] = "normal"
@@ -293,15 +442,23 @@ class UsageService:
             # 不抛出异常，不影响主流程
     
     @staticmethod
-    def batch_aggregate_all_meters(usage_type, target_date=None):
+    def batch_aggregate_all_meters(usage_type, target_date=None, set_based=False, meter_ids=None):
         """
         批量汇总所有电表的用电数据
         :param usage_type: 汇总类型（DAY/MONTH）
         :param target_date: 目标日期
+        :param set_based: 是否使用集合模式（一次SQL汇总全部电表并批量写入，适用于夜间定时任务）
+        :param meter_ids: 限定汇总的电表ID列表（可选，供分块任务使用）
         :return: 批量汇总结果
         """ 
+        if set_based:
+            return UsageService._batch_aggregate_set_based(usage_type, target_date, meter_ids)
+        
         # 获取所有正常状态的电表
-        active_meters = Meter.query.filter_by(status=MeterStatus.NORMAL).all()
+        meter_query = Meter.query.filter_by(status=MeterStatus.NORMAL)
+        if meter_ids is not None:
+            meter_query = meter_query.filter(Meter.id.in_(meter_ids))
+        active_meters = meter_query.all()
         
         success_count = 0
         failed_count = 0
@@ -344,6 +501,214 @@ class UsageService:
             "failed_meters": failed_meters
         }
     
+    @staticmethod
+    def _batch_aggregate_set_based(usage_type, target_date=None, meter_ids=None):
+        """
+        集合模式批量汇总：
+        1. 一次窗口函数SQL计算所有正常电表的首末读数和按小时分桶的差值之和
+        2. 按片区分时规则将小时桶归并为高峰/低谷用电量
+        3. 批量更新已有汇总、批量插入新汇总
+        4. 一次查询取出所有电表的历史汇总进行异常检测，异常通知批量写入
+        :param usage_type: 汇总类型（DAY/MONTH）
+        :param target_date: 目标日期
+        :param meter_ids: 限定汇总的电表ID列表（可选）
+        :return: 批量汇总结果
+        """
+        start_time, end_time = UsageEngine.period_range(usage_type, target_date)
+        
+        reading_filters = [IoTData.collect_time >= start_time, IoTData.collect_time < end_time]
+        meter_filters = [Meter.status == MeterStatus.NORMAL]
+        if meter_ids is not None:
+            reading_filters.append(IoTData.meter_id.in_(meter_ids))
+            meter_filters.append(Meter.id.in_(meter_ids))
+        
+        # 1. 窗口函数：相邻读数差值、每个电表的首末读数
+        partition = {"partition_by": IoTData.meter_id}
+        windowed = select(
+            IoTData.meter_id.label("meter_id"),
+            extract("hour", IoTData.collect_time).label("hour"),
+            (func.lead(IoTData.electricity).over(order_by=IoTData.collect_time, **partition)
+                - IoTData.electricity).label("delta"),
+            func.first_value(IoTData.electricity).over(order_by=IoTData.collect_time, **partition).label("first_reading"),
+            func.first_value(IoTData.electricity).over(order_by=IoTData.collect_time.desc(), **partition).label("last_reading")
+        ).where(*reading_filters).subquery()
+        
+        hour_columns = [
+            func.sum(case((windowed.c.hour == hour, windowed.c.delta), else_=0)).label(f"h{hour}")
+            for hour in range(24)
+        ]
+        rows = db.session.execute(
+            select(
+                Meter.id, Meter.region_id, Meter.user_id, Meter.meter_code,
+                func.max(windowed.c.first_reading).label("first_reading"),
+                func.max(windowed.c.last_reading).label("last_reading"),
+                func.count().label("data_points"),
+                *hour_columns
+            ).join(
+                Meter, Meter.id == windowed.c.meter_id
+            ).where(
+                *meter_filters
+            ).group_by(
+                Meter.id, Meter.region_id, Meter.user_id, Meter.meter_code
+            )
+        ).all()
+        
+        active_meters = db.session.query(Meter.id, Meter.meter_code).filter(*meter_filters).all()
+        
+        # 2. 小时桶按片区掩码归并为高峰/低谷
+        summaries = {}
+        if rows:
+            mask_index_by_meter, peak_table, valley_table = UsageEngine.build_mask_tables(
+                {row.id: row.region_id for row in rows}, start_time, end_time
+            )
+            hour_sums = np.array(
+                [[getattr(row, f"h{hour}") or 0.0 for hour in range(24)] for row in rows],
+                dtype=np.float64
+            )
+            mask_rows = np.array([mask_index_by_meter[row.id] for row in rows], dtype=np.intp)
+            peaks = (hour_sums * peak_table[mask_rows]).sum(axis=1)
+            valleys = (hour_sums * valley_table[mask_rows]).sum(axis=1)
+            
+            for i, row in enumerate(rows):
+                summaries[row.id] = {
+                    "user_id": row.user_id,
+                    "meter_code": row.meter_code,
+                    "total_electricity": row.last_reading - row.first_reading,
+                    "peak_electricity": float(peaks[i]),
+                    "valley_electricity": float(valleys[i]),
+                    "data_points": row.data_points
+                }
+        
+        # 3. 批量写入汇总数据（INSERT ... ON DUPLICATE KEY UPDATE，重跑或分块重叠时更新已有汇总）
+        now = datetime.now()
+        rows = [{
+            "meter_id": meter_id,
+            "usage_type": usage_type,
+            "usage_time": start_time,
+            "total_electricity": summary["total_electricity"],
+            "peak_electricity": summary["peak_electricity"],
+            "valley_electricity": summary["valley_electricity"],
+            "create_time": now
+        } for meter_id, summary in summaries.items()]
+        
+        try:
+            UsageService._upsert_usage_rows(rows)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            create_log(
+                operator_id=None,
+                operator_name="系统",
+                log_type=LogType.ERROR,
+                module="用电数据",
+                action=f"集合模式批量汇总失败：{start_time.strftime('%Y-%m-%d')}",
+                error_message=str(e),
+                log_level=LogLevel.ERROR
+            )
+            raise BusinessException("用电数据批量汇总失败", 500)
+        
+        # 4. 批量异常检测
+        anomaly_count = UsageService._detect_usage_anomaly_bulk(usage_type, start_time, summaries)
+        
+        no_data_message = f"未找到{start_time.strftime('%Y-%m-%d')}的用电数据"
+        failed_meters = [
+            {"meter_id": meter_id, "meter_code": meter_code, "error": no_data_message}
+            for meter_id, meter_code in active_meters if meter_id not in summaries
+        ]
+        
+        create_log(
+            operator_id=None,
+            operator_name="系统",
+            log_type=LogType.UPDATE,
+            module="用电数据",
+            action=f"集合模式批量汇总完成：{start_time.strftime('%Y-%m-%d')}，成功{len(summaries)}个，无数据{len(failed_meters)}个，异常{anomaly_count}个",
+            log_level=LogLevel.INFO
+        )
+        
+        return {
+            "success": True,
+            "mode": "set_based",
+            "summary": {
+                "total_meters": len(active_meters),
+                "success_count": len(summaries),
+                "failed_count": len(failed_meters),
+                "anomaly_count": anomaly_count
+            },
+            "failed_meters": failed_meters
+        }
+    
+    @staticmethod
+    def _upsert_usage_rows(rows):
+        """
+        写入或更新汇总数据（按(电表, 类型, 周期)唯一键），不提交事务
+        :param rows: 汇总行列表
+        """
+        if not rows:
+            return
+        stmt = mysql_insert(UsageData).values(rows)
+        stmt = stmt.on_duplicate_key_update(
+            total_electricity=stmt.inserted.total_electricity,
+            peak_electricity=stmt.inserted.peak_electricity,
+            valley_electricity=stmt.inserted.valley_electricity
+        )
+        db.session.execute(stmt)
+    
+    @staticmethod
+    def _detect_usage_anomaly_bulk(usage_type, current_time, summaries):
+        """
+        批量异常检测：一次查询取出本批电表最近12个周期的历史汇总，异常通知批量写入
+        :param usage_type: 汇总类型
+        :param current_time: 当前汇总周期开始时间
+        :param summaries: {meter_id: 汇总结果（含user_id、meter_code、total_electricity）}
+        :return: 异常电表数量
+        """
+        if not summaries:
+            return 0
+        
+        ranked = select(
+            UsageData.meter_id,
+            UsageData.total_electricity,
+            func.row_number().over(
+                partition_by=UsageData.meter_id,
+                order_by=UsageData.usage_time.desc()
+            ).label("rn")
+        ).where(
+            UsageData.meter_id.in_(list(summaries)),
+            UsageData.usage_type == usage_type,
+            UsageData.usage_time >= UsageEngine.periods_before(usage_type, current_time, 12),
+            UsageData.usage_time < current_time
+        ).subquery()
+        
+        history = {}
+        for meter_id, total_electricity in db.session.execute(
+            select(ranked.c.meter_id, ranked.c.total_electricity).where(ranked.c.rn <= 12)
+        ):
+            history.setdefault(meter_id, []).append(total_electricity)
+        
+        period_name = "日" if usage_type == UsageType.DAY else "月"
+        notifications = []
+        for meter_id, summary in summaries.items():
+            result = UsageService._evaluate_usage_anomaly(summary["total_electricity"], history.get(meter_id, []))
+            if not result["has_anomaly"] or not summary["user_id"]:
+                continue
+            notifications.append({
+                "notify_type": NoticeType.PRICE_CHANGE,  # 可以新增一个异常用电类型
+                "target_type": RoleEnum.RESIDENT,
+                "target_id": summary["user_id"],
+                "related_id": meter_id,
+                "title": f"异常用电提醒 - {summary['meter_code']}",
+                "content": f"您的电表{period_name}度用电量异常：\n{result['message']}\n建议检查用电设备是否正常。",
+                "send_channel": SendChannel.INNER,
+                "send_time": datetime.now()
+            })
+        
+        try:
+            NotifyServices.bulk_create_notifications(notifications)
+        except BusinessException:
+            pass  # 通知失败已记录日志，不影响汇总主流程
+        
+        return len(notifications)
+    
     @staticmethod
     def manual_input_reading(meter_id, reading_value, reading_time, operator_id, voltage=None, current=None, proof_image=None):
         """
@@ -366,7 +731,8 @@ class UsageService:
             raise BusinessException("电表不存在", 404)
         
         # 2. 校验读数有效性
-        validate_result = MeterServices.validate_meter_reading(meter_id, reading_value, reading_time)
+        history = MeterServices.get_reading_history(meter_id)
+        validate_result = MeterServices.validate_meter_reading(meter_id, reading_value, reading_time, history)
         
         status = IoTstatus.NORMAL
         if not validate_result["is_valid"]:
@@ -398,7 +764,20 @@ class UsageService:
             db.session.add(meter_record)
         
         try:
+            # 锁定电表后取最近一次已提交读数复核时间和读数（读数缓存可能已过期），并作为小时增量的起点
+            previous, stale = UsageService._locked_previous(meter_id, history)
+            is_valid, warnings = MeterServices._check_reading([previous] if previous else [], reading_value, reading_time)
+            if not is_valid:
+                raise BusinessException(f"读数无效：{', '.join(warnings)}", 400)
+            # 同一事务内累加小时汇总
+            HourlyRollup.apply(HourlyRollup.build_rows(
+                meter_id, previous, [(reading_time, reading_value, voltage)]
+            ))
             db.session.commit()
+        except BusinessException:
+            db.session.rollback()
+            delete_meter_reading_state(meter_id)
+            raise
         except Exception as e:
             db.session.rollback()
             create_log(
@@ -412,6 +791,11 @@ class UsageService:
             )
             raise BusinessException("数据录入失败", 500)
         
+        if stale:
+            delete_meter_reading_state(meter_id)     #缓存与数据库不一致，下次从数据库重建
+        else:
+            MeterServices.record_accepted_readings(meter_id, [(reading_time, reading_value)])
+        
         # 6. 自动触发汇总更新
         # 判断是否需要更新日汇总
         update_results = []
@@ -476,7 +860,7 @@ class UsageService:
     
     @staticmethod
     def query_usage_data(meter_id, start_date=None, end_date=None, 
-                        format_type="hour", page=1, per_page=100):
+                        format_type="hour", page=1, per_page=100, cursor=None, with_total=False):
         """
         查询用电数据
         权限校验已在API层完成，本层仅处理业务逻辑
@@ -486,6 +870,8 @@ class UsageService:
         :param format_type: 数据格式类型（hour/day/month）
         :param page: 页码
         :param per_page: 每页数量
+        :param cursor: 游标（仅hour格式，不为None时使用游标分页，空字符串表示第一页）
+        :param with_total: 游标分页时是否统计总数
         :return: 用电数据列表
         """
         # 1. 校验电表是否存在
@@ -503,7 +889,7 @@ class UsageService:
         if start_date > end_date:
             raise BusinessException("开始日期不能晚于结束日期", 400)
         
-        # 3. 直接查询该电表的数据
+        # 3. 直接查询该电表的数据（所有记录属于同一电表，电表编号取自步骤1，不再逐行查询）
         queryable_meter_ids = [meter_id]
         if format_type == "hour":
             # 查询IoTData原始数据，按小时展示
@@ -511,16 +897,24 @@ class UsageService:
                 IoTData.meter_id.in_(queryable_meter_ids),
                 IoTData.collect_time >= start_date,
                 IoTData.collect_time <= end_date
-            ).order_by(IoTData.collect_time.desc())
+            )
             
-            pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+            if cursor is not None:
+                # 游标分页：沿(meter_id, collect_time)索引定位，深翻页代价与第一页相同
+                items, page_info = keyset_paginate(
+                    query, IoTData.collect_time, IoTData.id, cursor, per_page, with_total
+                )
+                total_records = page_info["total"]
+            else:
+                pagination = query.order_by(IoTData.collect_time.desc()).paginate(page=page, per_page=per_page, error_out=False)
+                items = pagination.items
+                total_records = pagination.total
             
             data_list = []
-            for record in pagination.items:
-                meter = Meter.query.get(record.meter_id)
+            for record in items:
                 data_list.append({
                     "meter_id": record.meter_id,
-                    "meter_code": meter.meter_code if meter else "未知",
+                    "meter_code": meter.meter_code,
                     "reading": record.electricity,
                     "voltage": record.voltage,
                     "current": record.current,
@@ -529,14 +923,16 @@ class UsageService:
                 })
             
             # 计算统计数据
-            total_records = pagination.total
-            if pagination.items:
-                first_reading = min(item.electricity for item in pagination.items)
-                last_reading = max(item.electricity for item in pagination.items)
+            if items:
+                first_reading = min(item.electricity for item in items)
+                last_reading = max(item.electricity for item in items)
                 total_electricity = last_reading - first_reading
             else:
                 total_electricity = 0
             
+        elif cursor is not None:
+            raise BusinessException("游标分页仅支持hour格式", 400)
+        
         elif format_type == "day":
             # 查询UsageData日汇总数据
             query = UsageData.query.filter(
@@ -551,10 +947,9 @@ class UsageService:
             data_list = []
             total_electricity = 0
             for record in pagination.items:
-                meter = Meter.query.get(record.meter_id)
                 data_list.append({
                     "meter_id": record.meter_id,
-                    "meter_code": meter.meter_code if meter else "未知",
+                    "meter_code": meter.meter_code,
                     "usage_date": record.usage_time.strftime("%Y-%m-%d"),
                     "total_electricity": round(record.total_electricity, 2),
                     "peak_electricity": round(record.peak_electricity, 2) if record.peak_electricity else 0,
@@ -579,10 +974,9 @@ class UsageService:
             data_list = []
             total_electricity = 0
             for record in pagination.items:
-                meter = Meter.query.get(record.meter_id)
                 data_list.append({
                     "meter_id": record.meter_id,
-                    "meter_code": meter.meter_code if meter else "未知",
+                    "meter_code": meter.meter_code,
                     "usage_month": record.usage_time.strftime("%Y-%m"),
                     "total_electricity": round(record.total_electricity, 2),
                     "peak_electricity": round(record.peak_electricity, 2) if record.peak_electricity else 0,
@@ -607,9 +1001,9 @@ class UsageService:
             "summary": {
                 "total_records": total_records,
                 "total_electricity": round(total_electricity, 2),
-                "avg_electricity": round(total_electricity / total_records, 2) if total_records > 0 else 0
+                "avg_electricity": round(total_electricity / total_records, 2) if total_records else 0
             },
-            "pagination": {
+            "pagination": page_info if cursor is not None else {
                 "total": pagination.total,
                 "page": pagination.page,
                 "per_page": pagination.per_page,
@@ -1,11 +1,11 @@
 #用户业务（权限校验、电表绑定逻辑）
 from ..models import User,Role,RoleEnum,UserStatus,Region,Meter,Bill,BillStatus
 from app import db
-from ..middleware import BusinessException,create_log,LogType,LogLevel,generate_user_token
+from ..middleware import BusinessException,create_log,LogType,LogLevel,generate_user_token,hash_token,PrincipalCache
 from flask import session,current_app,g
 from app.utils import verify_jwt
+from ..utils.redis_util import revoke_user_tokens, is_token_revoked
 from dotenv import load_dotenv
-import os
 import time
 
 load_dotenv()
@@ -124,8 +124,9 @@ class UserServices:
             )
             raise BusinessException("密码错误",401)
         
-        token=generate_user_token(login_user.id,2)      #token有效时间两小时
-        refresh_token=generate_user_token(login_user.id,10)         #9小时过期，用于刷新token
+        claims=PrincipalCache.claims(login_user)         #角色、片区等身份声明写入token，鉴权时无需查库
+        token=generate_user_token(login_user.id,2,claims)      #token有效时间两小时
+        refresh_token=generate_user_token(login_user.id,10,token_type="refresh")         #10小时过期，只能用于刷新token
 
         return {
             "token":token,
@@ -142,13 +143,21 @@ class UserServices:
     #刷新token
     @staticmethod
     def refresh_token(refresh_token):
-        payload=verify_jwt(refresh_token,os.getenv("REFRESH_TOKEN_SECRET_KEY","default_REFRESH_TOKEN_SECRET_KEY"))      #refresh_token有效
+        payload=verify_jwt(refresh_token,current_app.config.get("SECRET_KEY","default-secret-key"))      #refresh_token有效
+        if payload.get("typ")!="refresh":           #访问token不能用来刷新
+            raise BusinessException("refresh_token无效",401)
+        if is_token_revoked(hash_token(refresh_token),payload):        #已登出或修改密码
+            raise BusinessException("refresh_token已失效，请重新登录",401)
         exp_time=payload.get("exp")
         current_time=int(time.time())
+        new_refresh_token=refresh_token
         if 0<exp_time-current_time<7200:            #如果refresh_token马上过期
-            new_refresh_token=generate_user_token(payload.get("sub"),expire_hours=9)        #刷新refresh_token
-        #刷新token
-        token=generate_user_token(payload.get("sub"),expire_hours=2)
+            new_refresh_token=generate_user_token(payload.get("sub"),expire_hours=9,token_type="refresh")        #刷新refresh_token
+        #刷新token（按用户当前信息重新生成身份声明）
+        user=db.session.query(User).get(int(payload.get("sub")))
+        if user is None:
+            raise BusinessException("用户不存在",404)
+        token=generate_user_token(payload.get("sub"),expire_hours=2,claims=PrincipalCache.claims(user))
         return {
             "token":token,
             "refresh_token":new_refresh_token
@@ -218,9 +227,11 @@ class UserServices:
             user.idcard = idcard
         
         # 只在提供了 region_id 时才验证
+        region_changed = False
         if region_id is not None:
             if not db.session.query(Region).filter_by(id=region_id).first():
                 raise BusinessException("片区id不存在！")
+            region_changed = user.region_id != region_id
             user.region_id = region_id
         
         # 更新真实姓名
@@ -241,6 +252,9 @@ class UserServices:
                 log_level=LogLevel.ERROR
             )
             raise BusinessException("用户修改个人信息失败",500)
+        
+        if region_changed:
+            PrincipalCache.invalidate()
 
         return {
             "user_id": user.id,
@@ -435,6 +449,7 @@ class UserServices:
         
         try:
             db.session.commit()
+            revoke_user_tokens(user_id)         #此前签发的token全部失效
             
             create_log(
                 operator_id=user_id,
@@ -483,6 +498,7 @@ class UserServices:
 
         try:
             db.session.commit()
+            PrincipalCache.invalidate()
             
             create_log(
                 operator_id=g.user_id,
@@ -614,6 +630,7 @@ class UserServices:
         
         try:
             db.session.commit()
+            revoke_user_tokens(user.id)         #此前签发的token全部失效
             
             create_log(
                 operator_id=user.id,
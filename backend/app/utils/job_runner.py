@@ -0,0 +1,223 @@
+# 批处理任务执行器（按电表分块、多进程并行、断点续跑）
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+import multiprocessing
+import hashlib
+import json
+import os
+
+# 工作进程内的应用实例（每个进程只创建一次）
+_worker_app = None
+
+
+def _aggregate_usage_handler(meter_ids, usage_type, target_date=None, set_based=True):
+    from ..services import UsageService
+    return UsageService.batch_aggregate_all_meters(
+        usage_type, target_date, set_based=set_based, meter_ids=meter_ids
+    )
+
+
+def _backfill_hourly_handler(meter_ids, start_time, end_time):
+    from ..services.hourly_rollup import HourlyRollup
+    return HourlyRollup.backfill(meter_ids, start_time, end_time)
+
+
+def _overdue_bills_handler(meter_ids, set_based=True):
+    from ..services import BillServices
+    return BillServices.update_overdue_bills(meter_ids=meter_ids, set_based=set_based)
+
+
+def _create_bills_handler(meter_ids, bill_month):
+    from ..services import BillServices
+    return BillServices.batch_create_bills(bill_month, meter_ids=meter_ids)
+
+
+# 任务名 -> 分块处理函数，处理函数签名为 handler(meter_ids, **params)
+JOB_HANDLERS = {
+    "usage_aggregate": _aggregate_usage_handler,
+    "usage_hourly_backfill": _backfill_hourly_handler,
+    "bill_overdue": _overdue_bills_handler,
+    "bill_create": _create_bills_handler,
+}
+
+
+def _get_worker_app():
+    """获取工作进程的应用实例，每个进程独立的应用上下文和数据库连接池"""
+    global _worker_app
+    if _worker_app is None:
+        from app import create_app
+        _worker_app = create_app()
+    return _worker_app
+
+
+def _run_chunk(job_name, chunk_index, meter_ids, params):
+    """
+    执行单个分块（在工作进程中运行）
+    :return: (chunk_index, 处理结果)
+    """
+    from app import db
+    from ..middleware.log_writer import log_writer
+
+    app = _get_worker_app()
+    with app.app_context():
+        try:
+            return chunk_index, JOB_HANDLERS[job_name](meter_ids, **params)
+        finally:
+            db.session.remove()
+            # 工作进程退出时不会执行atexit，分块结束前写完本分块产生的日志
+            log_writer.flush()
+
+
+def _summarize(result):
+    """提取分块结果中的数值统计项，便于跨分块累加"""
+    if not isinstance(result, dict):
+        return {}
+    source = result.get("summary") if isinstance(result.get("summary"), dict) else result
+    return {
+        key: value for key, value in source.items()
+        if isinstance(value, (int, float)) and not isinstance(value, bool)
+    }
+
+
+class ChunkedJobRunner:
+    """
+    分块任务执行器：
+    1. 将电表ID排序后按固定大小切分为若干分块
+    2. 分块提交到进程池，每个工作进程有独立的应用上下文和数据库会话
+    3. 每完成一个分块就写入检查点文件，任务中断后可从检查点继续，已完成的分块不会重复执行
+    """
+
+    def __init__(self, job_name, params=None, workers=4, chunk_size=1000, checkpoint_dir=None, progress=None):
+        """
+        :param job_name: 任务名，必须在JOB_HANDLERS中注册
+        :param params: 传给处理函数的参数（需可序列化）
+        :param workers: 工作进程数，为1时在当前进程内顺序执行
+        :param chunk_size: 每个分块的电表数量
+        :param checkpoint_dir: 检查点目录，默认使用应用instance目录下的jobs
+        :param progress: 进度回调 progress(完成分块数, 总分块数, chunk_index, error)
+        """
+        if job_name not in JOB_HANDLERS:
+            raise ValueError(f"未注册的任务：{job_name}")
+        self.job_name = job_name
+        self.params = params or {}
+        self.workers = max(1, workers)
+        self.chunk_size = max(1, chunk_size)
+        self.progress = progress
+        if checkpoint_dir is None:
+            from flask import current_app
+            checkpoint_dir = os.path.join(current_app.instance_path, "jobs")
+        self.checkpoint_dir = checkpoint_dir
+
+    def _job_key(self):
+        raw = json.dumps(self.params, sort_keys=True, default=str)
+        return f"{self.job_name}-{hashlib.md5(raw.encode('utf-8')).hexdigest()[:12]}"
+
+    def _checkpoint_path(self):
+        return os.path.join(self.checkpoint_dir, f"{self._job_key()}.json")
+
+    def _load_checkpoint(self, fingerprint):
+        path = self._checkpoint_path()
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+        except (OSError, ValueError):
+            return None
+        # 电表集合或分块大小变化后，旧检查点不再适用
+        if checkpoint.get("fingerprint") != fingerprint or checkpoint.get("chunk_size") != self.chunk_size:
+            return None
+        return checkpoint
+
+    def _save_checkpoint(self, checkpoint):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        path = self._checkpoint_path()
+        tmp_path = f"{path}.tmp"
+        checkpoint["update_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f, ensure_ascii=False, default=str)
+        os.replace(tmp_path, path)
+
+    def run(self, meter_ids, resume=True):
+        """
+        执行任务
+        :param meter_ids: 需要处理的电表ID列表
+        :param resume: 是否从检查点继续
+        :return: 执行结果（分块统计、累加后的处理统计、失败分块）
+        """
+        meter_ids = sorted(set(meter_ids))
+        chunks = [meter_ids[i:i + self.chunk_size] for i in range(0, len(meter_ids), self.chunk_size)]
+        fingerprint = hashlib.md5(",".join(map(str, meter_ids)).encode("utf-8")).hexdigest()
+
+        checkpoint = self._load_checkpoint(fingerprint) if resume else None
+        if checkpoint is None:
+            checkpoint = {
+                "job_name": self.job_name,
+                "params": self.params,
+                "fingerprint": fingerprint,
+                "chunk_size": self.chunk_size,
+                "total_chunks": len(chunks),
+                "completed_chunks": [],
+                "failed_chunks": {},
+                "totals": {}
+            }
+        completed = set(checkpoint["completed_chunks"])
+        pending = [index for index in range(len(chunks)) if index not in completed]
+        skipped = len(completed)
+        checkpoint["failed_chunks"] = {}
+        self._save_checkpoint(checkpoint)
+
+        def on_done(chunk_index, result=None, error=None):
+            if error is None:
+                checkpoint["completed_chunks"].append(chunk_index)
+                for key, value in _summarize(result).items():
+                    checkpoint["totals"][key] = checkpoint["totals"].get(key, 0) + value
+            else:
+                checkpoint["failed_chunks"][str(chunk_index)] = error
+            self._save_checkpoint(checkpoint)
+            if self.progress:
+                done = len(checkpoint["completed_chunks"]) + len(checkpoint["failed_chunks"])
+                self.progress(done, len(chunks), chunk_index, error)
+
+        if self.workers == 1:
+            for index in pending:
+                try:
+                    on_done(index, result=JOB_HANDLERS[self.job_name](chunks[index], **self.params))
+                except Exception as e:
+                    on_done(index, error=str(e))
+        elif pending:
+            # 使用spawn启动工作进程，避免继承父进程的数据库连接
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn")
+            ) as executor:
+                futures = {
+                    executor.submit(_run_chunk, self.job_name, index, chunks[index], self.params): index
+                    for index in pending
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        _, result = future.result()
+                        on_done(index, result=result)
+                    except Exception as e:
+                        on_done(index, error=str(e))
+
+        failed_chunks = checkpoint["failed_chunks"]
+        if not failed_chunks:
+            # 全部完成后清理检查点，下次执行重新开始
+            os.remove(self._checkpoint_path())
+
+        return {
+            "success": not failed_chunks,
+            "job_name": self.job_name,
+            "total_meters": len(meter_ids),
+            "total_chunks": len(chunks),
+            "completed_chunks": len(checkpoint["completed_chunks"]),
+            "skipped_chunks": skipped,
+            "failed_chunks": [
+                {"chunk": int(index), "meter_ids": [chunks[int(index)][0], chunks[int(index)][-1]], "error": error}
+                for index, error in sorted(failed_chunks.items(), key=lambda item: int(item[0]))
+            ],
+            "totals": checkpoint["totals"]
+        }
@@ -0,0 +1,74 @@
+# 游标分页工具（按(时间, ID)定位下一页，翻页深度不影响查询代价）
+from ..middleware import BusinessException
+from sqlalchemy import or_, and_
+from datetime import datetime
+import base64
+import json
+
+
+def encode_cursor(sort_value, row_id):
+    """
+    生成游标（对客户端不透明）
+    :param sort_value: 本页最后一行的排序时间
+    :param row_id: 本页最后一行的ID
+    :return: 游标字符串
+    """
+    payload = json.dumps([sort_value.isoformat(), row_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """
+    解析游标
+    :param cursor: 游标字符串
+    :return: (sort_value, row_id)
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(sort_value), int(row_id)
+    except Exception:
+        raise BusinessException("无效的分页游标", 400)
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=20, with_total=False, key=None):
+    """
+    游标分页（按排序时间、ID倒序）：
+    1. 下一页条件为 (sort, id) < 游标位置，可直接沿(过滤列, 排序时间)索引定位，不使用OFFSET
+    2. 多取一行判断是否有下一页，默认不执行COUNT(*)
+    :param query: 已加好过滤条件、尚未排序的查询
+    :param sort_column: 排序时间列
+    :param id_column: 主键列（排序时间相同时的次序）
+    :param cursor: 上一页返回的next_cursor，为空表示第一页
+    :param per_page: 每页数量
+    :param with_total: 是否统计总数（需要额外执行一次COUNT）
+    :param key: 从结果行中取(排序时间, ID)的函数，默认按列名从行对象上读取
+    :return: (本页结果列表, 分页信息)
+    """
+    if key is None:
+        key = lambda item: (getattr(item, sort_column.key), getattr(item, id_column.key))
+
+    total = query.order_by(None).count() if with_total else None
+
+    if cursor:
+        sort_value, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            sort_column < sort_value,
+            and_(sort_column == sort_value, id_column < row_id)
+        ))
+
+    items = query.order_by(sort_column.desc(), id_column.desc()).limit(per_page + 1).all()
+    has_next = len(items) > per_page
+    items = items[:per_page]
+
+    next_cursor = None
+    if has_next:
+        next_cursor = encode_cursor(*key(items[-1]))
+
+    return items, {
+        "mode": "cursor",
+        "per_page": per_page,
+        "next_cursor": next_cursor,
+        "has_next": has_next,
+        "total": total
+    }
@@ -0,0 +1,63 @@
+# SQL查询计数工具（检查列表接口是否出现逐行查询的N+1问题）
+from contextlib import contextmanager
+from sqlalchemy import event
+import threading
+
+
+class QueryCounter:
+    """记录当前线程执行的SQL语句"""
+
+    def __init__(self):
+        self.statements = []
+        self._thread_id = threading.get_ident()
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        # 引擎事件对所有线程生效，只记录发起计数的线程
+        if threading.get_ident() == self._thread_id:
+            self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    统计代码块内执行的SQL语句数量
+    :param engine: 数据库引擎，默认使用当前应用的db.engine（需要应用上下文）
+    :return: QueryCounter
+
+    用法：
+        with count_queries() as counter:
+            client.get("/api/v1/bill/query?per_page=50", headers=headers)
+        print(counter.count, counter.statements)
+    """
+    if engine is None:
+        from app import db
+        engine = db.engine
+
+    counter = QueryCounter()
+    event.listen(engine, "before_cursor_execute", counter._before_cursor_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, "before_cursor_execute", counter._before_cursor_execute)
+
+
+@contextmanager
+def assert_max_queries(limit, engine=None):
+    """
+    断言代码块内执行的SQL语句不超过limit条，超出时抛出AssertionError并列出所有语句
+    :param limit: 允许的最大语句数
+    :param engine: 数据库引擎（可选）
+
+    用法（列表接口的查询数应与每页条数无关）：
+        with assert_max_queries(5):
+            client.get("/api/v1/usage/query?meter_id=1&per_page=100", headers=headers)
+    """
+    with count_queries(engine) as counter:
+        yield counter
+    if counter.count > limit:
+        statements = "\n".join(f"{index}. {statement}" for index, statement in enumerate(counter.statements, start=1))
+        raise AssertionError(f"执行了{counter.count}条SQL语句，超过上限{limit}条：\n{statements}")
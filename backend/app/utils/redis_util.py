@@ -3,6 +3,8 @@ import redis
 from flask import current_app
 import random
 import string
+import json
+from datetime import datetime
 
 class RedisClient:
     """Redis客户端封装"""
@@ -29,6 +31,8 @@ class RedisClient:
             app.logger.info("Redis连接成功")
         except Exception as e:
             app.logger.warning(f"Redis连接失败，将使用内存缓存: {str(e)}")
+            if not app.config.get("TOKEN_REVOCATION_FAIL_CLOSED", False):
+                app.logger.warning("没有共享缓存时token撤销记录只在当前进程生效，多进程部署时其他进程仍接受已撤销的token")
             self._client = None
     
     @property
@@ -108,6 +112,38 @@ def delete_cache(key: str):
         current_app.logger.error(f"删除缓存失败: {str(e)}")
 
 
+def get_cache_version(name: str) -> int:
+    """
+    获取缓存版本号（用于跨进程失效进程内缓存）
+    :param name: 缓存名称
+    :return: 版本号，不存在时为0
+    """
+    value = get_cache(f"cache_version:{name}")
+    try:
+        return int(value) if value is not None else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+def bump_cache_version(name: str) -> int:
+    """
+    递增缓存版本号，使所有进程中该缓存的本地副本失效
+    :param name: 缓存名称
+    :return: 新版本号
+    """
+    key = f"cache_version:{name}"
+    client = get_redis_client()
+    try:
+        if client:
+            return int(client.incr(key))
+    except Exception as e:
+        current_app.logger.error(f"递增缓存版本失败: {str(e)}")
+    # 内存缓存：版本号不过期
+    version = get_cache_version(name) + 1
+    _memory_cache[key] = (str(version), float("inf"))
+    return version
+
+
 def generate_verification_code(length: int = 6) -> str:
     """
     生成验证码
@@ -147,3 +183,130 @@ def verify_code(email: str, code: str) -> bool:
         return True
     
     return False
+
+
+# 用户级撤销记录的保留时间（不短于最长的token有效期）
+TOKEN_MAX_LIFETIME = 10 * 3600
+
+
+def revoke_token(token_hash: str, exp: int):
+    """
+    撤销单个token（登出），记录保留到token过期
+    :param token_hash: token的SHA-256摘要
+    :param exp: token过期时间戳
+    """
+    import time
+    expire = int(exp - time.time())
+    if expire > 0:
+        set_cache(f"revoked_token:{token_hash}", "1", expire)
+
+
+def revoke_user_tokens(user_id: int):
+    """
+    撤销用户此前签发的所有token（修改/重置密码）
+    :param user_id: 用户ID
+    """
+    import time
+    set_cache(f"token_revoked_before:{user_id}", str(int(time.time())), TOKEN_MAX_LIFETIME)
+
+
+def is_token_revoked(token_hash: str, payload: dict) -> bool:
+    """
+    判断token是否已被撤销（一次读取token和用户两条撤销记录）
+    读取撤销记录失败，或Redis不可用（内存缓存只保存本进程写入的撤销记录，无法得知其他进程的登出、改密）时，
+    本进程没有撤销记录的token由TOKEN_REVOCATION_FAIL_CLOSED决定：
+    默认False（放行，缓存故障时不影响登录用户，但已登出的token在故障期间仍可使用）；
+    为True时视为已撤销（拒绝请求，缓存故障期间所有用户需等待恢复）
+    :param token_hash: token的SHA-256摘要
+    :param payload: token载荷
+    :return: 是否已撤销
+    """
+    keys = [f"revoked_token:{token_hash}", f"token_revoked_before:{payload.get('sub')}"]
+    fail_closed = bool(current_app.config.get("TOKEN_REVOCATION_FAIL_CLOSED", False))
+    client = get_redis_client()
+    try:
+        values = client.mget(keys) if client else [get_cache(key) for key in keys]
+    except Exception as e:
+        current_app.logger.error(f"获取token撤销记录失败: {str(e)}")
+        return fail_closed
+    
+    if values[0] is not None:
+        return True
+    try:
+        if values[1] is not None and int(payload.get("iat", 0)) < int(values[1]):
+            return True
+    except (TypeError, ValueError):
+        pass
+    # 没有共享缓存时，本进程查不到撤销记录不代表其他进程没有撤销，按缓存故障处理
+    return fail_closed if client is None else False
+
+
+
+def get_meter_reading_state(meter_id: int):
+    """
+    获取电表读数滚动状态（最近10条读数）
+    :param meter_id: 电表ID
+    :return: [(collect_time, electricity)]，按采集时间倒序；未缓存返回None
+    """
+    return _load_reading_state(get_cache(f"meter_reading_state:{meter_id}"))
+
+
+def get_meter_reading_states(meter_ids) -> dict:
+    """
+    批量获取多个电表的读数滚动状态
+    :param meter_ids: 电表ID列表
+    :return: {meter_id: [(collect_time, electricity)]}，未缓存的电表不在结果中
+    """
+    meter_ids = list(meter_ids)
+    if not meter_ids:
+        return {}
+    
+    keys = [f"meter_reading_state:{meter_id}" for meter_id in meter_ids]
+    client = get_redis_client()
+    try:
+        values = client.mget(keys) if client else [get_cache(key) for key in keys]
+    except Exception as e:
+        current_app.logger.error(f"批量获取缓存失败: {str(e)}")
+        values = [None] * len(keys)
+    
+    states = {}
+    for meter_id, value in zip(meter_ids, values):
+        state = _load_reading_state(value)
+        if state is not None:
+            states[meter_id] = state
+    return states
+
+
+def save_meter_reading_state(meter_id: int, history, expire: int = 86400):
+    """
+    保存电表读数滚动状态
+    :param meter_id: 电表ID
+    :param history: [(collect_time, electricity)]，按采集时间倒序
+    :param expire: 过期时间（秒），默认1天
+    """
+    value = json.dumps([
+        [collect_time.strftime("%Y-%m-%d %H:%M:%S.%f"), electricity]
+        for collect_time, electricity in history[:10]
+    ])
+    set_cache(f"meter_reading_state:{meter_id}", value, expire)
+
+
+def delete_meter_reading_state(meter_id: int):
+    """
+    删除电表读数滚动状态（状态与数据库不一致时调用，下次校验时从数据库重建）
+    :param meter_id: 电表ID
+    """
+    delete_cache(f"meter_reading_state:{meter_id}")
+
+
+def _load_reading_state(value):
+    """反序列化电表读数滚动状态"""
+    if value is None:
+        return None
+    try:
+        return [
+            (datetime.strptime(collect_time, "%Y-%m-%d %H:%M:%S.%f"), electricity)
+            for collect_time, electricity in json.loads(value)
+        ]
+    except (ValueError, TypeError):
+        return None
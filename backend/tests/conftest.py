@@ -0,0 +1,30 @@
+# 测试公共配置
+import os
+import sys
+import pytest
+
+# 从backend目录之外运行pytest时也能导入app
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope="session")
+def app():
+    """
+    测试应用（FLASK_ENV=test，使用test配置中的测试数据库）：
+    会话开始时建表，结束时删表，测试数据库不要与开发库共用
+    """
+    os.environ["FLASK_ENV"] = "test"
+    from app import create_app, db
+
+    flask_app = create_app()
+    flask_app.config["TESTING"] = True
+    with flask_app.app_context():
+        db.create_all()
+        yield flask_app
+        db.session.remove()
+        db.drop_all()
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    return app.test_client()
@@ -0,0 +1,217 @@
+# 向量化计费内核与逐段计费参考实现的一致性测试（纯内存，不访问数据库）
+from app.models import PriceType, TimePeriod, LadderLevel
+from app.services.bill_service import BillServices
+from app.services.pricing_kernel import PricingKernel, READING_DTYPE
+from app.services.tariff import CompiledTariff
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+import numpy as np
+import pytest
+
+MONTH_START = datetime(2025, 3, 1)
+MONTH_END = datetime(2025, 4, 1)
+
+
+def _time_rules():
+    """分时规则：时段边界为0、8、12、18、22点"""
+    return [
+        SimpleNamespace(time_period=TimePeriod.valley, start_hour=0, end_hour=8, ratio=0.5),
+        SimpleNamespace(time_period=TimePeriod.peak, start_hour=8, end_hour=12, ratio=1.5),
+        SimpleNamespace(time_period=TimePeriod.flat, start_hour=12, end_hour=18, ratio=1.0),
+        SimpleNamespace(time_period=TimePeriod.peak, start_hour=18, end_hour=22, ratio=1.5),
+        SimpleNamespace(time_period=TimePeriod.valley, start_hour=22, end_hour=24, ratio=0.5),
+    ]
+
+
+def _ladder_rules():
+    """阶梯规则：断点为100、200度（按下限排序）"""
+    return [
+        SimpleNamespace(ladder_level=LadderLevel.low, min_electricity=0, max_electricity=100, ratio=1.0),
+        SimpleNamespace(ladder_level=LadderLevel.middle, min_electricity=100, max_electricity=200, ratio=1.2),
+        SimpleNamespace(ladder_level=LadderLevel.high, min_electricity=200, max_electricity=None, ratio=1.5),
+    ]
+
+
+def _tariffs(*policies):
+    """
+    编译政策
+    :param policies: (policy_id, price_type, start_time, end_time, base_unit_price)
+    """
+    policy_objects = []
+    rules_cache = {}
+    for policy_id, price_type, start_time, end_time, base_price in policies:
+        policy_objects.append(SimpleNamespace(
+            id=policy_id, price_type=price_type, base_unit_price=base_price,
+            start_time=start_time, end_time=end_time
+        ))
+        rules_cache[policy_id] = (_time_rules(), _ladder_rules())
+    return CompiledTariff.compile_policies(policy_objects, MONTH_START, MONTH_END, rules_cache)
+
+
+def _hourly_readings(start=MONTH_START, end=MONTH_END):
+    """整月逐小时读数，每小时用电量在0.5~2.3度之间变化，月累计超过两个阶梯断点"""
+    readings = []
+    value = 1000.0
+    current = start
+    index = 0
+    while current < end:
+        readings.append((current, value))
+        value += 0.5 + (index % 7) * 0.3
+        current += timedelta(hours=1)
+        index += 1
+    readings.append((end, value))
+    return readings
+
+
+def _buckets(details):
+    """按BillDetail写入时的精度取整后的账单详情"""
+    return [
+        (
+            detail["policy_id"], detail["detail_type"], detail["time_period"], detail["ladder_level"],
+            round(detail["electricity"], 2), round(detail["unit_price"], 4), round(detail["amount"], 2)
+        )
+        for detail in details
+    ]
+
+
+def _assert_parity(readings, tariffs):
+    """内核与参考实现的总金额、账单详情完全一致"""
+    collect_times = np.array([collect_time for collect_time, _ in readings], dtype="datetime64[us]")
+    electricity = np.array([value for _, value in readings], dtype=np.float64)
+
+    kernel_amount, kernel_details = PricingKernel.price(collect_times, electricity, PricingKernel.prepare(tariffs))
+    reference_amount, reference_details = BillServices._price_readings(
+        list(zip(collect_times.tolist(), electricity.tolist())), tariffs
+    )
+
+    assert kernel_amount == reference_amount
+    assert kernel_details == reference_details
+    assert _buckets(kernel_details) == _buckets(reference_details)
+    assert round(kernel_amount, 2) == round(reference_amount, 2)
+    return kernel_amount, kernel_details
+
+
+@pytest.mark.parametrize("price_type", [PriceType.ladder, PriceType.time_share, PriceType.combined])
+def test_single_policy(price_type):
+    tariffs = _tariffs((1, price_type, datetime(2025, 1, 1), None, 0.5))
+    total_amount, details = _assert_parity(_hourly_readings(), tariffs)
+
+    assert total_amount > 0
+    levels = {detail["ladder_level"] for detail in details}
+    periods = {detail["time_period"] for detail in details}
+    if price_type == PriceType.time_share:
+        assert levels == {None}
+        assert periods == {TimePeriod.peak, TimePeriod.flat, TimePeriod.valley}
+    elif price_type == PriceType.ladder:
+        assert periods == {None}
+        assert levels == {LadderLevel.low, LadderLevel.middle, LadderLevel.high}
+    else:
+        assert TimePeriod.peak in periods and LadderLevel.high in levels
+
+
+def test_mid_month_policy_change():
+    change_time = datetime(2025, 3, 15, 12)
+    tariffs = _tariffs(
+        (1, PriceType.ladder, datetime(2025, 1, 1), change_time, 0.5),
+        (2, PriceType.combined, change_time, None, 0.6),
+    )
+    _, details = _assert_parity(_hourly_readings(), tariffs)
+
+    assert {detail["policy_id"] for detail in details} == {1, 2}
+
+
+def test_overlapping_policies_use_first_match():
+    tariffs = _tariffs(
+        (1, PriceType.time_share, datetime(2025, 3, 10), datetime(2025, 3, 20), 0.4),
+        (2, PriceType.combined, datetime(2025, 1, 1), None, 0.6),
+    )
+    _assert_parity(_hourly_readings(), tariffs)
+
+
+def test_readings_on_ladder_breakpoint_and_period_boundary():
+    # 累计用电量恰好等于100、200度，采集时间恰好在8、12、18、22点
+    readings = [
+        (datetime(2025, 3, 1, 0), 0.0),
+        (datetime(2025, 3, 1, 8), 60.0),
+        (datetime(2025, 3, 1, 12), 100.0),
+        (datetime(2025, 3, 1, 18), 150.0),
+        (datetime(2025, 3, 1, 22), 200.0),
+        (datetime(2025, 3, 2, 0), 260.0),
+        (datetime(2025, 3, 2, 8), 300.0),
+    ]
+    for price_type in (PriceType.ladder, PriceType.time_share, PriceType.combined):
+        _assert_parity(readings, _tariffs((1, price_type, datetime(2025, 1, 1), None, 0.5)))
+
+
+def test_non_increasing_readings_are_skipped():
+    readings = [
+        (datetime(2025, 3, 1, 0), 10.0),
+        (datetime(2025, 3, 1, 1), 12.5),
+        (datetime(2025, 3, 1, 2), 12.5),
+        (datetime(2025, 3, 1, 3), 3.0),
+        (datetime(2025, 3, 1, 4), 8.0),
+    ]
+    _assert_parity(readings, _tariffs((1, PriceType.combined, datetime(2025, 1, 1), None, 0.5)))
+
+
+def test_intervals_without_policy():
+    # 政策只覆盖5日~12日和20日之后，其余时段不计费
+    tariffs = _tariffs(
+        (1, PriceType.combined, datetime(2025, 3, 5), datetime(2025, 3, 12), 0.5),
+        (2, PriceType.ladder, datetime(2025, 3, 20), None, 0.6),
+    )
+    total_amount, details = _assert_parity(_hourly_readings(), tariffs)
+
+    priced = sum(detail["electricity"] for detail in details)
+    readings = _hourly_readings()
+    assert 0 < priced < readings[-1][1] - readings[0][1]
+    assert total_amount > 0
+
+
+def test_no_policy_covers_month():
+    tariffs = _tariffs((1, PriceType.combined, datetime(2025, 1, 1), datetime(2025, 2, 1), 0.5))
+    assert _assert_parity(_hourly_readings(), tariffs) == (0.0, [])
+    assert _assert_parity(_hourly_readings(), []) == (0.0, [])
+
+
+def test_price_region_matches_reference():
+    change_time = datetime(2025, 3, 15, 12)
+    tariffs_by_meter = {
+        1: _tariffs((1, PriceType.ladder, datetime(2025, 1, 1), None, 0.5)),
+        2: _tariffs(
+            (2, PriceType.time_share, datetime(2025, 1, 1), change_time, 0.5),
+            (3, PriceType.combined, change_time, None, 0.6),
+        ),
+        3: _tariffs((4, PriceType.combined, datetime(2025, 3, 5), datetime(2025, 3, 12), 0.5)),
+    }
+    readings_by_meter = {
+        1: _hourly_readings(),
+        2: _hourly_readings(),
+        3: _hourly_readings(datetime(2025, 3, 3), datetime(2025, 3, 25)),
+        4: _hourly_readings(datetime(2025, 3, 1), datetime(2025, 3, 2)),   # 没有适用政策的电表
+    }
+
+    readings = np.array(
+        [
+            (meter_id, np.datetime64(collect_time, "us"), value)
+            for meter_id in sorted(readings_by_meter)
+            for collect_time, value in readings_by_meter[meter_id]
+        ],
+        dtype=READING_DTYPE
+    )
+    results = PricingKernel.price_region(
+        readings, {meter_id: PricingKernel.prepare(tariffs) for meter_id, tariffs in tariffs_by_meter.items()}
+    )
+
+    assert sorted(results) == sorted(readings_by_meter)
+    for meter_id, meter_readings in readings_by_meter.items():
+        reference_amount, reference_details = BillServices._price_readings(
+            meter_readings, tariffs_by_meter.get(meter_id, [])
+        )
+        result = results[meter_id]
+        assert result["total_amount"] == reference_amount
+        assert result["details"] == reference_details
+        assert _buckets(result["details"]) == _buckets(reference_details)
+        assert result["first_reading"] == meter_readings[0][1]
+        assert result["last_reading"] == meter_readings[-1][1]
+        assert result["data_points"] == len(meter_readings)
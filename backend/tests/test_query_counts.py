@@ -0,0 +1,95 @@
+# 列表接口查询数测试：SQL语句数应与每页条数无关（防止逐行查询的N+1问题）
+from app.models import (
+    db, User, Role, RoleEnum, UserStatus, Region, Meter, Bill, BillStatus, UsageData, UsageType
+)
+from app.middleware.auth import generate_user_token
+from app.middleware.principal import PrincipalCache
+from app.utils.query_counter import assert_max_queries
+from datetime import datetime, timedelta
+import pytest
+
+# 每个列表接口允许的最大语句数
+MAX_QUERIES = 10
+
+# 数据行数大于较大的每页条数，两种每页条数都能取满一页
+ROW_COUNT = 30
+SMALL_PAGE = 5
+LARGE_PAGE = 25
+
+
+@pytest.fixture(scope="module")
+def seed(app):
+    """写入片区、用户、电表、账单、用电汇总，返回超级管理员的认证头和有用电汇总的电表ID"""
+    for role_name in RoleEnum:
+        db.session.add(Role(name=role_name, desc=role_name.value))
+    region = Region(region_code="901", region_name="查询数测试片区")
+    db.session.add(region)
+    db.session.flush()
+    roles = {role.name: role for role in Role.query.all()}
+
+    admin = User(
+        mail="admin@query-count.test", real_name="管理员", region_id=region.id,
+        role_id=roles[RoleEnum.SUPER_ADMIN].id, status=UserStatus.NORMAL
+    )
+    admin.password = "123456"
+    db.session.add(admin)
+
+    bill_month = datetime(2025, 3, 1)
+    for index in range(ROW_COUNT):
+        user = User(
+            mail=f"user{index}@query-count.test", real_name=f"居民{index}", region_id=region.id,
+            role_id=roles[RoleEnum.RESIDENT].id, status=UserStatus.NORMAL
+        )
+        user.password = "123456"
+        db.session.add(user)
+        db.session.flush()
+
+        meter = Meter(
+            meter_code=f"QC{index:04d}", user_id=user.id, region_id=region.id,
+            install_address=f"测试地址{index}"
+        )
+        db.session.add(meter)
+        db.session.flush()
+
+        db.session.add(Bill(
+            user_id=user.id, meter_id=meter.id, bill_month=bill_month,
+            total_amount=10.0 + index, total_electricity=20.0 + index,
+            status=BillStatus.unpaid, due_date=bill_month + timedelta(days=45)
+        ))
+        if index == 0:
+            meter_id = meter.id
+            for day in range(ROW_COUNT):
+                db.session.add(UsageData(
+                    meter_id=meter.id, usage_type=UsageType.DAY,
+                    usage_time=bill_month + timedelta(days=day),
+                    total_electricity=5.0 + day, peak_electricity=2.0, valley_electricity=1.0
+                ))
+    db.session.commit()
+
+    token = generate_user_token(admin.id, 2, PrincipalCache.claims(admin))
+    return {"headers": {"Authorization": f"Bearer {token}"}, "meter_id": meter_id}
+
+
+@pytest.mark.parametrize("url", [
+    "/api/v1/usage/query?meter_id={meter_id}&usage_type=DAY&per_page={per_page}",
+    "/api/v1/bill/query?per_page={per_page}",
+    "/api/v1/meter/query?per_page={per_page}",
+    "/api/v1/user/list?per_page={per_page}",
+], ids=["usage", "bill", "meter", "user"])
+def test_list_query_count_independent_of_page_size(client, seed, url):
+    auth = seed["headers"]
+
+    # 预热身份、片区树等进程内缓存，只统计稳定状态下的语句数
+    response = client.get(url.format(meter_id=seed["meter_id"], per_page=SMALL_PAGE), headers=auth)
+    assert response.status_code == 200, response.get_json()
+
+    counts = []
+    for per_page in (SMALL_PAGE, LARGE_PAGE):
+        with assert_max_queries(MAX_QUERIES) as counter:
+            response = client.get(url.format(meter_id=seed["meter_id"], per_page=per_page), headers=auth)
+        assert response.status_code == 200, response.get_json()
+        assert response.get_json()["success"] is True
+        counts.append(counter.count)
+
+    assert counts[0] == counts[1], f"每页{SMALL_PAGE}条执行{counts[0]}条语句，每页{LARGE_PAGE}条执行{counts[1]}条语句"
+
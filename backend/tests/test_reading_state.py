@@ -0,0 +1,99 @@
+# 读数滚动状态缓存过期时的写入复核测试（需要FLASK_ENV=test配置的测试数据库）
+from app.models import db, Region, Meter, IoTData, UsageHourly
+from app.middleware import BusinessException
+from app.services.meter_sevice import MeterServices
+from app.services.usage_service import UsageService
+from app.utils.redis_util import get_meter_reading_state, save_meter_reading_state
+from datetime import datetime, timedelta
+from itertools import count
+import numpy as np
+import pytest
+
+_codes = count()
+T0 = datetime(2025, 3, 1, 8)
+
+
+@pytest.fixture(scope="module")
+def region(app):
+    region = Region(region_code="902", region_name="读数复核测试片区")
+    db.session.add(region)
+    db.session.commit()
+    return region.id
+
+
+@pytest.fixture
+def meter_id(region):
+    """已有两条读数（100度、120度）的电表"""
+    meter = Meter(meter_code=f"RS{next(_codes):04d}", region_id=region, install_address="测试地址")
+    db.session.add(meter)
+    db.session.commit()
+    UsageService.receive_iot_data(meter.id, 100.0, T0)
+    UsageService.receive_iot_data(meter.id, 120.0, T0 + timedelta(hours=1))
+    return meter.id
+
+
+def _stale_state(meter_id):
+    """模拟过期的缓存：缺少最近一次读数（如其他进程的内存缓存或并发批次）"""
+    save_meter_reading_state(meter_id, [(T0, 100.0)])
+
+
+def _hourly(meter_id):
+    return [row.electricity for row in UsageHourly.query.filter_by(meter_id=meter_id).all()]
+
+
+def test_single_reading_below_stored_reading_rejected_with_stale_state(meter_id):
+    _stale_state(meter_id)
+    reading_time = T0 + timedelta(hours=2)
+
+    # 缓存中的最近读数为100度，110度能通过缓存校验，但低于数据库中的120度
+    with pytest.raises(BusinessException) as error:
+        UsageService.receive_iot_data(meter_id, 110.0, reading_time)
+
+    assert error.value.code == 400
+    assert IoTData.query.filter_by(meter_id=meter_id, collect_time=reading_time).count() == 0
+    assert min(_hourly(meter_id)) >= 0
+    assert sum(_hourly(meter_id)) == pytest.approx(20.0)
+    assert get_meter_reading_state(meter_id) is None
+
+
+def test_batch_reading_below_stored_reading_rejected_with_stale_state(meter_id):
+    _stale_state(meter_id)
+
+    result = UsageService.receive_iot_batch([{
+        "meter_id": meter_id,
+        "readings": [
+            {"electricity": 110.0, "collect_time": T0 + timedelta(hours=2)},
+            {"electricity": 130.0, "collect_time": T0 + timedelta(hours=3)},
+        ]
+    }])
+
+    accepted = {item["index"]: item["accepted"] for item in result["results"]}
+    assert accepted == {0: False, 1: True}
+    assert result["accepted_count"] == 1
+    assert IoTData.query.filter_by(meter_id=meter_id).count() == 3
+    assert min(_hourly(meter_id)) >= 0
+    assert sum(_hourly(meter_id)) == pytest.approx(30.0)
+    assert get_meter_reading_state(meter_id) is None
+
+
+def test_state_kept_when_stored_reading_differs_only_in_precision(meter_id):
+    # 带微秒的采集时间和单精度无法精确表示的读数，读回后与写入值不完全相同
+    reading_time = T0 + timedelta(hours=2, microseconds=250000)
+    UsageService.receive_iot_data(meter_id, 12345.67, reading_time)
+    assert get_meter_reading_state(meter_id) is not None
+
+    UsageService.receive_iot_data(meter_id, 12346.5, T0 + timedelta(hours=3))
+    state = get_meter_reading_state(meter_id)
+    assert state is not None
+    assert state[0][1] == 12346.5
+
+
+def test_same_reading_tolerates_storage_precision():
+    cached = (datetime(2025, 3, 1, 8, 0, 0, 250000), 12345.67)
+    stored = (datetime(2025, 3, 1, 8, 0, 0), float(np.float32(12345.67)))
+
+    assert MeterServices.same_reading(cached, stored)
+    assert MeterServices.same_reading(None, None)
+    assert not MeterServices.same_reading(cached, None)
+    assert not MeterServices.same_reading(cached, (stored[0], 12340.0))
+    assert not MeterServices.same_reading(cached, (stored[0] + timedelta(hours=1), stored[1]))